@@ -1,84 +1,214 @@
-# import os
-# import sys
-# import hashlib
-# import ctypes
-# from ctypes import wintypes
-
-# # Constants for Windows API
-# PROCESS_QUERY_INFORMATION = 0x0400
-# PROCESS_VM_READ = 0x0010
-# PAGE_READWRITE = 0x04
-# MEM_COMMIT = 0x1000
-# MEMORY_BASIC_INFORMATION = ctypes.c_ulonglong * 8
-
-# # Windows API functions
-# kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
-# OpenProcess = kernel32.OpenProcess
-# VirtualQueryEx = kernel32.VirtualQueryEx
-# ReadProcessMemory = kernel32.ReadProcessMemory
-# CloseHandle = kernel32.CloseHandle
-
-# OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
-# OpenProcess.restype = wintypes.HANDLE
-# VirtualQueryEx.argtypes = [wintypes.HANDLE, wintypes.LPCVOID, ctypes.POINTER(MEMORY_BASIC_INFORMATION), ctypes.c_size_t]
-# VirtualQueryEx.restype = wintypes.SIZE
-# ReadProcessMemory.argtypes = [wintypes.HANDLE, wintypes.LPCVOID, wintypes.LPVOID, ctypes.c_size_t, ctypes.POINTER(wintypes.SIZE)]
-# ReadProcessMemory.restype = wintypes.BOOL
-# CloseHandle.argtypes = [wintypes.HANDLE]
-# CloseHandle.restype = wintypes.BOOL
-
-# def calculate_md5(file_path):
-#     """Calculate the MD5 hash of the specified file."""
-#     hash_md5 = hashlib.md5()
-#     with open(file_path, "rb") as f:
-#         for chunk in iter(lambda: f.read(4096), b""):
-#             hash_md5.update(chunk)
-#     return hash_md5.hexdigest()
-
-# def acquire_memory(process_id, output_file):
-#     """Capture the memory of a specified process."""
-#     # Open the process
-#     h_process = OpenProcess(PROCESS_QUERY_INFORMATION | PROCESS_VM_READ, False, process_id)
-#     if not h_process:
-#         print(f"Failed to open process {process_id}: {ctypes.get_last_error()}")
-#         return False
-
-#     with open(output_file, "wb") as dump_file:
-#         base_address = 0
-#         mbi = MEMORY_BASIC_INFORMATION()
-#         while True:
-#             # Query memory information
-#             if VirtualQueryEx(h_process, ctypes.c_void_p(base_address), ctypes.byref(mbi), ctypes.sizeof(mbi)) == 0:
-#                 break
-
-#             state, protect, region_size = mbi[3], mbi[4], mbi[5]
-#             if state == MEM_COMMIT and protect == PAGE_READWRITE:
-#                 buffer = ctypes.create_string_buffer(region_size)
-#                 bytes_read = wintypes.SIZE_T()
-#                 if ReadProcessMemory(h_process, ctypes.c_void_p(base_address), buffer, region_size, ctypes.byref(bytes_read)):
-#                     dump_file.write(buffer.raw[:bytes_read.value])
-#                 else:
-#                     print(f"Error reading memory at address {hex(base_address)}: {ctypes.get_last_error()}")
-
-#             base_address += region_size
-
-#     CloseHandle(h_process)
-#     md5_hash = calculate_md5(output_file)
-#     print(f"Memory acquisition complete. Dump saved to {output_file}. MD5 hash: {md5_hash}")
-#     return True
-
-# def main():
-#     if len(sys.argv) != 3:
-#         print(f"Usage: {sys.argv[0]} <process_id> <output_file>")
-#         sys.exit(1)
-
-#     process_id = int(sys.argv[1])
-#     output_file = sys.argv[2]
-
-#     if acquire_memory(process_id, output_file):
-#         print("Memory acquisition successful.")
-#     else:
-#         print("Memory acquisition failed.")
-
-# if __name__ == "__main__":
-#     main()
+import os
+import re
+import json
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import adb_session
+import integrity
+import metrics
+
+# Per-process acquisition reads each target's mapped regions through
+# /proc/<pid>/maps and /proc/<pid>/mem on a rooted device. Processes are dumped
+# PROCESS_WORKERS at a time, each into one memory file plus a region index.
+#
+# A process's regions are read by a loop of dd commands on the device, one adb
+# stream for as many regions as fit in MAX_REGION_LIST characters, rather than
+# one adb process per region. dd pads unreadable pages with zeros
+# (conv=noerror,sync), so every region arrives at its full size and the host
+# can split the stream without markers in the data; after each region a line
+# "R <dd's records-in statistics>" tells how many pages were actually read.
+PAGE_SIZE = 4096
+READ_CHUNK_SIZE = 1024 * 1024
+PROCESS_WORKERS = 4
+MAX_REGION_LIST = 32 * 1024
+# Kernel-provided mappings that cannot be read through /proc/<pid>/mem.
+UNREADABLE_MAPPINGS = ("[vvar]", "[vsyscall]", "[vectors]")
+RECORDS_IN = re.compile(r"(\d+)\+(\d+) records in")
+
+
+def resolve_targets(targets, serial=None):
+    """
+    Turn a list of PIDs and package or process names into ([(pid, name)], [unresolved names]).
+    Names are looked up with pidof; a name with several processes yields all of them.
+    """
+    resolved, unresolved = [], []
+    for target in targets:
+        if str(target).isdigit():
+            resolved.append((int(target), str(target)))
+            continue
+        _, stdout, _ = adb_session.run_shell(f"pidof {shlex.quote(str(target))}", serial)
+        pids = stdout.split()
+        if not pids:
+            unresolved.append(str(target))
+        for pid in pids:
+            resolved.append((int(pid), str(target)))
+    return resolved, unresolved
+
+
+def parse_maps(maps_text):
+    """
+    Parse /proc/<pid>/maps into region dicts with start, end, perms, inode and path.
+    """
+    regions = []
+    for line in maps_text.splitlines():
+        fields = line.split(None, 5)
+        if len(fields) < 5:
+            continue
+        start, end = (int(address, 16) for address in fields[0].split("-"))
+        regions.append({
+            "start": start,
+            "end": end,
+            "perms": fields[1],
+            "inode": int(fields[4]),
+            "path": fields[5].strip() if len(fields) > 5 else "",
+        })
+    return regions
+
+
+def select_regions(regions, skip_unreadable=True, skip_file_backed=False):
+    """
+    Filter regions: unreadable ones (no read permission, or kernel mappings such
+    as [vvar]) and, if asked, regions backed by a file on disk.
+    """
+    selected = []
+    for region in regions:
+        if skip_unreadable and ("r" not in region["perms"] or region["path"] in UNREADABLE_MAPPINGS):
+            continue
+        if skip_file_backed and region["inode"] != 0:
+            continue
+        selected.append(region)
+    return selected
+
+
+def _page_range(region):
+    return f"{region['start'] // PAGE_SIZE}:{(region['end'] - region['start']) // PAGE_SIZE}"
+
+
+def region_batches(regions, max_length=MAX_REGION_LIST):
+    """
+    Split regions into batches whose "<first page>:<pages>" list fits in
+    max_length characters, each read by one adb stream.
+    """
+    batches, batch, length = [], [], 0
+    for region in regions:
+        entry_length = len(_page_range(region)) + 1
+        if batch and length + entry_length > max_length:
+            batches.append(batch)
+            batch, length = [], 0
+        batch.append(region)
+        length += entry_length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def read_regions_command(pid, regions, serial=None):
+    """
+    adb command streaming regions of /proc/<pid>/mem, each padded to its full
+    size and followed by an "R <records in>" line.
+    """
+    pages = " ".join(_page_range(region) for region in regions)
+    read = f"dd if=$m bs={PAGE_SIZE} skip=${{r%:*}} count=${{r#*:}} conv=noerror,sync 2>&1 >&3 | grep 'records in'"
+    # A process that exits mid-dump leaves its remaining regions zero-filled.
+    zero_fill = f"dd if=/dev/zero bs={PAGE_SIZE} count=${{r#*:}} 2>/dev/null >&3; s='0+0 records in'"
+    script = f"m=/proc/{pid}/mem; for r in {pages}; do if [ -r $m ]; then s=$({read}); else {zero_fill}; fi; " \
+             f"echo \"R $s\"; done 3>&1"
+    return [*adb_session.adb_args(serial), "exec-out", "su", "-c", shlex.quote(script)]
+
+
+def _read_regions(pid, regions, writer, serial=None):
+    """
+    Stream a batch of regions from /proc/<pid>/mem into writer. Returns
+    ([(bytes written, bytes read)] for the regions received, whether the
+    whole batch arrived).
+    """
+    command = read_regions_command(pid, regions, serial)
+    received = []
+    with metrics.stage("adb_pull", f"/proc/{pid}/mem") as current, \
+            subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             bufsize=READ_CHUNK_SIZE) as process:
+        for region in regions:
+            remaining = size = region["end"] - region["start"]
+            while remaining:
+                chunk = process.stdout.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                writer.write(chunk)
+                remaining -= len(chunk)
+            current.add_bytes(size - remaining)
+            status = "" if remaining else process.stdout.readline().decode(errors="replace")
+            if not status.startswith("R "):
+                received.append((size - remaining, 0))
+                return received, False
+            records = RECORDS_IN.search(status)
+            received.append((size, int(records.group(1)) * PAGE_SIZE if records else 0))
+        process.stdout.close()
+    return received, True
+
+
+def dump_process(pid, name, output_dir, skip_unreadable=True, skip_file_backed=False, serial=None):
+    """
+    Dump the selected regions of one process into process_<pid>.mem, with an
+    index in process_<pid>.regions.json mapping each region to its file offset.
+    """
+    try:
+        return_code, stdout, stderr = adb_session.run_su(f"cat /proc/{pid}/maps", serial)
+        if return_code != 0:
+            return f"Process {pid} ({name}): could not read maps - {stderr.decode(errors='replace').strip()}"
+        regions = select_regions(parse_maps(stdout.decode(errors="replace")), skip_unreadable, skip_file_backed)
+
+        memory_path = os.path.join(output_dir, f"process_{pid}.mem")
+        index = []
+        complete = True
+        with integrity.HashingWriter(memory_path, buffering=READ_CHUNK_SIZE) as writer:
+            for batch in region_batches(regions):
+                file_offset = writer.size
+                received, complete = _read_regions(pid, batch, writer, serial)
+                for region, (size, bytes_read) in zip(batch, received):
+                    index.append(dict(region, file_offset=file_offset, size=size, read=bytes_read))
+                    file_offset += size
+                if not complete:
+                    break
+        integrity.record_artifact(writer, partial=not complete)
+        integrity.write_artifact(
+            os.path.join(output_dir, f"process_{pid}.regions.json"),
+            json.dumps({"pid": pid, "name": name, "complete": complete, "regions": index}, indent=4),
+        )
+        unread = sum(entry["size"] - entry["read"] for entry in index)
+        result = f"Process {pid} ({name}): {len(index)} regions, {writer.size} bytes saved to {memory_path}"
+        if unread:
+            result += f" ({unread} unreadable bytes zero-filled)"
+        if not complete:
+            result += " - Error: the stream ended early, the dump is incomplete"
+        return result
+    except Exception as e:
+        return f"Process {pid} ({name}): Error dumping memory - {str(e)}"
+
+
+def acquire_memory(targets, output_dir, skip_unreadable=True, skip_file_backed=False, workers=PROCESS_WORKERS, serial=None):
+    """
+    Capture the memory of the given processes (PIDs or package names) from a
+    rooted Android device, dumping several processes concurrently.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with metrics.recording("acquire_memory", output_dir):
+        try:
+            processes, unresolved = resolve_targets(targets, serial)
+            if not processes:
+                return "Process memory acquisition failed: no matching processes found for " + ", ".join(
+                    str(target) for target in targets
+                ) + "."
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                dump = metrics.bind(
+                    lambda process: dump_process(process[0], process[1], output_dir, skip_unreadable, skip_file_backed, serial)
+                )
+                results = list(executor.map(dump, processes))
+            if unresolved:
+                results.append(f"No running process found for: {', '.join(unresolved)}")
+            return f"Process memory acquisition completed. Files saved in {output_dir}.\n" + "\n".join(results)
+        except Exception as e:
+            return f"Error acquiring process memory: {str(e)}"
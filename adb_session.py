@@ -0,0 +1,255 @@
+import atexit
+import queue
+import shlex
+import subprocess
+import threading
+import uuid
+
+import metrics
+
+# Long-lived `adb shell` sessions, POOL_SIZE per device, that run one command at
+# a time. Each command is followed by a sentinel line on stdout carrying its exit
+# status and a sentinel line on stderr, so the output of consecutive commands can
+# be told apart without starting a new adb client for every command.
+ADB_EXECUTABLE = "adb"
+POOL_SIZE = 4
+COMMAND_TIMEOUT = 60
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def adb_args(serial=None):
+    return [ADB_EXECUTABLE] + (["-s", serial] if serial else [])
+
+
+def shell_command(args):
+    """
+    Remote command line for `adb shell` arguments. adb joins them with spaces
+    and the device shell parses the result, so this does the same.
+    """
+    return " ".join(str(arg) for arg in args)
+
+
+def parse_shell_invocation(command):
+    """
+    If command (an argument list or command string) is `adb [-s serial] shell
+    <args>`, return (serial, remote command line); otherwise None.
+    """
+    args = shlex.split(command) if isinstance(command, str) else list(command)
+    serial = None
+    if not args or args[0] not in ("adb", ADB_EXECUTABLE):
+        return None
+    if args[1:2] == ["-s"] and len(args) > 2:
+        serial = args[2]
+        args = args[2:]
+    if args[1:2] != ["shell"] or len(args) < 3:
+        return None
+    return serial, shell_command(args[2:])
+
+
+def command_label(command):
+    """
+    Short name for an adb invocation in logs and metrics: its arguments after
+    the adb executable and device selection, e.g. "exec-out screencap -p".
+    """
+    args = shlex.split(command) if isinstance(command, str) else [str(arg) for arg in command]
+    if args and args[0] in ("adb", ADB_EXECUTABLE):
+        args = args[1:]
+        if args[:1] == ["-s"]:
+            args = args[2:]
+    return " ".join(args)
+
+
+def _pump(pipe, chunks):
+    for chunk in iter(lambda: pipe.read(READ_CHUNK_SIZE), b""):
+        chunks.put(chunk)
+    chunks.put(b"")
+
+
+def drain(pipe):
+    """
+    Read a pipe to its end on a thread, so that the process writing to it
+    never blocks on a full pipe while its other output is being read. Returns
+    a function that waits for the end and returns everything read, as bytes.
+    """
+    chunks = queue.Queue()
+    threading.Thread(target=_pump, args=(pipe, chunks), daemon=True).start()
+
+    def result():
+        return b"".join(iter(chunks.get, b""))
+    return result
+
+
+class AdbSession:
+    """
+    One persistent `adb shell` process for a device.
+    """
+
+    def __init__(self, serial=None):
+        self.serial = serial
+        self.token = uuid.uuid4().hex.encode()
+        self.process = subprocess.Popen(
+            adb_args(serial) + ["shell"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0,
+        )
+        self._stdout = queue.Queue()
+        self._stderr = queue.Queue()
+        for pipe, chunks in ((self.process.stdout, self._stdout), (self.process.stderr, self._stderr)):
+            threading.Thread(target=_pump, args=(pipe, chunks), daemon=True).start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read_until(self, chunks, marker, deadline_timer, sink=None):
+        """
+        Read chunks until marker appears. Everything before it goes to sink (or
+        is returned); bytes after it are returned as the tail.
+        """
+        buffer = b""
+        collected = []
+        while True:
+            if deadline_timer.finished.is_set():
+                raise TimeoutError
+            try:
+                chunk = chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if not chunk:
+                raise ConnectionError("adb shell session closed")
+            buffer += chunk
+            position = buffer.find(marker)
+            if position >= 0:
+                head, tail = buffer[:position], buffer[position + len(marker):]
+                (sink or collected.append)(head)
+                return b"".join(collected), tail
+            # Hold back enough bytes that a marker split across chunks is still found.
+            keep = len(marker) - 1
+            if len(buffer) > keep:
+                (sink or collected.append)(buffer[:-keep] if keep else buffer)
+                buffer = buffer[-keep:] if keep else b""
+
+    def run(self, command, timeout=COMMAND_TIMEOUT, sink=None):
+        """
+        Run a shell command line on the device. Returns (return_code, stdout, stderr)
+        as bytes; stdout is empty when a sink callable receives it instead.
+        """
+        stdout_marker = b"\n" + self.token + b" "
+        stderr_marker = b"\n" + self.token + b"\n"
+        # The command runs in a subshell with its own stdin so it cannot consume later commands.
+        framed = f"( {command} ) </dev/null; printf '\\n%s %d\\n' {self.token.decode()} $?; printf '\\n%s\\n' {self.token.decode()} >&2\n"
+        timer = threading.Timer(timeout, lambda: None)
+        timer.start()
+        try:
+            self.process.stdin.write(framed.encode())
+            self.process.stdin.flush()
+            stdout, tail = self._read_until(self._stdout, stdout_marker, timer, sink)
+            while b"\n" not in tail:
+                tail += self._read_until(self._stdout, b"\n", timer)[0] + b"\n"
+            return_code = int(tail.split(b"\n", 1)[0])
+            stderr, _ = self._read_until(self._stderr, stderr_marker, timer)
+            return return_code, stdout, stderr
+        except (TimeoutError, ConnectionError, OSError, ValueError):
+            # The session is out of step with its output; it cannot be reused.
+            self.close()
+            raise
+        finally:
+            timer.cancel()
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class SessionPool:
+    """
+    Up to `size` sessions for one device, handed out one command at a time.
+    """
+
+    def __init__(self, serial=None, size=POOL_SIZE):
+        self.serial = serial
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        """
+        An idle live session, or a new one; holds one of the pool's slots until
+        _release(). The slot is given back if no session can be started.
+        """
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    session = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if session.alive():
+                    return session
+            session = AdbSession(self.serial)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._sessions = [other for other in self._sessions if other.alive()] + [session]
+        return session
+
+    def _release(self, session):
+        if session.alive():
+            self._idle.put(session)
+        self._slots.release()
+
+    def run(self, command, timeout=COMMAND_TIMEOUT, sink=None):
+        session = self._acquire()
+        try:
+            return session.run(command, timeout, sink)
+        finally:
+            self._release(session)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(serial=None):
+    with _pools_lock:
+        if serial not in _pools:
+            _pools[serial] = SessionPool(serial)
+        return _pools[serial]
+
+
+def run_shell(command, serial=None, timeout=COMMAND_TIMEOUT, sink=None):
+    """
+    Run a shell command line on a device through its session pool.
+    Returns (return_code, stdout, stderr) as bytes.
+    """
+    with metrics.stage("adb_shell", command) as current:
+        if sink is not None:
+            def counted_sink(chunk, sink=sink):
+                current.add_bytes(len(chunk))
+                sink(chunk)
+            return get_pool(serial).run(command, timeout, counted_sink)
+        result = get_pool(serial).run(command, timeout)
+        current.add_bytes(len(result[1]))
+        return result
+
+
+def run_su(command, serial=None, timeout=COMMAND_TIMEOUT, sink=None):
+    """
+    Run a command line as root through `su -c`.
+    """
+    return run_shell(f"su -c {shlex.quote(command)}", serial, timeout, sink)
+
+
+@atexit.register
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
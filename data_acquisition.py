@@ -1,21 +1,42 @@
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-def run_adb_command(command, description):
+import adb_session
+import collector
+import metrics
+from ram_capture import stream_adb_output
+
+def stream_artifact(command, file_path, description):
     """
-    Helper function to run ADB commands and log results.
+    Stream an adb command's output into file_path, hashing it into the case manifest.
     """
     try:
-        result = subprocess.run(command, capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            return f"{description} completed successfully.\n{result.stdout.strip()}"
+        bytes_written, _, return_code, stderr, _ = stream_adb_output(command, file_path)
+        if return_code == 0:
+            return f"{description} completed successfully.\n{bytes_written} bytes saved to {file_path}"
         else:
-            return f"{description} failed.\n{result.stderr.strip()}"
+            return f"{description} failed.\n{stderr.strip()}"
     except Exception as e:
         return f"Error executing {description}: {str(e)}"
 
-def acquire_data(output_dir, package_name=None):
+def record_screen(screen_record_path, time_limit=10, serial=None):
+    """
+    Record the screen for a fixed duration (e.g., 10 seconds) and copy the recording.
+    """
+    try:
+        record = subprocess.run(
+            [*adb_session.adb_args(serial), "shell", "screenrecord", "--time-limit", str(time_limit), "/sdcard/screen_record.mp4"],
+            capture_output=True, text=True, timeout=time_limit + collector.COMMAND_TIMEOUT,
+        )
+        if record.returncode != 0:
+            return f"Screen Record failed.\n{record.stderr.strip()}"
+        return stream_artifact([*adb_session.adb_args(serial), "exec-out", "cat", "/sdcard/screen_record.mp4"], screen_record_path, "Screen Record")
+    except Exception as e:
+        return f"Error executing Screen Record: {str(e)}"
+
+def acquire_data(output_dir, package_name=None, serial=None):
     """
     Acquire additional data from the Android device, such as app databases,
     shared preferences, APKs, screenshots, and screen recordings.
@@ -24,54 +45,45 @@ def acquire_data(output_dir, package_name=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    results = []
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')  # Generate a timestamp for file names
 
-    try:
-        # General commands for data acquisition
-        commands = {
-            "List Features": ["adb", "shell", "pm", "list", "features"],
-            "List Services": ["adb", "shell", "service", "list"],
-            "Installed APKs": ["adb", "shell", "ls", "/data/app"],
-            "Pre-installed APKs": ["adb", "shell", "ls", "/system/app"],
-            "Encrypted Apps": ["adb", "shell", "ls", "/mnt/asec"],
-        }
+    adb = adb_session.adb_args(serial)
 
-        if package_name:
-            # Add commands specific to a package
-            package_commands = {
-                "App Databases": ["adb", "shell", "ls", f"/data/data/{package_name}/databases"],
-                "Shared Preferences": ["adb", "shell", "ls", f"/data/data/{package_name}/shared_prefs"],
+    with metrics.recording("acquire_data", output_dir):
+        try:
+            # General commands for data acquisition
+            commands = {
+                "List Features": [*adb, "shell", "pm", "list", "features"],
+                "List Services": [*adb, "shell", "service", "list"],
+                "Installed APKs": [*adb, "shell", "ls", "/data/app"],
+                "Pre-installed APKs": [*adb, "shell", "ls", "/system/app"],
+                "Encrypted Apps": [*adb, "shell", "ls", "/mnt/asec"],
             }
-            commands.update(package_commands)
 
-        for key, command in commands.items():
-            try:
-                process = subprocess.run(command, capture_output=True, text=True)
-                if process.returncode == 0:
-                    result = process.stdout.strip()
-                    results.append(f"{key}:\n{result}\n")
-                    # Save output to a file with .bin extension
-                    file_name = f"{key.replace(' ', '_').lower()}_{timestamp}.bin"
-                    file_path = os.path.join(output_dir, file_name)
-                    with open(file_path, "w") as f:
-                        f.write(result)
-                else:
-                    results.append(f"{key}: Command failed with error {process.stderr.strip()}\n")
-            except Exception as e:
-                results.append(f"{key}: Error executing command - {str(e)}\n")
+            if package_name:
+                # Add commands specific to a package
+                package_commands = {
+                    "App Databases": [*adb, "shell", "ls", f"/data/data/{package_name}/databases"],
+                    "Shared Preferences": [*adb, "shell", "ls", f"/data/data/{package_name}/shared_prefs"],
+                }
+                commands.update(package_commands)
 
-        # Capture a screenshot
-        screenshot_path = os.path.join(output_dir, f"screenshot_{timestamp}.img")
-        screenshot_command = f"adb shell screencap -p /sdcard/screenshot.png && adb pull /sdcard/screenshot.png {screenshot_path}"
-        results.append(run_adb_command(screenshot_command, "Screenshot"))
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                # The screenshot and the 10-second screen recording run alongside the listing commands
+                screenshot_path = os.path.join(output_dir, f"screenshot_{timestamp}.img")
+                screenshot = executor.submit(metrics.bind(stream_artifact), [*adb, "exec-out", "screencap", "-p"], screenshot_path, "Screenshot")
+                screen_record_path = os.path.join(output_dir, f"screen_record_{timestamp}.bin")
+                screen_record = executor.submit(metrics.bind(record_screen), screen_record_path, serial=serial)
 
-        # Record screen for a fixed duration (e.g., 10 seconds)
-        screen_record_path = os.path.join(output_dir, f"screen_record_{timestamp}.bin")
-        screen_record_command = f"adb shell screenrecord --time-limit 10 /sdcard/screen_record.mp4 && adb pull /sdcard/screen_record.mp4 {screen_record_path}"
-        results.append(run_adb_command(screen_record_command, "Screen Record"))
+                # Save each output to a file with .bin extension
+                file_paths = {
+                    key: os.path.join(output_dir, f"{key.replace(' ', '_').lower()}_{timestamp}.bin") for key in commands
+                }
+                results = collector.run_commands(commands, file_paths)
+                results.append(screenshot.result())
+                results.append(screen_record.result())
 
-        return f"Data acquisition completed. Files saved in {output_dir}.\n" + "\n".join(results)
+            return f"Data acquisition completed. Files saved in {output_dir}.\n" + "\n".join(results)
 
-    except Exception as e:
-        return f"Error acquiring data: {str(e)}"
+        except Exception as e:
+            return f"Error acquiring data: {str(e)}"
@@ -1,9 +1,11 @@
 import subprocess
 
-def get_connected_devices(self):
+import adb_session
+
+def get_connected_devices():
     # Run the adb devices command
     try:
-        result = subprocess.run(['adb', 'devices'], capture_output=True, text=True)
+        result = subprocess.run([adb_session.ADB_EXECUTABLE, 'devices'], capture_output=True, text=True)
         output = result.stdout.strip().splitlines()
 
         if len(output) < 2:
@@ -11,8 +13,9 @@ def get_connected_devices(self):
         
         devices = []
         for line in output[1:]:  # Skip the header line
-            device_id = line.split()[0]
-            devices.append(device_id)
+            fields = line.split()
+            if len(fields) >= 2 and fields[1] == "device":
+                devices.append(fields[0])
 
         return devices if devices else "No devices connected."
     
@@ -20,3 +23,37 @@ def get_connected_devices(self):
         return "ADB not found. Please ensure it's installed and in your PATH."
     except Exception as e:
         return f"Error detecting devices: {e}"
+
+
+def describe_device(serial):
+    """
+    Model and Android version of a device, read over its pooled shell session.
+    The session opened here is reused by the collectors that run next.
+    """
+    try:
+        return_code, stdout, _ = adb_session.run_shell(
+            "getprop ro.product.model; getprop ro.build.version.release", serial, timeout=10
+        )
+        model, _, release = stdout.decode(errors="replace").strip().partition("\n")
+        if return_code != 0 or not model:
+            return serial
+        return f"{serial} ({model.strip()}, Android {release.strip()})"
+    except Exception:
+        return serial
+
+
+def get_device_hubs():
+    """
+    Map each connected device's serial to the USB hub it hangs off, from the
+    usb: path in `adb devices -l` (1-1.4.2 is port 2 of hub 1-1.4). Devices
+    without a USB path, such as emulators and network devices, map to "host".
+    """
+    result = subprocess.run([adb_session.ADB_EXECUTABLE, 'devices', '-l'], capture_output=True, text=True)
+    hubs = {}
+    for line in result.stdout.strip().splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 2 or fields[1] != "device":
+            continue
+        usb = next((field[4:] for field in fields[2:] if field.startswith("usb:")), None)
+        hubs[fields[0]] = usb.rsplit(".", 1)[0] if usb and "." in usb else "host"
+    return hubs
@@ -1,147 +1,872 @@
 import os
 import re
+import json
+import bisect
+import mmap
+import hashlib
+import heapq
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
 
-def analyze_ram_dump(dump_path, output_dir):
+import dump_container
+import entropy_detector
+import metrics
+import page_index
+import report_store
+import result_cache
+import rules
+import setting
+import string_counter
+
+# The dump is walked in windows of WINDOW_SIZE bytes. The regex scan for a
+# window starts WINDOW_OVERLAP bytes before it and may run WINDOW_OVERLAP bytes
+# past it, so matches crossing a boundary are found whole; a match is only kept
+# by the window it starts in.
+WINDOW_SIZE = 16 * 1024 * 1024
+WINDOW_OVERLAP = 64 * 1024
+
+# In parallel mode the dump is split into page-aligned shards of SHARD_SIZE
+# bytes, each scanned window by window in its own worker process. Both can be
+# overridden with the "scan_workers" and "shard_size" settings.
+SHARD_SIZE = 64 * 1024 * 1024
+
+# The report lists this many of the most frequent strings; override with the
+# "strings_report_limit" setting.
+STRINGS_REPORT_LIMIT = 100
+
+
+@contextmanager
+def open_dump(dump_path):
+    """
+    Memory-map a dump file read-only. Empty files yield an empty bytes object,
+    since they cannot be mapped. Compressed dump containers yield a
+    dump_container.ContainerReader, which windows are read from with window_view.
+    """
+    if dump_container.is_container(dump_path):
+        with dump_container.ContainerReader(dump_path) as reader:
+            yield reader
+        return
+    with open(dump_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        ram_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(ram_data, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            ram_data.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            yield ram_data
+        finally:
+            ram_data.close()
+
+
+def image_size(dump_path):
+    """
+    Size of the memory image in a dump file, which for a container is its uncompressed size.
+    """
+    with open_dump(dump_path) as ram_data:
+        return len(ram_data)
+
+
+def iter_windows(data_size, window_size=WINDOW_SIZE, start=0):
+    """
+    Yield (start, end) tuples covering bytes start to data_size in window_size steps.
+    """
+    for window_start in range(start, data_size, window_size):
+        yield window_start, min(window_start + window_size, data_size)
+
+
+def window_view(ram_data, window, overlap=WINDOW_OVERLAP):
+    """
+    Return (buffer, local_window, base) for scanning one window: buffer offset i
+    is dump offset base + i. Mapped dumps are scanned in place; for containers
+    only the window and its overlap are decompressed.
+    """
+    if not isinstance(ram_data, dump_container.ContainerReader):
+        return ram_data, window, 0
+    start, end = window
+    base = max(0, start - overlap)
+    return ram_data.read_range(base, end + overlap), (start - base, end - base), base
+
+
+def _rebase(records, base):
+    if not base:
+        return records
+    return ((offset + base, kind, line) for offset, kind, line in records)
+
+
+def scan_window(ram_data, window, zero_flags=None, analyzers=None):
+    """
+    Scanner records for one window of an open dump, with dump offsets. With the
+    zero page flags of a page index, the token sweep skips all-zero pages.
+    """
+    buffer, local_window, base = window_view(ram_data, window)
+    spans = None
+    if zero_flags is not None:
+        start, end = window
+        spans = [
+            (span_start - base, span_end - base)
+            for span_start, span_end in page_index.nonzero_spans(
+                zero_flags, max(0, start - WINDOW_OVERLAP), min(end + WINDOW_OVERLAP, len(ram_data))
+            )
+        ]
+    return _rebase(format_hits(scan(buffer, local_window, spans=spans, analyzers=analyzers)), base)
+
+
+def _finditer(pattern, ram_data, window=None, overlap=WINDOW_OVERLAP):
+    """
+    Run pattern over ram_data, or over one window of it without copying.
+    Only matches starting inside the window are yielded.
+    """
+    if window is None:
+        yield from pattern.finditer(ram_data)
+        return
+    start, end = window
+    scan_from = max(0, start - overlap)
+    limit = min(end + overlap, len(ram_data))
+    for match in pattern.finditer(ram_data, scan_from, limit):
+        if match.start() < start:
+            continue
+        if match.start() >= end:
+            break
+        yield match
+
+
+def load_segment_map(dump_path):
+    """
+    Load the ranges table written next to a segmented capture, as sorted
+    (file_offset, physical_address, size) tuples. Returns [] for plain dumps,
+    whose file offsets already are physical addresses.
+    """
+    try:
+        with open(dump_path + ".ranges.json", "r") as f:
+            table = json.load(f)
+    except FileNotFoundError:
+        return []
+    return sorted((entry["file_offset"], entry["offset"], entry["size"]) for entry in table if "file_offset" in entry)
+
+
+def physical_address(segment_map, file_offset):
+    """
+    Translate an offset in a dump file to the physical address it was captured from.
+    """
+    index = bisect.bisect_right(segment_map, (file_offset, float("inf"))) - 1
+    if index < 0:
+        return file_offset
+    segment_offset, address, _ = segment_map[index]
+    return address + file_offset - segment_offset
+
+
+def format_segment_map(segment_map):
+    lines = [f"Memory segments: {len(segment_map)}"]
+    for file_offset, address, size in segment_map:
+        lines.append(f"Physical 0x{address:x}-0x{address + size:x} at file offset 0x{file_offset:x}")
+    return lines
+
+
+def scan_settings():
+    """
+    Worker count and shard size for parallel scanning, from the saved settings.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    workers = int(settings.get("scan_workers", os.cpu_count() or 1))
+    shard_size = int(settings.get("shard_size", SHARD_SIZE))
+    # Shards start on page boundaries so each one maps whole pages of the dump.
+    shard_size = max(mmap.ALLOCATIONGRANULARITY, shard_size - shard_size % mmap.ALLOCATIONGRANULARITY)
+    return max(1, workers), shard_size
+
+
+def _scan_shard(dump_path, start, end, window_size, zero_flags=None, analyzers=None):
+    """
+    Scan one shard of a dump in a worker process. The worker maps the file
+    itself, so only shard offsets, formatted records and the shard's stage
+    metrics cross process boundaries.
+    """
+    with metrics.recording(log=False) as recorder, open_dump(dump_path) as ram_data:
+        records = [
+            record
+            for window in iter_windows(end, window_size, start)
+            for record in scan_window(ram_data, window, zero_flags, analyzers)
+        ]
+    return records, recorder.snapshot()
+
+
+def scan_dump(dump_path, window_size=WINDOW_SIZE, workers=None, shard_size=None, progress=None, zero_flags=None,
+              analyzers=None, sink=None):
+    """
+    Scan a dump and return the collected results. Dumps larger than one shard
+    are scanned in a process pool when more than one worker is configured;
+    shard results are merged back in offset order. zero_flags, from a page
+    index, lets the scan skip all-zero pages. If analyzers is given, only
+    those run; the results of the others stay empty. With a sink (a
+    report_store.FindingStore), findings are streamed into it as they are found
+    and the returned results stay empty.
+    progress, if given, is called with (bytes_scanned, bytes_per_second) after
+    each window or shard; an exception it raises stops the scan.
+    """
+    default_workers, default_shard_size = scan_settings()
+    workers = workers or default_workers
+    shard_size = shard_size or default_shard_size
+    results = new_results()
+    consume = (lambda records: emit(sink, records)) if sink is not None else (lambda records: collect(results, records))
+    dump_size = image_size(dump_path)
+    started = time.monotonic()
+
+    def report(end):
+        if progress:
+            progress(end, end / max(time.monotonic() - started, 1e-9))
+
+    label = None if analyzers is None else ",".join(analyzers)
+    if workers == 1 or dump_size <= shard_size:
+        with metrics.stage("scan", label, dump_size), open_dump(dump_path) as ram_data:
+            for window in iter_windows(len(ram_data), window_size):
+                consume(scan_window(ram_data, window, zero_flags, analyzers))
+                report(window[1])
+        return results
+
+    shards = list(iter_windows(dump_size, shard_size))
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(shards)))
+    try:
+        with metrics.stage("scan", label, dump_size):
+            shard_results = executor.map(
+                _scan_shard,
+                [dump_path] * len(shards),
+                [start for start, _ in shards],
+                [end for _, end in shards],
+                [window_size] * len(shards),
+                [zero_flags] * len(shards),
+                [analyzers] * len(shards),
+            )
+            # Shards are disjoint and returned in order, so their records are already sorted by offset.
+            for (_, end), (records, shard_stages) in zip(shards, shard_results):
+                consume(records)
+                metrics.merge(shard_stages)
+                report(end)
+    finally:
+        # After a failure or a cancellation, shards that have not started are dropped.
+        executor.shutdown(cancel_futures=True)
+    return results
+
+
+def build_page_index(dump_path, digest=None):
+    """
+    Build or update the page index sidecar of a dump; digest is the dump's
+    content_digest(), if already known.
+    """
+    try:
+        with open_dump(dump_path) as ram_data, metrics.stage("page_index") as current:
+            summary = page_index.update_index(dump_path, ram_data, digest)
+            # An index that is up to date is only checked, not read through.
+            if not summary.endswith("is up to date."):
+                current.add_bytes(len(ram_data))
+            return summary
+    except Exception as e:
+        return f"Error indexing RAM dump: {str(e)}"
+
+
+def search_strings(dump_path, pattern):
+    """
+    Search only the indexed strings of a dump for a new text pattern (a str
+    regex), without sweeping the whole dump. Returns (offset, encoding, text)
+    per match, with offsets into the dump; builds the page index if needed.
+    """
+    pattern = re.compile(pattern)
+    digest = content_digest(dump_path)
+    index = page_index.load_index(dump_path, digest)
+    if index is None:
+        build_page_index(dump_path, digest)
+        index = page_index.load_index(dump_path, digest)
+    if index is None:
+        raise ValueError(f"{dump_path} has no usable page index")
+    hits = []
+    with index, open_dump(dump_path) as ram_data:
+        for start, end, encoding in index.strings():
+            wide = encoding == page_index.UTF16
+            text = ram_data[start:end].decode("utf-16-le" if wide else "ascii")
+            for match in pattern.finditer(text):
+                hits.append((start + match.start() * (2 if wide else 1), encoding, match.group()))
+    return hits
+
+
+def content_digest(dump_path):
+    """
+    Content digest of a dump, which its page index and the result cache are
+    keyed on; for a container, that of the uncompressed image.
+    """
+    with open_dump(dump_path) as ram_data, metrics.stage("content_digest", size=len(ram_data)):
+        return page_index.content_digest(ram_data)
+
+
+def analyzer_versions():
+    """
+    Version of every analyzer for the result cache: ANALYZER_VERSIONS plus a
+    hash of the patterns or settings the analyzer's output depends on, so that
+    editing a pattern or a signature invalidates only that analyzer's results.
+    """
+    inputs = {name: [] for name in ANALYZER_VERSIONS}
+    for kind, analyzer, pattern, _ in TOKEN_ANALYZERS:
+        inputs[analyzer].append((kind, pattern.pattern))
+    inputs["malicious_patterns"].append(load_rules().digest)
+    inputs["high_entropy"].append(entropy_detector.detector_settings())
+    inputs["strings"].extend(
+        (string_counter.counter_settings(), page_index.STRING_MIN_LENGTH, string_counter.MAX_VALUE_LENGTH)
+    )
+    return {
+        name: f"{ANALYZER_VERSIONS[name]}-{hashlib.sha256(repr(inputs[name]).encode()).hexdigest()[:16]}"
+        for name in ANALYZER_VERSIONS
+    }
+
+
+def use_page_index():
+    settings = setting.load_settings()
+    return bool(settings.get("page_index", True)) if isinstance(settings, dict) else True
+
+
+def findings_format():
+    """
+    "sqlite" (the default) or "jsonl", from the "findings_format" setting. The
+    findings store is always written; with "jsonl" it is also exported as JSON lines.
+    """
+    settings = setting.load_settings()
+    return settings.get("findings_format", "sqlite") if isinstance(settings, dict) else "sqlite"
+
+
+def strings_report_limit():
+    settings = setting.load_settings()
+    limit = settings.get("strings_report_limit") if isinstance(settings, dict) else None
+    return STRINGS_REPORT_LIMIT if limit is None else int(limit)
+
+
+def apply_rule_conditions(store, rule_set):
+    """
+    Drop the hits of rules whose condition does not hold over the whole dump.
+    """
+    hit_strings = {}
+    for _, rule_id, value, _, _, _ in store.iter_rows("malicious_patterns"):
+        hit_strings.setdefault(rule_id, set()).add(rule_set.hit_strings(rule_id, value))
+    matched = rule_set.matched_rules(hit_strings)
+    for rule_id in hit_strings.keys() - matched:
+        store.delete("malicious_patterns", rule_id)
+
+
+def cached_analysis(dump_path, store, window_size=WINDOW_SIZE, progress=None, workers=None, zero_flags=None,
+                    cache=None, digest=None):
+    """
+    Fill a findings store with the findings of every analyzer on a dump, taking
+    those whose version is unchanged from the result cache and running only the
+    others. digest is the dump's content_digest(), if already known. Returns the
+    number of analyzers served from the cache.
+    """
+    versions = analyzer_versions()
+    stale = []
+    if cache and digest is None:
+        digest = content_digest(dump_path)
+    with metrics.stage("cache_lookup"):
+        for name, version in versions.items():
+            cached = cache.get(digest, name, version) if cache else None
+            if cached is None:
+                stale.append(name)
+            else:
+                store.add_rows(cached)
+    scanned = tuple(name for name in stale if name in ANALYZER_NAMES)
+    if scanned:
+        scan_dump(dump_path, window_size, workers, progress=progress, zero_flags=zero_flags, analyzers=scanned, sink=store)
+    if "malicious_patterns" in scanned:
+        with metrics.stage("rule_conditions"):
+            apply_rule_conditions(store, load_rules())
+    if "high_entropy" in stale:
+        with open_dump(dump_path) as ram_data, metrics.stage("high_entropy", size=len(ram_data)):
+            for region in entropy_detector.find_high_entropy_regions(ram_data):
+                store.add("high_entropy", region["kind"], region["start"], entropy_detector.format_region(region))
+    if "strings" in stale:
+        with open_dump(dump_path) as ram_data, metrics.stage("strings", size=len(ram_data)):
+            store.add_rows(string_counter.finding_rows(string_counter.count_strings(ram_data, zero_flags)))
+    if cache:
+        with metrics.stage("cache_store"):
+            for name in stale:
+                cache.put(digest, name, versions[name], store.iter_rows(name))
+    return len(versions) - len(stale)
+
+
+# (analyzer, heading) of the report sections listing findings, in report order.
+REPORT_SECTIONS = (
+    ("processes", "Processes found"),
+    ("network_connections", "Active network connections"),
+    ("hidden_data", "Potential hidden data found"),
+    ("high_entropy", "High-entropy regions found"),
+    ("deleted_files", "Deleted file remnants found"),
+)
+
+
+def format_finding(value, count, first_offset, last_offset, estimated=False):
+    """
+    A report line for one distinct finding with its occurrences and offsets.
+    An estimated count is an upper bound.
+    """
+    if count == 1 and not estimated:
+        return f"{value} (at {first_offset:#x})"
+    occurrences = f"up to {count}" if estimated else count
+    return f"{value} ({occurrences} occurrences, first at {first_offset:#x}, last at {last_offset:#x})"
+
+
+def render_report(store, report, segment_map=None, stages=None):
+    """
+    Write the text report for a findings store to an open file. Each distinct
+    finding is listed once, with its occurrence count and first and last
+    offsets, followed by the most frequent strings and, if given, the stage
+    metrics (a metrics.Recorder snapshot) of the analysis.
+    """
+    # Describe the physical layout of segmented captures
+    if segment_map:
+        report.write("\n".join(format_segment_map(segment_map)) + "\n")
+
+    counts = store.counts()
+    for analyzer, heading in REPORT_SECTIONS:
+        report.write(f"{heading}: {counts.get(analyzer, (0, 0))[1]}\n")
+        for _, _, value, count, first_offset, last_offset in store.iter_rows(analyzer):
+            report.write(format_finding(value, count, first_offset, last_offset) + "\n")
+
+    # Most frequent strings; counts of strings first seen after the exact table filled up are estimates.
+    distinct_strings, string_occurrences = counts.get("strings", (0, 0))
+    top_strings = store.top("strings", strings_report_limit())
+    report.write(
+        f"Strings found: {string_occurrences} occurrences of {distinct_strings} tracked strings, "
+        f"{len(top_strings)} most frequent:\n"
+    )
+    for _, kind, value, count, first_offset, last_offset in top_strings:
+        estimated = kind.endswith(string_counter.ESTIMATE_SUFFIX)
+        encoding = kind[:-len(string_counter.ESTIMATE_SUFFIX)] if estimated else kind
+        line = format_finding(repr(value)[1:-1], count, first_offset, last_offset, estimated)
+        report.write(f"[{encoding}] {line}\n")
+
+    # Detect malicious patterns
+    malicious_patterns = format_rule_hits(store.kind_summary("malicious_patterns"), store.meta().get("rules", {}))
+    report.write(f"Malicious patterns detected: {len(malicious_patterns)}\n")
+    report.write("\n".join(malicious_patterns))
+
+    if stages:
+        report.write("\n\nStage timings:\n")
+        report.write("\n".join(metrics.format_stage(record) for record in stages) + "\n")
+
+
+def analyze_ram_dump(dump_path, output_dir, window_size=WINDOW_SIZE, progress=None, workers=None, use_index=None,
+                     use_cache=None, store_file=None):
     """
     Analyze a RAM dump to extract valuable forensic information, including processes,
-    network connections, potential hidden data, and malicious patterns.
+    network connections, potential hidden data, high-entropy regions and malicious patterns.
+    The dump is memory-mapped and scanned window by window in a single pass, and
+    findings are streamed into a new findings store
+    (findings_<timestamp>_<random>.db) as they are found, so memory use grows
+    with neither the size of the dump nor the number of matches; the text
+    report (analysis_report_<timestamp>_<random>.txt) is rendered from it. A
+    caller that needs to know the store, such as the GUI, can pass one made by
+    report_store.new_store_path() as store_file. Unless
+    use_index is False (or the "page_index" setting is off), the dump's page
+    index is built or updated first and its zero pages are skipped. Unless
+    use_cache is False (or the "result_cache" setting is off), results of
+    unchanged analyzers are reused from earlier analyses of the same dump contents.
+    The time, bytes and throughput of every stage are added to the report.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Read the raw dump file (RAM dump)
-    try:
-        with open(dump_path, 'rb') as f:
-            ram_data = f.read()
+    # Stage metrics go to the log and to metrics_<timestamp>.jsonl next to the report.
+    with metrics.recording("analyze_ram_dump", output_dir) as recorder:
+        try:
+            cache_dir, cache_size, cache_enabled = result_cache.cache_settings()
+            cache = None
+            if use_cache if use_cache is not None else cache_enabled:
+                cache = result_cache.ResultCache(cache_dir, cache_size)
+            indexed = use_index if use_index is not None else use_page_index()
+            # One pass over the dump keys both the page index and the result cache.
+            digest = content_digest(dump_path) if indexed or cache else None
+            zero_flags = None
+            if indexed:
+                build_page_index(dump_path, digest)
+                index = page_index.load_index(dump_path, digest)
+                if index:
+                    zero_flags = index.zero_flags
+                    index.close()
 
-        # Perform initial analysis
-        analysis_results = []
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            # A new store per analysis: jobs sharing output_dir may start in the same second.
+            store_file = store_file or report_store.new_store_path(output_dir)
+            with report_store.FindingStore(store_file) as store:
+                cached_count = cached_analysis(
+                    dump_path, store, window_size, progress, workers, zero_flags, cache, digest
+                )
+                rule_set = load_rules()
+                store.set_meta(
+                    dump_path=os.path.abspath(dump_path),
+                    analyzed_at=timestamp,
+                    rules={
+                        rule_id: rule_set.metadata.get(rule_id, {})
+                        for rule_id in store.kind_summary("malicious_patterns")
+                    },
+                )
 
-        # Extract process information
-        processes = extract_processes(ram_data)
-        analysis_results.append(f"Processes found: {len(processes)}")
-        analysis_results.append("\n".join(processes))
+                # Generate a summary report
+                report_file = os.path.join(output_dir, f"analysis_report_{report_store.store_name(store_file)}.txt")
+                with open(report_file, 'w') as report, metrics.stage("render_report"):
+                    render_report(store, report, load_segment_map(dump_path), recorder.snapshot())
+                if findings_format() == "jsonl":
+                    store.export_jsonl(os.path.splitext(store_file)[0] + ".jsonl")
 
-        # Extract active network connections
-        network_connections = extract_network_connections(ram_data)
-        analysis_results.append(f"Active network connections: {len(network_connections)}")
-        analysis_results.append("\n".join(network_connections))
+            cached = f" ({cached_count} of {len(ANALYZER_VERSIONS)} analyzers from cache)" if cached_count else ""
+            return f"RAM dump analysis complete. Report saved to {report_file}{cached}"
 
-        # Search for hidden or encrypted data
-        hidden_data = search_for_hidden_data(ram_data)
-        analysis_results.append(f"Potential hidden data found: {len(hidden_data)}")
-        analysis_results.append("\n".join(hidden_data))
+        except Exception as e:
+            return f"Error analyzing RAM dump: {str(e)}"
 
-        # Search for deleted file remnants
-        deleted_files = search_for_deleted_files(ram_data)
-        analysis_results.append(f"Deleted file remnants found: {len(deleted_files)}")
-        analysis_results.append("\n".join(deleted_files))
 
-        # Detect malicious patterns
-        malicious_patterns = detect_malicious_patterns(ram_data)
-        analysis_results.append(f"Malicious patterns detected: {len(malicious_patterns)}")
-        analysis_results.append("\n".join(malicious_patterns))
+# Known malicious patterns or signatures, loaded as the built-in rule pack
+# ahead of any configured rule packs (see rules.py).
+SIGNATURES = {
+    "Reverse Shell": rb"bash -i >& /dev/tcp/\d+\.\d+\.\d+\.\d+/\d+ 0>&1",
+    "Keylogger": rb"KeyLogger",
+    "Malware Signature 1": rb"malicious_payload",
+    "Encoded Commands": rb"base64 -d",
+    "Suspicious Script": rb"eval\(.+\)",
+    "Unauthorized Network Activity": rb"curl http://|wget http://",
+}
 
-        # Generate a summary report
-        report_file = os.path.join(output_dir, f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-        with open(report_file, 'w') as report:
-            report.write("\n".join(analysis_results))
 
-        return f"RAM dump analysis complete. Report saved to {report_file}"
+def load_rules():
+    """
+    The compiled rule set of the built-in signatures and the configured rule packs.
+    """
+    return rules.load_rules(SIGNATURES)
 
-    except Exception as e:
-        return f"Error analyzing RAM dump: {str(e)}"
+
+PROCESS_PATTERN = re.compile(rb"\x00(?P<process_name>[\w\s]+)\x00\s*(?P<process_id>\d+)\s*")
+NETSTAT_PATTERN = re.compile(
+    rb"(?P<local_address>\d+\.\d+\.\d+\.\d+:\d+)\s+(?P<remote_address>\d+\.\d+\.\d+\.\d+:\d+)\s+"
+    rb"(?P<state>ESTABLISHED|LISTEN)"
+)
+HEX_KEY_PATTERN = re.compile(rb"\b[a-f0-9]{32,64}\b")
+BASE64_KEY_PATTERN = re.compile(rb"[A-Za-z0-9+/=]{16,}")
+# Path components are limited to printable characters other than whitespace, so a remnant
+# never spans binary data or runs on through the text around it.
+DELETED_FILE_PATTERN = re.compile(rb"/[^/\x00-\x20\x7f-\xff]+/[A-Za-z0-9]+(?:\.[a-z]+)?")
+
+
+def _text(value):
+    return value.decode(errors='ignore')
+
+
+def _format_process(match):
+    return f"Process: {_text(match.group('process_name')).strip()}, PID: {_text(match.group('process_id'))}"
+
+
+def _format_connection(match):
+    local_ip, remote_ip, state = (_text(match.group(name)) for name in ("local_address", "remote_address", "state"))
+    return f"Connection: {local_ip} -> {remote_ip}, State: {state}"
+
+
+def _format_hex_key(match):
+    return f"Possible hex key: {_text(match.group())}"
+
+
+def _format_base64_key(match):
+    return f"Possible base64 key: {_text(match.group())}"
+
+
+def _format_deleted_file(match):
+    return f"Possible deleted file: {_text(match.group())}"
+
+
+def _count_findings(findings):
+    """
+    Report lines for (offset, line) findings, one per distinct line with its
+    occurrences, counted in bounded memory.
+    """
+    counter = string_counter.FrequencyCounter()
+    for offset, line in findings:
+        counter.add(line, offset)
+    return [format_finding(*item) for item in counter.items()]
+
+
+def count_malicious_patterns(ram_data, window=None):
+    """
+    Count occurrences of each signature rule in the RAM data.
+    """
+    start, end = window if window is not None else (0, len(ram_data))
+    counts = {}
+    for _, rule_id, _ in load_rules().scan(
+        ram_data, max(0, start - WINDOW_OVERLAP), min(end + WINDOW_OVERLAP, len(ram_data)), start, end
+    ):
+        counts[rule_id] = counts.get(rule_id, 0) + 1
+    return counts
+
+
+def format_malicious_patterns(counts):
+    return [f"Detected {name}: {count} occurrences" for name, count in counts.items()]
+
+
+def format_rule_hits(summary, metadata):
+    """
+    Report lines for matched rules, from a findings store kind summary and
+    the rules' metadata.
+    """
+    lines = []
+    for rule_id, (count, first_offset, last_offset) in summary.items():
+        line = f"Detected {rule_id}: {count} occurrences, first at {first_offset:#x}, last at {last_offset:#x}"
+        meta = metadata.get(rule_id) or {}
+        details = [str(meta[key]) for key in ("severity", "description") if meta.get(key)]
+        if meta.get("pack") and meta["pack"] != "builtin":
+            details.append(f"pack {meta['pack']}")
+        lines.append(line + (f" ({'; '.join(details)})" if details else ""))
+    return lines
 
 
-def detect_malicious_patterns(ram_data):
+def detect_malicious_patterns(ram_data, window=None):
     """
     Detect malicious patterns in the RAM data.
     """
-    malicious_patterns = []
     try:
-        # Define known malicious patterns or signatures
-        signatures = {
-            "Reverse Shell": rb"bash -i >& /dev/tcp/\d+\.\d+\.\d+\.\d+/\d+ 0>&1",
-            "Keylogger": rb"KeyLogger",
-            "Malware Signature 1": rb"malicious_payload",
-            "Encoded Commands": rb"base64 -d",
-            "Suspicious Script": rb"eval\(.+\)",
-            "Unauthorized Network Activity": rb"curl http://|wget http://",
-        }
-
-        # Search for these patterns in the RAM data
-        for name, pattern in signatures.items():
-            matches = re.findall(pattern, ram_data)
-            if matches:
-                malicious_patterns.append(f"Detected {name}: {len(matches)} occurrences")
-        
-        return malicious_patterns
+        return format_malicious_patterns(count_malicious_patterns(ram_data, window))
     except Exception as e:
         return [f"Error detecting malicious patterns: {str(e)}"]
 
 
-def extract_processes(ram_data):
+def extract_processes(ram_data, window=None):
     """
     Extract process information from RAM data, looking for known signatures of processes.
+    Each distinct process is listed once, with its occurrences and offsets.
     """
-    processes = []
     try:
-        process_pattern = re.compile(r"\x00([\w\s]+)\x00\s*(\d+)\s*")
-        matches = process_pattern.findall(ram_data.decode(errors='ignore'))
-        for match in matches:
-            process_name, process_id = match
-            processes.append(f"Process: {process_name.strip()}, PID: {process_id}")
-        return processes
+        return _count_findings(
+            (match.start(), _format_process(match)) for match in _finditer(PROCESS_PATTERN, ram_data, window)
+        )
     except Exception as e:
         return [f"Error extracting processes: {str(e)}"]
 
 
-def extract_network_connections(ram_data):
+def extract_network_connections(ram_data, window=None):
     """
     Extract active network connections from RAM data.
     """
-    network_connections = []
     try:
-        netstat_pattern = re.compile(r"(\d+\.\d+\.\d+\.\d+:\d+)\s+(\d+\.\d+\.\d+\.\d+:\d+)\s+(ESTABLISHED|LISTEN)")
-        matches = netstat_pattern.findall(ram_data.decode(errors='ignore'))
-        for match in matches:
-            local_ip, remote_ip, state = match
-            network_connections.append(f"Connection: {local_ip} -> {remote_ip}, State: {state}")
-        return network_connections
+        return _count_findings(
+            (match.start(), _format_connection(match)) for match in _finditer(NETSTAT_PATTERN, ram_data, window)
+        )
     except Exception as e:
         return [f"Error extracting network connections: {str(e)}"]
 
 
-def search_for_hidden_data(ram_data):
+def search_for_hidden_data(ram_data, window=None):
     """
     Search for hidden data, such as encryption keys, passwords, or other sensitive information.
     """
     hidden_data = []
     try:
-        hex_pattern = re.compile(r"\b([a-f0-9]{32,64})\b")
-        base64_pattern = re.compile(r"[A-Za-z0-9+/=]{16,}")
-        hex_matches = hex_pattern.findall(ram_data.decode(errors='ignore'))
-        for match in hex_matches:
-            hidden_data.append(f"Possible hex key: {match}")
-        base64_matches = base64_pattern.findall(ram_data.decode(errors='ignore'))
-        for match in base64_matches:
-            hidden_data.append(f"Possible base64 key: {match}")
+        hidden_data.extend(_count_findings(
+            (match.start(), _format_hex_key(match)) for match in _finditer(HEX_KEY_PATTERN, ram_data, window)
+        ))
+        hidden_data.extend(_count_findings(
+            (match.start(), _format_base64_key(match)) for match in _finditer(BASE64_KEY_PATTERN, ram_data, window)
+        ))
         return hidden_data
     except Exception as e:
         return [f"Error searching for hidden data: {str(e)}"]
 
 
-def search_for_deleted_files(ram_data):
+def search_for_deleted_files(ram_data, window=None):
     """
-    Search for remnants of deleted files in RAM.
+    Search for remnants of deleted files in RAM, one line per distinct path.
     """
-    deleted_files = []
     try:
-        deleted_file_pattern = re.compile(r"/[^/]+/[A-Za-z0-9]+(?:\.[a-z]+)?")
-        matches = deleted_file_pattern.findall(ram_data.decode(errors='ignore'))
-        for match in matches:
-            deleted_files.append(f"Possible deleted file: {match}")
-        return deleted_files
+        return _count_findings(
+            (match.start(), _format_deleted_file(match)) for match in _finditer(DELETED_FILE_PATTERN, ram_data, window)
+        )
     except Exception as e:
         return [f"Error searching for deleted files: {str(e)}"]
+
+
+# Single-pass scanner
+#
+# Every token analyzer needs printable text, so one sweep finds runs of it
+# (joined across single NUL bytes, which process entries use as separators) and
+# skips zero pages and binary data at regex-engine speed. Inside each run a
+# single alternation of all token patterns, compiled without capturing groups,
+# tells whether the run holds any token at all; most runs hold none. In a run
+# that does, each owner's pattern is matched on its own, so every analyzer sees
+# exactly the matches its own pattern finds, even where they overlap another
+# analyzer's. Signatures are matched over the whole window by one alternation
+# of their own: the leading bytes of every signature let the regex engine skip
+# ahead between candidates.
+CANDIDATE_PATTERN = re.compile(rb"[\x09-\x0d\x20-\x7e]{3,}(?:\x00[\x09-\x0d\x20-\x7e]+)*")
+# A run of three printable bytes is too short for any token, but still has to
+# be found so that a following NUL can join it to the next run.
+MIN_TOKEN_RUN = 4
+
+# A process entry is only seen when its name is at least three characters long.
+#
+# (kind, analyzer, pattern, formatter); hits at the same offset are yielded in
+# this order.
+TOKEN_ANALYZERS = (
+    ("connection", "network_connections", NETSTAT_PATTERN, _format_connection),
+    ("process", "processes", PROCESS_PATTERN, _format_process),
+    ("hex_key", "hidden_data", HEX_KEY_PATTERN, _format_hex_key),
+    ("deleted_file", "deleted_files", DELETED_FILE_PATTERN, _format_deleted_file),
+    ("base64_key", "hidden_data", BASE64_KEY_PATTERN, _format_base64_key),
+)
+TOKEN_OWNERS = {kind: (analyzer, formatter) for kind, analyzer, _, formatter in TOKEN_ANALYZERS}
+ANALYZER_NAMES = ("processes", "network_connections", "hidden_data", "deleted_files", "malicious_patterns")
+# Bump an analyzer's version when its output changes for any reason other than
+# its patterns (a formatter, say); pattern changes are picked up by analyzer_versions.
+ANALYZER_VERSIONS = {
+    "processes": 2,
+    "network_connections": 3,
+    "hidden_data": 3,
+    "deleted_files": 2,
+    "malicious_patterns": 2,
+    "high_entropy": 2,
+    "strings": 1,
+}
+
+
+def build_scanner(named_patterns):
+    """
+    Compile (kind, compiled pattern) pairs into one alternation without named
+    groups, or return None when there are none.
+    """
+    if not named_patterns:
+        return None
+    return re.compile(b"|".join(re.sub(rb"\(\?P<\w+>", b"(?:", pattern.pattern) for _, pattern in named_patterns))
+
+
+TOKEN_PATTERNS = tuple((kind, pattern) for kind, _, pattern, _ in TOKEN_ANALYZERS)
+TOKEN_SCANNER = build_scanner(TOKEN_PATTERNS)
+
+
+@lru_cache(maxsize=None)
+def scanners_for(analyzers):
+    """
+    (token patterns, token scanner) for a subset of ANALYZER_NAMES; the scanner
+    is None when no token analyzer is selected.
+    """
+    if set(analyzers) >= set(ANALYZER_NAMES):
+        return TOKEN_PATTERNS, TOKEN_SCANNER
+    token_patterns = tuple((kind, pattern) for kind, analyzer, pattern, _ in TOKEN_ANALYZERS if analyzer in analyzers)
+    return token_patterns, build_scanner(token_patterns)
+
+
+def _match_offset(hit):
+    return hit[0]
+
+
+def _pattern_hits(kind, pattern, ram_data, run_start, run_end):
+    for match in pattern.finditer(ram_data, run_start, run_end):
+        yield match.start(), kind, match
+
+
+def _scan_tokens(ram_data, scan_from, limit, start, end, patterns=TOKEN_PATTERNS, scanner=TOKEN_SCANNER):
+    for run in CANDIDATE_PATTERN.finditer(ram_data, scan_from, limit):
+        run_start, run_end = run.span()
+        if run_end <= start:
+            continue
+        if run_start >= end:
+            break
+        if run_end - run_start < MIN_TOKEN_RUN:
+            continue
+        # Back up one byte so a NUL-led process entry is matched whole.
+        run_start -= 1
+        if scanner.search(ram_data, run_start, run_end) is None:
+            continue
+        hits = [_pattern_hits(kind, pattern, ram_data, run_start, run_end) for kind, pattern in patterns]
+        for hit in heapq.merge(*hits, key=_match_offset):
+            if hit[0] >= end:
+                break
+            if hit[0] >= start:
+                yield hit
+
+
+def _scan_token_spans(ram_data, spans, scan_from, limit, start, end, patterns=TOKEN_PATTERNS, scanner=TOKEN_SCANNER):
+    """
+    _scan_tokens over the given spans only. Text runs end at a zero page, so
+    the tokens found are the same as those of a sweep over the whole range.
+    """
+    for span_start, span_end in spans:
+        if span_start < end and span_end > start:
+            yield from _scan_tokens(
+                ram_data, max(span_start, scan_from), min(span_end, limit), max(span_start, start), min(span_end, end),
+                patterns, scanner,
+            )
+
+
+def scan(ram_data, window=None, overlap=WINDOW_OVERLAP, spans=None, analyzers=None):
+    """
+    Match every analyzer pattern and signature over ram_data (or one window of
+    it) in a single pass. Yields (offset, kind, match) in offset order, where
+    kind is a TOKEN_ANALYZERS kind or a rule id; the match of a rule hit is
+    its formatted value (see rules.RuleSet.scan). If spans is given, the
+    token sweep only looks inside those (start, end) ranges. analyzers limits
+    the scan to the patterns of those analyzers.
+    """
+    start, end = window if window is not None else (0, len(ram_data))
+    scan_from = max(0, start - overlap)
+    limit = min(end + overlap, len(ram_data))
+    analyzers = ANALYZER_NAMES if analyzers is None else tuple(analyzers)
+    token_patterns, token_scanner = scanners_for(analyzers)
+    sweeps = []
+    if token_scanner is not None and spans is None:
+        sweeps.append(metrics.timed_iter(
+            _scan_tokens(ram_data, scan_from, limit, start, end, token_patterns, token_scanner), "scan.tokens"
+        ))
+    elif token_scanner is not None:
+        sweeps.append(metrics.timed_iter(
+            _scan_token_spans(ram_data, spans, scan_from, limit, start, end, token_patterns, token_scanner),
+            "scan.tokens",
+        ))
+    if "malicious_patterns" in analyzers:
+        sweeps.append(metrics.timed_iter(load_rules().scan(ram_data, scan_from, limit, start, end), "scan.rules"))
+    return heapq.merge(*sweeps, key=_match_offset)
+
+
+def new_results():
+    """
+    Empty results: one list of report lines per token analyzer, plus
+    signature occurrence counts under "malicious_patterns".
+    """
+    results = {name: [] for name in ANALYZER_NAMES}
+    results["malicious_patterns"] = {}
+    return results
+
+
+def format_hits(hits):
+    """
+    Turn scanner hits into (offset, kind, line) records. Token hits are formatted
+    by their analyzer; rule hits already carry theirs.
+    """
+    for offset, kind, match in hits:
+        owner = TOKEN_OWNERS.get(kind)
+        yield offset, kind, owner[1](match) if owner else match
+
+
+def emit(sink, records):
+    """
+    Stream records into a findings sink as (analyzer, kind, offset, value)
+    findings; signature hits are findings of "malicious_patterns".
+    """
+    for offset, kind, line in records:
+        owner = TOKEN_OWNERS.get(kind)
+        sink.add(owner[0] if owner else "malicious_patterns", kind, offset, line)
+
+
+def collect(results, records):
+    """
+    Dispatch records to the analyzers that own them.
+    """
+    signature_counts = results["malicious_patterns"]
+    for _, kind, line in records:
+        owner = TOKEN_OWNERS.get(kind)
+        if owner is None:
+            signature_counts[kind] = signature_counts.get(kind, 0) + 1
+        else:
+            results[owner[0]].append(line)
+    return results
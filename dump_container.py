@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import zlib
+import struct
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+# Compressed dump container (.cimg)
+#
+#   header   MAGIC, block size, codec id
+#   blocks   each BLOCK_SIZE bytes of the image compressed on its own; all-zero
+#            blocks are not stored at all
+#   index    zlib-compressed (offset, length, kind) entry per block
+#   metadata JSON: image size, block size, codec, SHA-256 of the image
+#   footer   index offset and length, metadata length, image size, MAGIC
+#
+# Since every block can be decompressed on its own, a reader can serve any byte
+# range of the image by decompressing only the blocks it covers.
+MAGIC = b"DFCDUMP1"
+EXTENSION = ".cimg"
+BLOCK_SIZE = 64 * 1024
+# Blocks are compressed COMPRESS_BATCH at a time across COMPRESS_WORKERS threads;
+# zlib, zstd and lz4 all release the GIL while compressing.
+COMPRESS_BATCH = 64
+COMPRESS_WORKERS = os.cpu_count() or 1
+CACHE_BLOCKS = 512
+
+HEADER = struct.Struct("<8sIB")
+ENTRY = struct.Struct("<QIB")
+FOOTER = struct.Struct("<QIIQ8s")
+
+ZERO_BLOCK, STORED_BLOCK, COMPRESSED_BLOCK = 0, 1, 2
+
+ZLIB, ZSTD, LZ4 = 1, 2, 3
+CODEC_NAMES = {ZLIB: "zlib", ZSTD: "zstd", LZ4: "lz4"}
+
+
+def available_codecs():
+    """
+    Codec ids that can be used here, best first.
+    """
+    codecs = []
+    if zstandard is not None:
+        codecs.append(ZSTD)
+    if lz4 is not None:
+        codecs.append(LZ4)
+    codecs.append(ZLIB)
+    return codecs
+
+
+def _compressor(codec):
+    if codec == ZSTD:
+        return lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == LZ4:
+        return lambda data: lz4.block.compress(data, store_size=True)
+    return lambda data: zlib.compress(data, 1)
+
+
+def _decompressor(codec):
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("this dump is zstd-compressed; install the zstandard package to read it")
+        return lambda data: zstandard.ZstdDecompressor().decompress(data)
+    if codec == LZ4:
+        if lz4 is None:
+            raise RuntimeError("this dump is lz4-compressed; install the lz4 package to read it")
+        return lz4.block.decompress
+    return zlib.decompress
+
+
+def is_container(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class ContainerWriter:
+    """
+    Writes an image into the container format through a binary writer such as
+    integrity.HashingWriter. size counts image bytes written so far, so it can be
+    used as a file offset into the image.
+    """
+
+    def __init__(self, output, block_size=BLOCK_SIZE, codec=None, workers=COMPRESS_WORKERS):
+        self.output = output
+        self.block_size = block_size
+        self.codec = codec or available_codecs()[0]
+        self.size = 0
+        self._compress = _compressor(self.codec)
+        self._zero = bytes(block_size)
+        self._pending = bytearray()
+        self._blocks = []
+        self._index = []
+        self._position = HEADER.size
+        self._sha256 = hashlib.sha256()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        output.write(HEADER.pack(MAGIC, block_size, self.codec))
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        self._pending += data
+        whole = len(self._pending) - len(self._pending) % self.block_size
+        for start in range(0, whole, self.block_size):
+            self._blocks.append(bytes(self._pending[start:start + self.block_size]))
+        del self._pending[:whole]
+        if len(self._blocks) >= COMPRESS_BATCH:
+            self._flush_blocks()
+        return len(data)
+
+    def _encode(self, block):
+        if block == self._zero[:len(block)]:
+            return ZERO_BLOCK, b""
+        compressed = self._compress(block)
+        if len(compressed) >= len(block):
+            return STORED_BLOCK, block
+        return COMPRESSED_BLOCK, compressed
+
+    def _flush_blocks(self):
+        for kind, data in self._executor.map(self._encode, self._blocks):
+            self._index.append(ENTRY.pack(self._position if data else 0, len(data), kind))
+            if data:
+                self.output.write(data)
+                self._position += len(data)
+        self._blocks = []
+
+    def close(self):
+        """
+        Write the last block, the index, the metadata and the footer.
+        """
+        if self._pending:
+            self._blocks.append(bytes(self._pending))
+            self._pending = bytearray()
+        self._flush_blocks()
+        self._executor.shutdown()
+        index = zlib.compress(b"".join(self._index))
+        metadata = json.dumps({
+            "size": self.size,
+            "block_size": self.block_size,
+            "codec": CODEC_NAMES[self.codec],
+            "sha256": self._sha256.hexdigest(),
+        }).encode()
+        self.output.write(index)
+        self.output.write(metadata)
+        self.output.write(FOOTER.pack(self._position, len(index), len(metadata), self.size, MAGIC))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # After a failure, what was written so far is still finished into a readable container.
+        try:
+            self.close()
+        finally:
+            self._executor.shutdown()
+
+
+class ContainerReader:
+    """
+    Random-access reader over a container image. Behaves like a read-only file
+    (read, seek, tell) and like a bytes buffer for slicing and len(); only the
+    blocks a read covers are decompressed, with recently used blocks cached.
+    """
+
+    def __init__(self, path, cache_blocks=CACHE_BLOCKS):
+        self.path = path
+        self._file = open(path, "rb")
+        magic, self.block_size, self.codec = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compressed dump container")
+        self._file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, index_length, metadata_length, self.size, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is incomplete: the capture did not finish writing it")
+        self._file.seek(index_offset)
+        index = zlib.decompress(self._file.read(index_length))
+        self._index = [ENTRY.unpack_from(index, position) for position in range(0, len(index), ENTRY.size)]
+        self.metadata = json.loads(self._file.read(metadata_length))
+        self._decompress = _decompressor(self.codec)
+        self._cache = OrderedDict()
+        self._cache_blocks = cache_blocks
+        self._position = 0
+
+    def __len__(self):
+        return self.size
+
+    def _block(self, number):
+        if number in self._cache:
+            self._cache.move_to_end(number)
+            return self._cache[number]
+        offset, length, kind = self._index[number]
+        block_length = min(self.block_size, self.size - number * self.block_size)
+        if kind == ZERO_BLOCK:
+            block = bytes(block_length)
+        else:
+            self._file.seek(offset)
+            block = self._file.read(length)
+            if kind == COMPRESSED_BLOCK:
+                block = self._decompress(block)
+        self._cache[number] = block
+        if len(self._cache) > self._cache_blocks:
+            self._cache.popitem(last=False)
+        return block
+
+    def read_range(self, start, end):
+        """
+        Return image bytes [start, end), clipped to the image.
+        """
+        start, end = max(0, start), min(end, self.size)
+        if start >= end:
+            return b""
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        data = b"".join(self._block(number) for number in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            data = self.read_range(start, stop)
+            return data if step == 1 else data[::step]
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("container index out of range")
+        return self.read_range(key, key + 1)[0]
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else self._position + size
+        data = self.read_range(self._position, end)
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack(image_path, container_path, block_size=BLOCK_SIZE, codec=None):
+    """
+    Convert a raw dump into a container, recording the container in the case manifest.
+    """
+    import integrity
+    try:
+        with open(image_path, "rb") as image, integrity.HashingWriter(container_path) as output:
+            with ContainerWriter(output, block_size, codec) as container:
+                for chunk in iter(lambda: image.read(COMPRESS_BATCH * block_size), b""):
+                    container.write(chunk)
+        integrity.record_artifact(output)
+        ratio = output.size / container.size if container.size else 1.0
+        return f"Packed {image_path} into {container_path}: {container.size} -> {output.size} bytes ({ratio:.1%})"
+    except Exception as e:
+        return f"Error packing dump: {str(e)}"
+
+
+def unpack(container_path, image_path):
+    """
+    Write a container's image back out as a raw dump, checking its SHA-256.
+    """
+    try:
+        sha256 = hashlib.sha256()
+        with ContainerReader(container_path) as reader, open(image_path, "wb") as image:
+            for chunk in iter(lambda: reader.read(COMPRESS_BATCH * reader.block_size), b""):
+                sha256.update(chunk)
+                image.write(chunk)
+        if sha256.hexdigest() != reader.metadata["sha256"]:
+            return f"Error unpacking dump: SHA-256 of {image_path} does not match the container"
+        return f"Unpacked {container_path} into {image_path}"
+    except Exception as e:
+        return f"Error unpacking dump: {str(e)}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("pack", "unpack"):
+        print(f"Usage: {sys.argv[0]} pack <image> <container> | unpack <container> <image>")
+        sys.exit(1)
+    print((pack if sys.argv[1] == "pack" else unpack)(sys.argv[2], sys.argv[3]))
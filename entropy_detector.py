@@ -0,0 +1,154 @@
+import math
+from collections import Counter
+from functools import lru_cache
+
+import setting
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# High-entropy region detector
+#
+# The dump is cut into BLOCK_SIZE blocks, read BATCH_BLOCKS at a time. For every
+# block the Shannon entropy (bits per byte) and the chi-square statistic of its
+# byte histogram against a uniform one are computed; blocks at or above
+# ENTROPY_THRESHOLD are flagged, and runs of flagged blocks are reported as one
+# region. Random data of BLOCK_SIZE bytes scores about 7.8, compressed data a
+# little less, code around 6 and text below 5.
+#
+# Ciphertext and compressed data have close to half of their bytes at 0x80 or
+# above, so blocks outside HIGH_BYTE_BAND are dropped after one cheap count,
+# before any histogram is built. With NumPy every step runs on whole batches.
+BLOCK_SIZE = 1024
+BATCH_BLOCKS = 4096
+ENTROPY_THRESHOLD = 7.2
+HIGH_BYTE_BAND = (0.25, 0.75)
+# Uniform bytes give a chi-square of about 255 (255 degrees of freedom, standard
+# deviation about 22.6); compressed data stays well above that.
+RANDOM_CHI_SQUARE = 350.0
+
+LOW_BYTES = bytes(range(0x80))
+
+
+def detector_settings():
+    """
+    Block size and entropy threshold, from the "entropy_block_size" and
+    "entropy_threshold" settings when present.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    block_size = int(settings.get("entropy_block_size", BLOCK_SIZE))
+    threshold = float(settings.get("entropy_threshold", ENTROPY_THRESHOLD))
+    return max(256, block_size), threshold
+
+
+@lru_cache(maxsize=None)
+def _count_log_counts(size):
+    return [0.0] + [count * math.log2(count) for count in range(1, size + 1)]
+
+
+def _block_statistics(block):
+    size = len(block)
+    expected = size / 256
+    counts = Counter(block).values()
+    entropy = math.log2(size) - sum(map(_count_log_counts(size).__getitem__, counts)) / size
+    chi_square = sum((count - expected) ** 2 for count in counts) / expected + (256 - len(counts)) * expected
+    return entropy, chi_square
+
+
+def block_statistics(data, block_size=BLOCK_SIZE):
+    """
+    (block, entropy, chi_square) for every whole block of data that passes the
+    high-byte prefilter; block is the block number within data.
+    """
+    blocks = len(data) // block_size
+    low, high = HIGH_BYTE_BAND[0] * block_size, HIGH_BYTE_BAND[1] * block_size
+    if numpy is None:
+        statistics = []
+        for block in range(blocks):
+            chunk = data[block * block_size:(block + 1) * block_size]
+            if low <= len(chunk.translate(None, LOW_BYTES)) <= high:
+                statistics.append((block, *_block_statistics(chunk)))
+        return statistics
+
+    array = numpy.frombuffer(data, numpy.uint8, blocks * block_size).reshape(blocks, block_size)
+    high_bytes = numpy.count_nonzero(array >= 0x80, axis=1)
+    candidates = numpy.flatnonzero((high_bytes >= low) & (high_bytes <= high))
+    if not len(candidates):
+        return []
+    # One bincount over all candidate blocks, each shifted into its own 256 bins.
+    bins = array[candidates].astype(numpy.intp) + (numpy.arange(len(candidates)) * 256)[:, None]
+    counts = numpy.bincount(bins.ravel(), minlength=len(candidates) * 256).reshape(len(candidates), 256)
+    probabilities = counts / block_size
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        entropies = -numpy.nansum(probabilities * numpy.log2(probabilities), axis=1)
+    expected = block_size / 256
+    chi_squares = ((counts - expected) ** 2).sum(axis=1) / expected
+    return list(zip(candidates.tolist(), entropies.tolist(), chi_squares.tolist()))
+
+
+class _Region:
+    def __init__(self, start, entropy, chi_square, block_size):
+        self.start = start
+        self.end = start + block_size
+        self.entropies = [entropy]
+        self.chi_squares = [chi_square]
+
+    def extend(self, entropy, chi_square, block_size):
+        self.end += block_size
+        self.entropies.append(entropy)
+        self.chi_squares.append(chi_square)
+
+    def result(self):
+        chi_square = sum(self.chi_squares) / len(self.chi_squares)
+        return {
+            "start": self.start,
+            "end": self.end,
+            "entropy": sum(self.entropies) / len(self.entropies),
+            "max_entropy": max(self.entropies),
+            "chi_square": chi_square,
+            "kind": "encrypted or random" if chi_square <= RANDOM_CHI_SQUARE else "compressed",
+        }
+
+
+def find_high_entropy_regions(ram_data, block_size=None, threshold=None, start=0, end=None):
+    """
+    High-entropy regions of an open dump (a mapped dump or a container reader)
+    between byte offsets start and end. Returns a list of dicts with start, end,
+    mean and max entropy, mean chi-square and a kind guess, in offset order.
+    """
+    default_block_size, default_threshold = detector_settings()
+    block_size = block_size or default_block_size
+    threshold = default_threshold if threshold is None else threshold
+    end = len(ram_data) if end is None else min(end, len(ram_data))
+    batch_size = BATCH_BLOCKS * block_size
+    regions = []
+    region = None
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(batch_start + batch_size, end)
+        # A copy of the batch, so no buffer export keeps a mapped dump from closing.
+        data = ram_data[batch_start:batch_end]
+        for block, entropy, chi_square in block_statistics(data, block_size):
+            if entropy < threshold:
+                continue
+            offset = batch_start + block * block_size
+            if region is not None and region.end == offset:
+                region.extend(entropy, chi_square, block_size)
+            else:
+                if region is not None:
+                    regions.append(region.result())
+                region = _Region(offset, entropy, chi_square, block_size)
+    if region is not None:
+        regions.append(region.result())
+    return regions
+
+
+def format_region(region):
+    return (
+        f"{region['start']:#010x}-{region['end']:#010x} ({region['end'] - region['start']} bytes): "
+        f"entropy {region['entropy']:.2f} (max {region['max_entropy']:.2f}), "
+        f"chi-square {region['chi_square']:.0f}, {region['kind']}"
+    )
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+import io
+import os
+import re
+import sys
+import time
+import shlex
+import random
+import tarfile
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Fake adb client for benchmarks
+#
+# Stands in for `adb` with one simulated rooted device whose physical memory is
+# a dump file. It understands what the capture and acquisition code sends:
+# `devices`, `get-state`, `get-serialno`, `exec-out` and `shell` (one-shot, or
+# an interactive session speaking adb_session's framing), and a small set of
+# device commands (dd over /dev/mem, /proc/iomem, dumpsys, ps, screencap, tar
+# of /data/data/<package>, ...). Every package's data directory holds
+# FAKE_ADB_APP_FILES generated files, the same ones on every run.
+#
+# Every adb invocation, and every command run in a shell session, first waits
+# FAKE_ADB_LATENCY_MS. Output is paced to FAKE_ADB_BANDWIDTH_MB megabytes per
+# second shared by all fake adb processes, the way parallel streams share one
+# USB link: each PACE_CHUNK reserves the next free slot on the link in a state
+# file under an exclusive lock. Without fcntl each process is paced on its own.
+#
+# Environment:
+#   FAKE_ADB_DUMP          dump file served as /dev/mem (required for RAM capture)
+#   FAKE_ADB_SERIAL        device serial (default emulator-5554)
+#   FAKE_ADB_LATENCY_MS    per-command latency in milliseconds (default 5)
+#   FAKE_ADB_BANDWIDTH_MB  link bandwidth in MB/s, 0 for unlimited (default 40)
+#   FAKE_ADB_TIME_SCALE    factor applied to screenrecord's time limit (default 0.05)
+#   FAKE_ADB_APP_FILES     files in each package's data directory (default 500)
+#   FAKE_ADB_STATE         link state file (default in the temp directory)
+DEFAULT_SERIAL = "emulator-5554"
+DEFAULT_LATENCY_MS = 5.0
+DEFAULT_BANDWIDTH_MB = 40.0
+DEFAULT_TIME_SCALE = 0.05
+DEFAULT_APP_FILES = 500
+APP_DIRS = ("databases", "shared_prefs", "files", "cache")
+APP_FILE_SIZES = (512, 64 * 1024)
+PACE_CHUNK = 256 * 1024
+READ_CHUNK = 1024 * 1024
+SCREENSHOT_SIZE = 1536 * 1024
+SCREEN_RECORD_SIZE = 4 * 1024 * 1024
+
+SESSION_FRAME = re.compile(
+    r"^\( (?P<command>.*) \) </dev/null; printf '\\n%s %d\\n' (?P<token>\w+) \$\?; printf '\\n%s\\n' (?P=token) >&2$"
+)
+
+
+class Link:
+    """
+    Bandwidth-limited writes, paced against the shared link state.
+    """
+
+    def __init__(self, bandwidth_mb, state_path):
+        self.bytes_per_second = bandwidth_mb * 1024 * 1024
+        self.state_path = state_path
+        self._next_free = 0.0
+
+    def _reserve(self, size):
+        duration = size / self.bytes_per_second
+        if fcntl is None:
+            start = max(time.time(), self._next_free)
+            self._next_free = start + duration
+            return self._next_free
+        state = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(state, fcntl.LOCK_EX)
+            raw = os.read(state, 64)
+            start = max(time.time(), float(raw) if raw else 0.0)
+            os.lseek(state, 0, os.SEEK_SET)
+            os.ftruncate(state, 0)
+            os.write(state, repr(start + duration).encode())
+        finally:
+            # Closing the descriptor releases the lock.
+            os.close(state)
+        return start + duration
+
+    def send(self, stream, data):
+        for position in range(0, len(data), PACE_CHUNK):
+            piece = data[position:position + PACE_CHUNK]
+            if self.bytes_per_second > 0:
+                delay = self._reserve(len(piece)) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            stream.write(piece)
+        stream.flush()
+
+
+class LinkStream:
+    """
+    File-like writer sending through the link in PACE_CHUNK pieces, for
+    output produced in small writes (tar records).
+    """
+
+    def __init__(self, link, stream):
+        self.link = link
+        self.stream = stream
+        self._pending = bytearray()
+
+    def write(self, data):
+        self._pending += data
+        if len(self._pending) >= PACE_CHUNK:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._pending:
+            self.link.send(self.stream, bytes(self._pending))
+            self._pending.clear()
+
+
+class Device:
+    """
+    The simulated device: runs one shell command line, writing its stdout
+    through the link and returning (return_code, stderr).
+    """
+
+    def __init__(self, environment):
+        self.dump_path = environment.get("FAKE_ADB_DUMP")
+        self.serial = environment.get("FAKE_ADB_SERIAL", DEFAULT_SERIAL)
+        self.time_scale = float(environment.get("FAKE_ADB_TIME_SCALE", DEFAULT_TIME_SCALE))
+        self.app_files = int(environment.get("FAKE_ADB_APP_FILES", DEFAULT_APP_FILES))
+        self.latency = float(environment.get("FAKE_ADB_LATENCY_MS", DEFAULT_LATENCY_MS)) / 1000
+        state_path = environment.get("FAKE_ADB_STATE") or os.path.join(tempfile.gettempdir(), "fake_adb.link")
+        self.link = Link(float(environment.get("FAKE_ADB_BANDWIDTH_MB", DEFAULT_BANDWIDTH_MB)), state_path)
+
+    def wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def memory_size(self):
+        return os.path.getsize(self.dump_path) if self.dump_path else 0
+
+    def send_text(self, stdout, text):
+        self.link.send(stdout, text.encode())
+        return 0, ""
+
+    def send_file_range(self, stdout, offset, size):
+        if not self.dump_path:
+            return 1, "dd: /dev/mem: No such device\n"
+        with open(self.dump_path, "rb") as dump:
+            dump.seek(offset)
+            remaining = size
+            while remaining > 0:
+                chunk = dump.read(min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                self.link.send(stdout, chunk)
+                remaining -= len(chunk)
+        return 0, ""
+
+    def send_random(self, stdout, size, seed, header=b""):
+        rng = random.Random(seed)
+        self.link.send(stdout, header + rng.randbytes(size - len(header)))
+        return 0, ""
+
+    def run(self, command_line, stdout, root=False):
+        pipeline = [part.strip() for part in command_line.split(" | ")]
+        try:
+            args = shlex.split(pipeline[0])
+        except ValueError as e:
+            return 2, f"sh: {e}\n"
+        if len(pipeline) > 1:
+            return self._pipe_to_grep(args, pipeline[1:], stdout, root)
+        return self._run_args(args, stdout, root)
+
+    def _pipe_to_grep(self, args, filters, stdout, root):
+        class Capture:
+            def __init__(self):
+                self.chunks = []
+
+            def write(self, data):
+                self.chunks.append(data)
+
+            def flush(self):
+                pass
+
+        captured = Capture()
+        return_code, stderr = self._run_args(args, captured, root)
+        lines = b"".join(captured.chunks).decode(errors="replace").splitlines()
+        for stage in filters:
+            grep_args = shlex.split(stage)
+            if not grep_args or grep_args[0] != "grep":
+                return 127, f"sh: {grep_args[0] if grep_args else ''}: not found\n"
+            pattern = re.compile(grep_args[-1])
+            lines = [line for line in lines if pattern.search(line)]
+        self.send_text(stdout, "".join(line + "\n" for line in lines))
+        return return_code if lines else 1, stderr
+
+    def _run_args(self, args, stdout, root):
+        # Redirections of stderr are accepted and ignored.
+        args = [arg for arg in args if arg not in ("2>/dev/null", "2>&1")]
+        if not args:
+            return 0, ""
+        program, arguments = args[0], args[1:]
+        if program == "su":
+            if arguments[:1] == ["-c"] and len(arguments) > 1:
+                return self.run(" ".join(arguments[1:]), stdout, root=True)
+            return 1, "su: interactive shells are not supported\n"
+        if program == "dd":
+            return self._dd(arguments, stdout, root)
+        if program == "cat":
+            return self._cat(arguments, stdout, root)
+        if program == "tar":
+            return self._tar(arguments, stdout, root)
+        if program == "screencap":
+            return self.send_random(stdout, SCREENSHOT_SIZE, "screencap", b"\x89PNG\r\n\x1a\n")
+        if program == "screenrecord":
+            time_limit = float(arguments[arguments.index("--time-limit") + 1]) if "--time-limit" in arguments else 180
+            time.sleep(time_limit * self.time_scale)
+            return 0, ""
+        output = self._text_output(program, arguments)
+        if output is None:
+            return 127, f"/system/bin/sh: {program}: not found\n"
+        return_code, text = output
+        if return_code:
+            return return_code, text
+        return self.send_text(stdout, text)
+
+    def _dd(self, arguments, stdout, root):
+        options = dict(argument.split("=", 1) for argument in arguments if "=" in argument)
+        if options.get("if") != "/dev/mem":
+            return 1, f"dd: {options.get('if', 'stdin')}: unsupported in the fake device\n"
+        if not root:
+            return 1, "dd: /dev/mem: Permission denied\n"
+        block = int(options.get("bs", 512))
+        offset = int(options.get("skip", 0)) * block
+        size = self.memory_size() - offset
+        if "count" in options:
+            size = min(size, int(options["count"]) * block)
+        if "of" in options:
+            return 0, ""
+        return self.send_file_range(stdout, offset, max(0, size))
+
+    def _cat(self, arguments, stdout, root):
+        path = arguments[0] if arguments else ""
+        if path == "/proc/iomem":
+            size = self.memory_size()
+            if not root or not size:
+                # Without root the kernel hides the addresses.
+                return self.send_text(stdout, "00000000-00000000 : System RAM\n")
+            return self.send_text(stdout, (
+                f"00000000-{size - 1:08x} : System RAM\n"
+                f"  00080000-{min(size, 0x1000000) - 1:08x} : Kernel code\n"
+                f"{max(size, 0x10000000):08x}-{max(size, 0x10000000) + 0xfff:08x} : serial\n"
+            ))
+        if path == "/sdcard/ram_dump.img":
+            return self.send_file_range(stdout, 0, self.memory_size())
+        if path == "/sdcard/screen_record.mp4":
+            return self.send_random(stdout, SCREEN_RECORD_SIZE, "screenrecord", b"\x00\x00\x00\x18ftypmp42")
+        return 1, f"cat: {path}: No such file or directory\n"
+
+    def _tar(self, arguments, stdout, root):
+        """
+        `tar -cf - -C /data/data [--exclude=PATTERN ...] PACKAGE ...` over
+        generated app data directories.
+        """
+        if arguments[:2] != ["-cf", "-"]:
+            return 1, "tar: only -cf - is supported in the fake device\n"
+        arguments = arguments[2:]
+        directory = "/"
+        if arguments[:1] == ["-C"] and len(arguments) > 1:
+            directory, arguments = arguments[1], arguments[2:]
+        excluded = tuple(argument.split("=", 1)[1] for argument in arguments if argument.startswith("--exclude="))
+        packages = [argument for argument in arguments if not argument.startswith("-")]
+        if directory.rstrip("/") != "/data/data" or not packages:
+            return 1, "tar: nothing to archive\n"
+        if not root:
+            return 1, f"tar: {packages[0]}: Permission denied\n"
+        output = LinkStream(self.link, stdout)
+        with tarfile.open(fileobj=output, mode="w|", format=tarfile.GNU_FORMAT) as archive:
+            for package in packages:
+                self._tar_package(archive, package, excluded)
+        output.flush()
+        stdout.flush()
+        return 0, ""
+
+    def _tar_package(self, archive, package, excluded):
+        rng = random.Random(package)
+        mtime = 1700000000 + rng.randrange(10 ** 7)
+        uid = 10000 + rng.randrange(300)
+
+        def entry(name, kind=tarfile.DIRTYPE, size=0, mode=0o771):
+            info = tarfile.TarInfo(name)
+            info.type, info.size, info.mode, info.uid, info.gid = kind, size, mode, uid, uid
+            info.mtime = mtime + rng.randrange(10 ** 6)
+            return info
+
+        archive.addfile(entry(package))
+        directories = [name for name in APP_DIRS if f"{package}/{name}" not in excluded]
+        for name in directories:
+            archive.addfile(entry(f"{package}/{name}"))
+        link = entry(f"{package}/lib", tarfile.SYMTYPE, mode=0o777)
+        link.linkname = f"/data/app/{package}-1/lib/arm64"
+        archive.addfile(link)
+        low, high = APP_FILE_SIZES
+        for index in range(self.app_files):
+            directory = directories[index % len(directories)] if directories else ""
+            # Mostly small files, as in real app data, with a few large ones.
+            size = int(low * (high / low) ** (rng.random() ** 2))
+            info = entry(f"{package}/{directory}/file{index}.dat".replace("//", "/"), tarfile.REGTYPE, size, 0o660)
+            archive.addfile(info, io.BytesIO(rng.randbytes(size)))
+
+    def _text_output(self, program, arguments):
+        """
+        (return code, stdout or stderr text) of the small text commands, or None.
+        """
+        command = " ".join([program, *arguments])
+        rng = random.Random(command)
+        if command == "dumpsys battery":
+            return 0, (
+                "Current Battery Service state:\n  AC powered: false\n  USB powered: true\n  level: 87\n  scale: 100\n"
+            )
+        if command.startswith("dumpsys window"):
+            return 0, "".join(
+                f"  Window #{index} Window{{{rng.getrandbits(28):07x} u0 com.example.app{index}/.Main}}:\n"
+                for index in range(40)
+            ) + (
+                "  mCurrentFocus=Window{1a2b3c u0 com.example.app0/.Main}\n"
+                "  mFocusedApp=ActivityRecord{4d5e6f u0 com.example.app0/.Main}\n"
+            )
+        if command.startswith("dumpsys"):
+            return 0, f"Can't find service: {arguments[0] if arguments else ''}\n"
+        if command == "netstat":
+            return 0, "Proto Recv-Q Send-Q Local Address Foreign Address State\n" + "".join(
+                f"tcp 0 0 10.0.0.{rng.randint(2, 250)}:{rng.randint(1024, 65535)} "
+                f"93.184.{rng.randint(0, 255)}.{rng.randint(1, 254)}:443 ESTABLISHED\n"
+                for _ in range(60)
+            )
+        if command == "ps" or command.startswith("ps "):
+            return 0, "USER PID PPID VSZ RSS WCHAN ADDR S NAME\n" + "".join(
+                f"u0_a{rng.randint(10, 300)} {pid} 612 {rng.randint(10 ** 6, 10 ** 7)} {rng.randint(10 ** 4, 10 ** 5)} "
+                f"0 0 S com.example.process{pid}\n"
+                for pid in range(1000, 1400)
+            )
+        if command == "wm size":
+            return 0, "Physical size: 1080x2400\n"
+        if command == "pm list features":
+            return 0, "".join(f"feature:android.hardware.feature{index}\n" for index in range(80))
+        if command == "service list":
+            return 0, "".join(f"{index}\tservice{index}: [android.os.IService{index}]\n" for index in range(150))
+        if command in ("ls /data/app", "ls /system/app"):
+            return 0, "".join(f"com.example.package{index}\n" for index in range(120))
+        if program == "ls" and arguments and arguments[0].startswith("/data/data/"):
+            return 0, "".join(f"file{index}.db\n" for index in range(8))
+        if program == "ls":
+            return 1, f"ls: {arguments[0] if arguments else ''}: No such file or directory\n"
+        if program == "getprop":
+            properties = {"ro.product.model": "Fake Device", "ro.build.version.release": "14"}
+            return 0, properties.get(arguments[0], "") + "\n" if arguments else ""
+        if program == "pidof":
+            return (0, f"{1000 + sum(map(ord, arguments[0])) % 400}\n") if arguments else (1, "")
+        return None
+
+
+def run_session(device, stdin, stdout, stderr):
+    """
+    An interactive `adb shell`: run each line, answering framed lines the way
+    adb_session's sentinels expect.
+    """
+    for raw_line in iter(stdin.readline, b""):
+        line = raw_line.decode(errors="replace").rstrip("\n")
+        if not line.strip():
+            continue
+        if line.strip() == "exit":
+            break
+        device.wait()
+        frame = SESSION_FRAME.match(line)
+        command = frame.group("command") if frame else line
+        return_code, error = device.run(command, stdout)
+        if error:
+            stderr.write(error.encode())
+        if frame:
+            token = frame.group("token")
+            stdout.write(f"\n{token} {return_code}\n".encode())
+            stdout.flush()
+            stderr.write(f"\n{token}\n".encode())
+        stderr.flush()
+    return 0
+
+
+def main(argv):
+    device = Device(os.environ)
+    stdout, stderr = sys.stdout.buffer, sys.stderr.buffer
+    args = list(argv)
+    if args[:1] == ["-s"] and len(args) > 1:
+        if args[1] != device.serial:
+            stderr.write(f"adb: device '{args[1]}' not found\n".encode())
+            return 1
+        args = args[2:]
+    device.wait()
+    if not args:
+        stderr.write(b"usage: adb [-s SERIAL] COMMAND\n")
+        return 1
+    command, arguments = args[0], args[1:]
+    if command == "version":
+        stdout.write(b"Android Debug Bridge version 1.0.41 (fake)\n")
+        return 0
+    if command == "devices":
+        detail = " usb:1-1.2 product:fake model:Fake_Device device:fake transport_id:1" if "-l" in arguments else ""
+        stdout.write(f"List of devices attached\n{device.serial}\tdevice{detail}\n\n".encode())
+        return 0
+    if command == "get-state":
+        stdout.write(b"device\n")
+        return 0
+    if command == "get-serialno":
+        stdout.write(f"{device.serial}\n".encode())
+        return 0
+    if command == "shell" and not arguments:
+        return run_session(device, sys.stdin.buffer, stdout, stderr)
+    if command in ("shell", "exec-out"):
+        return_code, error = device.run(" ".join(arguments), stdout)
+        stderr.write(error.encode())
+        return return_code
+    stderr.write(f"adb: unknown command {command}\n".encode())
+    return 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except BrokenPipeError:
+        # The reader went away (a capture was cancelled); exit quietly.
+        os._exit(1)
@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+MANIFEST_NAME = "integrity_manifest.json"
+HASH_ALGORITHMS = ("md5", "sha1", "sha256")
+# hashlib releases the GIL for buffers this large, so verify threads hash in parallel.
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+_manifest_lock = threading.Lock()
+
+
+class HashingWriter:
+    """
+    Binary file writer that updates MD5, SHA-1 and SHA-256 digests with every
+    write, so an artifact is hashed on its way to disk without being read back.
+    """
+
+    def __init__(self, path, buffering=-1):
+        self.path = path
+        self.size = 0
+        self._hashes = [hashlib.new(name) for name in HASH_ALGORITHMS]
+        self._file = open(path, "wb", buffering=buffering)
+
+    def write(self, data):
+        for digest in self._hashes:
+            digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def digests(self):
+        return {name: digest.hexdigest() for name, digest in zip(HASH_ALGORITHMS, self._hashes)}
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def hash_file(path):
+    """
+    Hash a file with every algorithm in HASH_ALGORITHMS in one read.
+    """
+    hashes = [hashlib.new(name) for name in HASH_ALGORITHMS]
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            size += len(chunk)
+            for digest in hashes:
+                digest.update(chunk)
+    return size, {name: digest.hexdigest() for name, digest in zip(HASH_ALGORITHMS, hashes)}
+
+
+def load_manifest(case_dir):
+    try:
+        with open(os.path.join(case_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"artifacts": {}}
+
+
+def artifact_entry(writer, partial=False):
+    """
+    Manifest entry (size, acquisition time and digests) for a closed HashingWriter.
+    A partial artifact (a failed or cut-short acquisition) is marked as such.
+    """
+    entry = {"size": writer.size, "acquired": datetime.now().isoformat(timespec="seconds")}
+    entry.update(writer.digests())
+    if partial:
+        entry["partial"] = True
+    return entry
+
+
+def record_artifacts(case_dir, entries):
+    """
+    Add {name: entry} to the manifest in case_dir with one rewrite. Names are
+    paths relative to case_dir, so artifacts in subdirectories can be listed.
+    """
+    with _manifest_lock:
+        manifest = load_manifest(case_dir)
+        manifest["artifacts"].update(entries)
+        manifest_path = os.path.join(case_dir, MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def record_artifact(writer, partial=False):
+    """
+    Add a closed HashingWriter's file, size and digests to the manifest in its directory.
+    """
+    entry = artifact_entry(writer, partial)
+    record_artifacts(os.path.dirname(os.path.abspath(writer.path)), {os.path.basename(writer.path): entry})
+    return entry
+
+
+def write_artifact(path, data):
+    """
+    Write bytes (or text, encoded as UTF-8) to path and record it in the manifest.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    with HashingWriter(path) as writer:
+        writer.write(data)
+    return record_artifact(writer)
+
+
+def _verify_entry(case_dir, name, entry):
+    path = os.path.join(case_dir, name)
+    if not os.path.exists(path):
+        return f"{name}: MISSING"
+    size, digests = hash_file(path)
+    if size != entry["size"] or any(digests[algorithm] != entry[algorithm] for algorithm in HASH_ALGORITHMS):
+        return f"{name}: MISMATCH"
+    return f"{name}: OK (partial)" if entry.get("partial") else f"{name}: OK"
+
+
+def verify_manifest(case_dir, workers=None):
+    """
+    Re-hash every artifact listed in a case's manifest in parallel and compare
+    the results with the recorded digests.
+    """
+    try:
+        artifacts = load_manifest(case_dir)["artifacts"]
+        if not artifacts:
+            return f"No artifacts recorded in {os.path.join(case_dir, MANIFEST_NAME)}."
+        with ThreadPoolExecutor(max_workers=workers or min(len(artifacts), os.cpu_count() or 1)) as executor:
+            lines = list(executor.map(lambda item: _verify_entry(case_dir, *item), artifacts.items()))
+        failed = sum(1 for line in lines if ": OK" not in line)
+        status = "passed" if not failed else f"failed for {failed} of {len(lines)} artifacts"
+        return f"Integrity verification {status}.\n" + "\n".join(lines)
+    except Exception as e:
+        return f"Error verifying integrity manifest: {str(e)}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <case_dir>")
+        sys.exit(1)
+    print(verify_manifest(sys.argv[1]))
@@ -0,0 +1,159 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import logs
+import setting
+
+# Capture and analysis jobs run on a pool of JOB_WORKERS threads (the
+# "job_workers" setting), so the GUI thread only submits jobs and receives
+# their progress and results. Cancellation is cooperative: a cancelled job stops
+# at the next progress report from the capture or analysis it is running.
+JOB_WORKERS = 2
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    One unit of work for the engine: a function called with the job itself,
+    which passes job.progress on as the progress callback of a capture or
+    analysis function and returns its result string.
+    """
+
+    def __init__(self, job_id, name, function, total=None):
+        self.id = job_id
+        self.name = name
+        self.function = function
+        self.total = total
+        self.state = "queued"
+        self.done = 0
+        self.started = None
+        self.result = None
+        self._cancel = threading.Event()
+        self.on_progress = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def status(self):
+        """
+        Snapshot of the job's progress: bytes done, percent and ETA (when the
+        total is known) and throughput.
+        """
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        rate = self.done / elapsed if elapsed else 0.0
+        status = {"id": self.id, "name": self.name, "state": self.state, "bytes": self.done,
+                  "total": self.total, "percent": None, "bytes_per_second": rate, "eta": None}
+        if self.total:
+            status["percent"] = min(100.0, 100.0 * self.done / self.total)
+            if rate:
+                status["eta"] = max(0.0, (self.total - self.done) / rate)
+        return status
+
+    def progress(self, bytes_done, bytes_per_second=None):
+        """
+        Progress callback with the (bytes, bytes_per_second) signature used by the
+        capture and analysis functions. Raises JobCancelled once the job is cancelled.
+        """
+        if self.cancelled:
+            raise JobCancelled(f"{self.name} cancelled")
+        self.done = bytes_done
+        if self.on_progress:
+            self.on_progress(self.status())
+
+
+class JobEngine:
+    """
+    Bounded worker pool for jobs. on_progress(status) and on_finished(status,
+    result) are called from worker threads.
+    """
+
+    def __init__(self, workers=None, on_progress=None, on_finished=None):
+        settings = setting.load_settings()
+        if not isinstance(settings, dict):
+            settings = {}
+        workers = workers or int(settings.get("job_workers", JOB_WORKERS))
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+
+    def submit(self, name, function, total=None):
+        """
+        Queue function(job) to run on the pool and return the Job.
+        """
+        job = Job(next(self._ids), name, function, total)
+        job.on_progress = self.on_progress
+        self.jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        with logs.context(job_id=job.id):
+            self._run_job(job)
+
+    def _run_job(self, job):
+        if job.cancelled:
+            job.state, job.result = "cancelled", f"{job.name} cancelled before it started."
+        else:
+            job.state = "running"
+            job.started = time.monotonic()
+            if self.on_progress:
+                self.on_progress(job.status())
+            try:
+                job.result = job.function(job)
+                job.state = "cancelled" if job.cancelled else "done"
+            except JobCancelled as e:
+                job.state, job.result = "cancelled", str(e)
+            except Exception as e:
+                job.state, job.result = "failed", f"Error running {job.name}: {str(e)}"
+        if self.on_finished:
+            self.on_finished(job.status(), job.result)
+
+    def cancel(self, job_id):
+        if job_id in self.jobs:
+            self.jobs[job_id].cancel()
+
+    def shutdown(self):
+        """
+        Cancel every job and wait for the running ones to stop.
+        """
+        for job in self.jobs.values():
+            job.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=False)
+
+
+def format_status(status):
+    """
+    One-line description of a job status, e.g. for a progress bar label.
+    """
+    megabytes = status["bytes"] / (1024 * 1024)
+    text = f"{status['name']}: {status['state']}, {megabytes:.1f} MB"
+    if status["percent"] is not None:
+        text += f" ({status['percent']:.0f}%)"
+    if status["bytes_per_second"]:
+        text += f", {status['bytes_per_second'] / (1024 * 1024):.1f} MB/s"
+    if status["eta"] is not None and status["state"] == "running":
+        text += f", ETA {status['eta']:.0f} s"
+    return text
+
+
+def result_failed(result):
+    """
+    Whether a capture, acquisition or analysis result reports a failure: it
+    starts with "Error", or its first line says the work failed or was
+    interrupted (and has to be run again).
+    """
+    if not result:
+        return False
+    first_line = result.splitlines()[0]
+    return result.startswith("Error") or "failed" in first_line or "interrupted" in first_line
@@ -1,12 +1,262 @@
 # logs_module.py
+import os
+import sys
+import json
+import time
+import queue
+import atexit
 import datetime
+import threading
+import contextvars
+import multiprocessing.util
+from contextlib import contextmanager
 
-def log_action(log_text, log_file="logs.txt"):
+import setting
+
+# Structured activity log
+#
+# log_action() only stamps a record and puts it on a bounded queue, so capture
+# and GUI threads never wait on the disk. One writer thread per log file takes
+# whatever has queued up (at most BATCH_SIZE records or about BATCH_BYTES of
+# messages), encodes each as a JSON line and appends the batch with a single
+# write, so the busier the log the larger its writes. When the queue is full,
+# by record count or by queued message bytes, records are dropped rather than
+# blocking the caller, and a record saying how many were lost is written in
+# their place. The file is rotated to <file>.1 ... <file>.<backups> once it
+# passes the size limit or its first record is older than the rotation
+# interval.
+#
+# Every record carries the case, device and job IDs in effect: process-wide
+# defaults from configure() (the case ID defaults to the "case_id" setting),
+# overridden on the current thread by `with context(device=..., job_id=...)`.
+LOG_FILE = "logs.jsonl"
+QUEUE_SIZE = 10000
+QUEUE_BYTES = 64 * 1024 * 1024
+BATCH_SIZE = 1000
+BATCH_BYTES = 1024 * 1024
+MAX_BYTES = 10 * 1024 * 1024
+ROTATE_INTERVAL = 24 * 3600
+BACKUP_COUNT = 5
+CONTEXT_FIELDS = ("case_id", "device", "job_id")
+
+_context = contextvars.ContextVar("log_context", default={})
+_defaults = {}
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def log_settings():
+    """
+    Log file, size limit (bytes), rotation interval (seconds), backup count and
+    case ID, from the "log_file", "log_max_mb", "log_rotate_hours",
+    "log_backups" and "case_id" settings.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    return (
+        settings.get("log_file", LOG_FILE),
+        int(float(settings.get("log_max_mb", MAX_BYTES / (1024 * 1024))) * 1024 * 1024),
+        float(settings.get("log_rotate_hours", ROTATE_INTERVAL / 3600)) * 3600,
+        int(settings.get("log_backups", BACKUP_COUNT)),
+        settings.get("case_id"),
+    )
+
+
+class LogWriter:
+    """
+    Background writer for one log file.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES, rotate_interval=ROTATE_INTERVAL, backups=BACKUP_COUNT,
+                 queue_size=QUEUE_SIZE, queue_bytes=QUEUE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.queue_bytes = queue_bytes
+        self.pid = os.getpid()
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+        self._fd = None
+        self._size = 0
+        self._opened = None
+        self._thread = threading.Thread(target=self._run, name=f"log-writer {path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        """
+        Queue a record without blocking. Returns False if it had to be dropped.
+        """
+        size = len(record.get("message", ""))
+        with self._lock:
+            if self._queued_bytes + size > self.queue_bytes and self._queued_bytes:
+                self.dropped += 1
+                return False
+            try:
+                self._queue.put_nowait((record, size))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._queued_bytes += size
+        return True
+
+    def flush(self):
+        """
+        Wait until every queued record has been written.
+        """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put((None, 0))
+        self._thread.join()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = [self._queue.get()]
+            batch_bytes = batch[0][1]
+            while len(batch) < BATCH_SIZE and batch_bytes < BATCH_BYTES:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                batch_bytes += batch[-1][1]
+            records = [record for record, _ in batch if record is not None]
+            closing = len(records) < len(batch)
+            with self._lock:
+                self._queued_bytes -= batch_bytes
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                records.append(_record(f"{dropped} log records dropped: the log queue was full", {}))
+            try:
+                self._write("".join(json.dumps(record, default=str) + "\n" for record in records).encode())
+            except OSError as e:
+                print(f"Error writing log {self.path}: {e}", file=sys.stderr)
+            for _ in batch:
+                self._queue.task_done()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open(self):
+        # O_APPEND makes each batch one atomic append, also when processes share the file.
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._opened = _first_record_time(self.path) if self._size else time.time()
+
+    def _write(self, data):
+        if self._fd is None:
+            self._open()
+        if self._size and (
+            self._size + len(data) > self.max_bytes or time.time() - self._opened >= self.rotate_interval
+        ):
+            self._rotate()
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self._size += len(data)
+
+    def _rotate(self):
+        os.close(self._fd)
+        self._fd = None
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+
+def _first_record_time(path):
     try:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        entry = f"{timestamp} - {log_text}\n"
-        with open(log_file, "a") as file:
-            file.write(entry)
-        return entry
+        with open(path) as f:
+            return datetime.datetime.fromisoformat(json.loads(f.readline())["time"]).timestamp()
+    except (OSError, ValueError, KeyError, TypeError):
+        return time.time()
+
+
+def _record(message, fields):
+    record = {"time": datetime.datetime.now().isoformat(timespec="milliseconds"), **dict.fromkeys(CONTEXT_FIELDS)}
+    record.update(_defaults)
+    record.update(_context.get())
+    record["message"] = message
+    record.update(fields)
+    return record
+
+
+def get_writer(path=None):
+    """
+    The writer for a log file (default: the "log_file" setting), started on first use.
+    """
+    with _writers_lock:
+        writer = _writers.get(path)
+        # A forked worker process inherits the writer but not its thread.
+        if writer is None or writer.pid != os.getpid():
+            log_file, max_bytes, rotate_interval, backups, case_id = log_settings()
+            if case_id is not None:
+                _defaults.setdefault("case_id", case_id)
+            writer = _writers[path] = LogWriter(path or log_file, max_bytes, rotate_interval, backups)
+            # Worker processes leave through os._exit, skipping atexit but not multiprocessing's finalizers.
+            if multiprocessing.parent_process() is not None:
+                multiprocessing.util.Finalize(writer, writer.close, exitpriority=10)
+        return writer
+
+
+def configure(**fields):
+    """
+    Set process-wide fields, such as case_id, added to every record.
+    """
+    _defaults.update(fields)
+
+
+@contextmanager
+def context(**fields):
+    """
+    Add fields (device, job_id, ...) to the records logged on this thread
+    inside the block.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def log_action(log_text, log_file=None, **fields):
+    """
+    Log a message, with any extra fields, as a structured record. Returns the
+    "<timestamp> - <message>" line for display; the record is written in the
+    background.
+    """
+    try:
+        writer = get_writer(log_file)
+        record = _record(log_text, fields)
+        writer.submit(record)
+        return f"{record['time'][:19].replace('T', ' ')} - {log_text}\n"
     except Exception as e:
         return f"Error logging action: {str(e)}"
+
+
+def flush():
+    """
+    Wait until every record logged so far is on disk.
+    """
+    with _writers_lock:
+        writers = [writer for writer in _writers.values() if writer.pid == os.getpid()]
+    for writer in writers:
+        writer.flush()
+
+
+@atexit.register
+def close_all():
+    with _writers_lock:
+        writers = [writer for writer in _writers.values() if writer.pid == os.getpid()]
+        _writers.clear()
+    for writer in writers:
+        writer.close()
@@ -1,48 +1,32 @@
+import os
 import sys
-import subprocess
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout,QGroupBox,
-    QPushButton, QLabel, QTextEdit, QFileDialog, QComboBox,QProgressBar,QHBoxLayout,QRadioButton
+    QPushButton, QLabel, QFileDialog, QComboBox,QProgressBar,QHBoxLayout,QRadioButton
 )
 from PyQt5.QtGui import QIcon,QFont
-from PyQt5.QtCore import QThread, pyqtSignal,Qt
+from PyQt5.QtCore import QObject, pyqtSignal,Qt
 
 
 # Import all modules
 from ram_capture import non_root_ram_capture, capture_root_ram,capture_ram
 import data_acquisition
+import device_connection
 # import dump_analysis
 import logs
 import setting
-from dump_analysis import analyze_ram_dump
+from dump_analysis import analyze_ram_dump, image_size
+import jobs
+import report_store
+import viewer
 
 
-class RAMCaptureWorker(QThread):
-    result_signal = pyqtSignal(str)  # Signal to send results back to the main GUI
-
-    def __init__(self, capture_type, output_dir, parent=None):
-        super().__init__(parent)
-        self.capture_type = capture_type
-        self.output_dir = output_dir
-
-    def run(self):
-        """
-        This method runs in the background when the thread starts.
-        """
-        try:
-            if self.capture_type == "Non-Rooted":
-                from ram_capture import non_root_ram_capture
-                result = non_root_ram_capture(self.output_dir)
-            elif self.capture_type == "Rooted":
-                from ram_capture import capture_root_ram
-                result = capture_root_ram(self.output_dir)
-            else:
-                result = "Invalid capture type selected."
-        except Exception as e:
-            result = f"Error capturing RAM: {str(e)}"
-
-        # Emit the result back to the main thread
-        self.result_signal.emit(result)
+class JobSignals(QObject):
+    """
+    Carries job engine callbacks from worker threads to the GUI thread.
+    """
+    progress_signal = pyqtSignal(dict)
+    result_signal = pyqtSignal(dict, str)
 
 
 
@@ -53,12 +37,28 @@ class MainApp(QMainWindow):
         self.setWindowIcon(QIcon("icon.png"))  # Add a custom icon file
         self.setGeometry(150, 150, 850, 650)
 
+        # Capture and analysis run on the job engine's worker threads; results come back as signals
+        self.job_signals = JobSignals()
+        self.job_signals.progress_signal.connect(self.update_job_progress)
+        self.job_signals.result_signal.connect(self.handle_job_result)
+        self.job_engine = jobs.JobEngine(
+            on_progress=self.job_signals.progress_signal.emit,
+            on_finished=self.job_signals.result_signal.emit,
+        )
+        self.job_rows = {}
+        self.analysis_stores = {}
+
         self.init_ui()
 
     def init_ui(self):
-        # Main container with tabs
+        # Main container with tabs above the running jobs
         self.tabs = QTabWidget()
-        self.setCentralWidget(self.tabs)
+        container = QWidget()
+        container_layout = QVBoxLayout()
+        container_layout.addWidget(self.tabs)
+        container_layout.addWidget(self.create_jobs_panel())
+        container.setLayout(container_layout)
+        self.setCentralWidget(container)
         self.tabs.setStyleSheet("""
     QTabBar::tab {
         font-size: 14px;
@@ -173,29 +173,10 @@ class MainApp(QMainWindow):
     
         return home_tab
     
-    def get_connected_devices(self):
-        # Run the adb devices command
-        try:
-            result = subprocess.run(['adb', 'devices'], capture_output=True, text=True)
-            output = result.stdout.strip().splitlines()
-
-            if len(output) < 2:
-                return "No devices connected."
-            
-            devices = []
-            for line in output[1:]:  # Skip the header line
-                device_id = line.split()[0]
-                devices.append(device_id)
-
-            return devices if devices else "No devices connected."
-        
-        except FileNotFoundError:
-            return "ADB not found. Please ensure it's installed and in your PATH."
-        except Exception as e:
-            return f"Error detecting devices: {e}"
-
     def display_connected_devices(self):
-        devices = self.get_connected_devices()
+        devices = device_connection.get_connected_devices()
+        if isinstance(devices, list):
+            devices = ", ".join(device_connection.describe_device(serial) for serial in devices)
         self.device_label.setText(f"Connected Devices: {devices}")
 
     def create_ram_capture_tab(self):
@@ -224,40 +205,11 @@ class MainApp(QMainWindow):
     def run_ram_capture(self, output_dir):
         capture_type = self.capture_type_dropdown.currentText()
         if capture_type == "Non-Rooted":
-            result = non_root_ram_capture(output_dir)
-            logs.log_action(result)
-            self.update_logs(result)
-            # result = non_root_ram_capture(output_dir)
+            self.start_job("Non-rooted RAM capture", lambda job: non_root_ram_capture(output_dir))
         elif capture_type == "Rooted":
-            result = capture_root_ram(output_dir)
+            self.start_job("Rooted RAM capture", lambda job: capture_root_ram(output_dir, progress=job.progress))
         else:
-            result = "Invalid RAM capture method selected."
-        self.update_logs(result)
-
-    # def run_ram_capture(self, output_dir):
-    
-    #     capture_type = self.capture_type_dropdown.currentText()  # Get selected capture type
-
-    # # Initialize the worker thread
-    #     self.ram_capture_worker = RAMCaptureWorker(capture_type, output_dir)
-    #     self.ram_capture_worker.result_signal.connect(self.handle_ram_capture_result)
-
-    # # Start the worker thread
-    #     self.ram_capture_worker.start()
-
-    # # Log a message indicating the process has started
-    #     self.update_logs("RAM capture process started...")
-
-
-    def handle_ram_capture_result(self, result):
-    
-    
-    # Log the result
-      logs.log_action(result)
-      self.update_logs(result)
-
-    # Optionally, display a popup or notification
-      self.update_logs("RAM capture process completed.")
+            self.update_logs("Invalid RAM capture method selected.")
 
 
     def create_data_acquisition_tab(self):
@@ -276,8 +228,7 @@ class MainApp(QMainWindow):
         return data_tab
 
     def run_data_acquisition(self, output_dir, file_paths):
-        result = data_acquisition.acquire_data(output_dir, file_paths)
-        self.update_logs(result)
+        self.start_job("Data acquisition", lambda job: data_acquisition.acquire_data(output_dir, file_paths))
 
     def create_analysis_tab(self):
         analysis_tab = QWidget()
@@ -290,17 +241,90 @@ class MainApp(QMainWindow):
         open_button.clicked.connect(self.open_file)
         layout.addWidget(open_button)
 
+        findings_button = QPushButton("Open Findings")
+        findings_button.clicked.connect(self.open_findings)
+        layout.addWidget(findings_button)
+
+        # Findings are paged from the analysis' findings store, not loaded into the widget
+        self.results_viewer = viewer.ResultsViewer()
+        layout.addWidget(self.results_viewer)
+
         analysis_tab.setLayout(layout)
         return analysis_tab
 
     def open_file(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Open Memory Dump", "", "Image Files (*.img *.bin)")
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Memory Dump", "", "Image Files (*.img *.bin *.cimg)")
         if file_name:
             output_dir = "analysis_results"  # Directory to save analysis results
-            result = analyze_ram_dump(file_name, output_dir)
-            logs.log_action(result)
-            self.update_logs(result)
+            os.makedirs(output_dir, exist_ok=True)
+            # The job's own findings store, shown once the job succeeds
+            store_file = report_store.new_store_path(output_dir)
+            job = self.start_job(
+                f"Analysis of {os.path.basename(file_name)}",
+                lambda job: analyze_ram_dump(file_name, output_dir, progress=job.progress, store_file=store_file),
+                total=image_size(file_name),
+            )
+            self.analysis_stores[job.id] = store_file
+
+    def open_findings(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Findings", "analysis_results", "Findings (*.db)")
+        if file_name:
+            self.results_viewer.load_store(file_name)
+
 
+    def create_jobs_panel(self):
+        jobs_group = QGroupBox("Jobs")
+        self.jobs_layout = QVBoxLayout()
+        jobs_group.setLayout(self.jobs_layout)
+        return jobs_group
+
+    def start_job(self, name, function, total=None):
+        """
+        Run function(job) on the job engine and add a progress row with a cancel button.
+        """
+        job = self.job_engine.submit(name, function, total)
+        row = QHBoxLayout()
+        label = QLabel(f"{name}: queued")
+        progress_bar = QProgressBar()
+        # Without a known total the bar stays busy instead of showing a percentage
+        progress_bar.setRange(0, 100 if total else 0)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(lambda: self.job_engine.cancel(job.id))
+        row.addWidget(label)
+        row.addWidget(progress_bar)
+        row.addWidget(cancel_button)
+        self.jobs_layout.addLayout(row)
+        self.job_rows[job.id] = (row, label, progress_bar, cancel_button)
+        self.update_logs(f"{name} started...")
+        return job
+
+    def update_job_progress(self, status):
+        _, label, progress_bar, _ = self.job_rows[status["id"]]
+        label.setText(jobs.format_status(status))
+        if status["percent"] is not None:
+            progress_bar.setValue(int(status["percent"]))
+
+    def handle_job_result(self, status, result):
+        row, label, progress_bar, cancel_button = self.job_rows.pop(status["id"])
+        for widget in (label, progress_bar, cancel_button):
+            row.removeWidget(widget)
+            widget.deleteLater()
+        self.jobs_layout.removeItem(row)
+        logs.log_action(result, job_id=status["id"], job=status["name"], state=status["state"])
+        self.update_logs(result)
+        self.update_logs(jobs.format_status(status))
+        store_file = self.analysis_stores.pop(status["id"], None)
+        # A job that ran to the end can still have failed; its result then starts with "Error".
+        if store_file and status["state"] == "done" and not result.startswith("Error"):
+            self.results_viewer.load_store(store_file)
+        elif store_file and os.path.exists(store_file) and not os.path.getsize(store_file):
+            # The analysis never got to open the store made for it
+            os.remove(store_file)
+
+    def closeEvent(self, event):
+        self.job_engine.shutdown()
+        self.results_viewer.close_store()
+        super().closeEvent(event)
 
     def create_logs_tab(self):
         logs_tab = QWidget()
@@ -309,16 +333,14 @@ class MainApp(QMainWindow):
         logs_label = QLabel("Activity Logs:")
         layout.addWidget(logs_label)
 
-        self.log_area = QTextEdit()
-        self.log_area.setReadOnly(True)
-        layout.addWidget(self.log_area)
+        self.log_viewer = viewer.LogViewer()
+        layout.addWidget(self.log_viewer)
 
         logs_tab.setLayout(layout)
         return logs_tab
 
     def update_logs(self, message):
-    
-       self.log_area.append(message)
+        self.log_viewer.append(message)
 
 
     def create_settings_tab(self):
@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+import setting
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stage metrics
+#
+# A stage is one timed unit of work: an adb command, a pull, a pass of an
+# analyzer. Code wraps it in `with stage(name, label) as current:` and counts
+# the bytes it handles with current.add_bytes(). Stages are aggregated per
+# (name, label) in the Recorder of the enclosing recording() (calls, wall time,
+# bytes, throughput and the process's peak RSS so far); outside a recording a
+# stage costs two clock reads. The recorder lives in a context variable, so
+# concurrent jobs on different threads keep apart; work handed to a thread pool
+# is wrapped with bind() to record into its submitter's recorder, and worker
+# processes send their snapshot back to be merge()d.
+#
+# When a recording ends its stages go to the log and, with an output
+# directory, to a metrics_<timestamp>.jsonl file there, one JSON object per
+# stage. Stages named in the "profile_stages" setting (or all of them, with
+# "all") also run under cProfile, and their stats are saved in "profile_dir".
+METRICS_PREFIX = "metrics_"
+METRICS_SUFFIX = ".jsonl"
+PROFILE_DIR = "profiles"
+
+_current = contextvars.ContextVar("metrics_recorder", default=None)
+_profiling = threading.local()
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB, or None where the
+    resource module is unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def profile_settings():
+    """
+    Stage names to profile and the directory for their stats, from the
+    "profile_stages" and "profile_dir" settings.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    stages = settings.get("profile_stages", [])
+    return [stages] if isinstance(stages, str) else list(stages), settings.get("profile_dir", PROFILE_DIR)
+
+
+class Stage:
+    """
+    A running stage; add_bytes() counts the bytes it handled.
+    """
+
+    def __init__(self, size=0):
+        self.bytes = size
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+
+class Recorder:
+    """
+    Aggregated stage metrics of one recording.
+    """
+
+    def __init__(self, name=None, profile_stages=None, profile_dir=None):
+        default_stages, default_dir = profile_settings()
+        self.name = name
+        self.started = datetime.now()
+        self.profile_stages = tuple(default_stages if profile_stages is None else profile_stages)
+        self.profile_dir = profile_dir or default_dir
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, name, seconds, size=0, label=None, calls=1, peak_rss=None):
+        with self._lock:
+            entry = self._stages.setdefault((name, label), [0, 0.0, 0, None])
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += size
+            if peak_rss is not None:
+                entry[3] = max(entry[3] or 0.0, peak_rss)
+
+    def merge(self, snapshot):
+        for record in snapshot:
+            self.add(
+                record["stage"], record["seconds"], record["bytes"], record["label"], record["calls"],
+                record["peak_rss_mb"],
+            )
+
+    def snapshot(self):
+        """
+        One dict per (stage, label), in the order the stages first finished.
+        """
+        with self._lock:
+            stages = list(self._stages.items())
+        return [
+            {
+                "stage": name,
+                "label": label,
+                "calls": calls,
+                "seconds": round(seconds, 6),
+                "bytes": size,
+                "mb_per_s": round(size / (1024 * 1024) / seconds, 3) if size and seconds else None,
+                "peak_rss_mb": None if peak_rss is None else round(peak_rss, 1),
+            }
+            for (name, label), (calls, seconds, size, peak_rss) in stages
+        ]
+
+    def wants_profile(self, name):
+        return any(
+            wanted == "all" or name == wanted or name.startswith(wanted + ".") for wanted in self.profile_stages
+        )
+
+    def write(self, path):
+        with open(path, "a") as f:
+            for record in self.snapshot():
+                f.write(json.dumps({"recording": self.name, "started": self.started.isoformat(), **record}) + "\n")
+
+    def log(self):
+        import logs
+        for record in self.snapshot():
+            logs.log_action(f"{self.name or 'stage'}: {format_stage(record)}", recording=self.name, **record)
+
+
+def format_stage(record):
+    """
+    One line for a stage snapshot record.
+    """
+    name = record["stage"] + (f" [{record['label']}]" if record["label"] else "")
+    line = f"{name}: {record['seconds']:.3f} s"
+    if record["calls"] > 1:
+        line += f" over {record['calls']} calls"
+    if record["bytes"] and record["bytes"] < 1024 * 1024:
+        line += f", {record['bytes']} bytes"
+    elif record["bytes"]:
+        line += f", {record['bytes'] / (1024 * 1024):.1f} MB"
+        if record["mb_per_s"]:
+            line += f" at {record['mb_per_s']:.1f} MB/s"
+    if record["peak_rss_mb"] is not None:
+        line += f", peak RSS {record['peak_rss_mb']:.0f} MB"
+    return line
+
+
+def _profile_path(recorder, name):
+    os.makedirs(recorder.profile_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(recorder.profile_dir, f"{name}_{os.getpid()}_{timestamp}.prof")
+
+
+@contextmanager
+def stage(name, label=None, size=0):
+    """
+    Time the enclosed block as one call of a stage. size is the number of
+    bytes handled, when known up front; add more with add_bytes().
+    """
+    recorder = _current.get()
+    current = Stage(size)
+    if recorder is None:
+        yield current
+        return
+    # cProfile profiles one thread; a stage nested in a profiled one is covered by it.
+    profiler = None
+    if recorder.wants_profile(name) and not getattr(_profiling, "active", False):
+        profiler = cProfile.Profile()
+        _profiling.active = True
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            _profiling.active = False
+            profiler.dump_stats(_profile_path(recorder, name))
+        recorder.add(name, seconds, current.bytes, label, peak_rss=peak_rss_mb())
+
+
+def timed_iter(iterable, name, label=None):
+    """
+    Wrap an iterator (a lazy sweep, say) so the time spent producing its items
+    is recorded as one call of a stage once it is exhausted or closed.
+    """
+    recorder = _current.get()
+    if recorder is None:
+        return iterable
+    return _timed_iter(iter(iterable), recorder, name, label)
+
+
+def _timed_iter(iterator, recorder, name, label):
+    clock = time.perf_counter
+    seconds = 0.0
+    try:
+        while True:
+            started = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                seconds += clock() - started
+            yield item
+    finally:
+        recorder.add(name, seconds, label=label)
+
+
+def bind(function):
+    """
+    Wrap function so that, run on another thread, it sees the caller's context:
+    its stages are recorded by the caller's current recorder and its log
+    records carry the caller's case, device and job IDs.
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        # A context can be entered by one thread at a time, so each call runs in its own copy.
+        return context.copy().run(function, *args, **kwargs)
+
+    return bound
+
+
+def merge(snapshot):
+    """
+    Add stages recorded elsewhere (in a worker process) to the current recorder.
+    """
+    recorder = _current.get()
+    if recorder is not None and snapshot:
+        recorder.merge(snapshot)
+
+
+def metrics_path(output_dir):
+    return os.path.join(output_dir, f"{METRICS_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}{METRICS_SUFFIX}")
+
+
+@contextmanager
+def recording(name=None, output_dir=None, log=True):
+    """
+    Record the stages run inside the block (and in work bound to it). On exit
+    they are logged, and written to a metrics file when output_dir is given.
+    """
+    recorder = Recorder(name)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+        if output_dir and os.path.isdir(output_dir):
+            recorder.write(metrics_path(output_dir))
+        if log:
+            recorder.log()
@@ -0,0 +1,285 @@
+import os
+import re
+import math
+import sqlite3
+import hashlib
+from collections import Counter
+from contextlib import closing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Page index sidecar (<dump>.pageindex, SQLite)
+#
+# For every PAGE_SIZE page of a dump the index keeps a short hash, whether the
+# page is all zeros and its Shannon entropy, plus the offsets of printable
+# ASCII and UTF-16LE strings of at least STRING_MIN_LENGTH characters. Its
+# digest, a SHA-256 over the page hashes, identifies the dump contents it
+# describes.
+#
+# An index is current while its digest matches the dump's content digest, not
+# its modification time, which changes when a dump is copied or touched and
+# may not when it is rewritten. Updating an index re-hashes the dump and only
+# recomputes entropy and strings for the CHUNK_PAGES-page chunks whose page
+# hashes changed. Given a content digest that matches the index, nothing is
+# re-hashed at all.
+INDEX_SUFFIX = ".pageindex"
+INDEX_VERSION = 1
+PAGE_SIZE = 4096
+CHUNK_PAGES = 256
+CHUNK_SIZE = CHUNK_PAGES * PAGE_SIZE
+COMMIT_CHUNKS = 64
+STRING_MIN_LENGTH = 8
+# Strings crossing a chunk boundary are found whole when they are shorter than this.
+STRING_OVERLAP = PAGE_SIZE
+
+# Strings are searched for in a copy of the data translated to three letters:
+# "a" for printable ASCII and tab, "z" for NUL and "x" for anything else. The
+# patterns then start with a literal run, which the regex engine searches for
+# several times faster than a repeated character class.
+ASCII, UTF16 = 0, 1
+STRING_CLASSES = bytes(
+    ord("a") if byte == 0x09 or 0x20 <= byte <= 0x7e else ord("z") if byte == 0 else ord("x") for byte in range(256)
+)
+ASCII_STRING_PATTERN = re.compile(b"a" * STRING_MIN_LENGTH + b"+")
+UTF16_STRING_PATTERN = re.compile(b"az" * STRING_MIN_LENGTH + b"(?:az)*")
+STRING_PATTERNS = ((ASCII, ASCII_STRING_PATTERN), (UTF16, UTF16_STRING_PATTERN))
+
+# Zero flags hold one byte per page, ZERO_FLAG for an all-zero page.
+ZERO_FLAG = b"\x01"
+NONZERO_RUN = re.compile(rb"\x00+")
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS pages (page INTEGER PRIMARY KEY, hash BLOB, zero INTEGER, entropy REAL);
+CREATE TABLE IF NOT EXISTS strings (start INTEGER, end INTEGER, encoding INTEGER);
+CREATE INDEX IF NOT EXISTS strings_start ON strings (start);
+"""
+
+
+def index_path(dump_path):
+    return dump_path + INDEX_SUFFIX
+
+
+# count * log2(count) for every possible byte count in a page.
+COUNT_LOG_COUNT = [0.0] + [count * math.log2(count) for count in range(1, PAGE_SIZE + 1)]
+
+
+def _entropy(data):
+    size = len(data)
+    return math.log2(size) - sum(map(COUNT_LOG_COUNT.__getitem__, Counter(data).values())) / size
+
+
+def page_entropies(chunk, pages):
+    """
+    Shannon entropy, in bits per byte, of the given pages of a chunk. With NumPy
+    the byte histograms of all full pages are counted in one bincount.
+    """
+    full_pages = len(chunk) // PAGE_SIZE
+    if numpy is None or full_pages < 2:
+        return {page: _entropy(chunk[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]) for page in pages}
+    data = numpy.frombuffer(chunk, numpy.uint8, full_pages * PAGE_SIZE).reshape(full_pages, PAGE_SIZE)
+    bins = data + (numpy.arange(full_pages, dtype=numpy.int64) * 256)[:, None]
+    counts = numpy.bincount(bins.ravel(), minlength=full_pages * 256).reshape(full_pages, 256)
+    probabilities = counts / PAGE_SIZE
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        entropies = -numpy.nansum(probabilities * numpy.log2(probabilities), axis=1)
+    return {
+        page: float(entropies[page]) if page < full_pages else _entropy(chunk[page * PAGE_SIZE:])
+        for page in pages
+    }
+
+
+def nonzero_spans(zero_flags, start, end):
+    """
+    Yield (start, end) byte spans of non-zero pages between dump offsets start
+    and end. Each span begins one byte early, on the last (zero) byte of the page
+    before it, where a NUL-led match can start.
+    """
+    first_page, last_page = start // PAGE_SIZE, -(-end // PAGE_SIZE)
+    for run in NONZERO_RUN.finditer(zero_flags, first_page, last_page):
+        span_start = max(start, run.start() * PAGE_SIZE - 1)
+        yield span_start, min(end, run.end() * PAGE_SIZE)
+
+
+def _index_strings(db, ram_data, size, zero_flags, start, end):
+    """
+    Replace the strings starting in [start, end) with those found now, looking
+    only at non-zero pages.
+    """
+    db.execute("DELETE FROM strings WHERE start >= ? AND start < ?", (start, end))
+    rows = []
+    for span_start, span_end in nonzero_spans(zero_flags, start, end):
+        scan_from = max(0, span_start - STRING_OVERLAP) if span_start == start else span_start
+        limit = min(size, span_end + STRING_OVERLAP) if span_end == end else span_end
+        data = ram_data[scan_from:limit].translate(STRING_CLASSES)
+        for encoding, pattern in STRING_PATTERNS:
+            for match in pattern.finditer(data):
+                offset = scan_from + match.start()
+                if span_start <= offset < span_end:
+                    rows.append((offset, scan_from + match.end(), encoding))
+    db.executemany("INSERT INTO strings VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def _page_hashes(chunk):
+    """
+    (offset in chunk, page data, page hash) for every page of a chunk.
+    """
+    for offset in range(0, len(chunk), PAGE_SIZE):
+        data = chunk[offset:offset + PAGE_SIZE]
+        yield offset, data, hashlib.blake2b(data, digest_size=8).digest()
+
+
+def content_digest(ram_data):
+    """
+    Digest of an open dump's contents, as stored in its page index: a SHA-256
+    over the hashes of its pages.
+    """
+    digest = hashlib.sha256()
+    for chunk_start in range(0, len(ram_data), CHUNK_SIZE):
+        for _, _, page_hash in _page_hashes(ram_data[chunk_start:chunk_start + CHUNK_SIZE]):
+            digest.update(page_hash)
+    return digest.hexdigest()
+
+
+def update_index(dump_path, ram_data, digest=None):
+    """
+    Build or bring up to date the page index of an open dump (a mapped dump or
+    a container reader). digest is the dump's content_digest(), if known; an
+    index with the same digest is up to date. Returns a summary line.
+    """
+    size = len(ram_data)
+    with closing(sqlite3.connect(index_path(dump_path))) as db:
+        meta = dict(db.execute("SELECT key, value FROM meta")) if _has_tables(db) else {}
+        if meta.get("version") != str(INDEX_VERSION):
+            db.executescript("DROP TABLE IF EXISTS meta; DROP TABLE IF EXISTS pages; DROP TABLE IF EXISTS strings;")
+            meta = {}
+        db.executescript(SCHEMA)
+        # The size is a quick check; only the digest shows that the contents are the same.
+        if digest is not None and meta.get("size") == str(size) and meta.get("digest") == digest:
+            return f"Page index of {dump_path} is up to date."
+
+        old_hashes = dict(db.execute("SELECT page, hash FROM pages"))
+        page_count = -(-size // PAGE_SIZE)
+        zero_flags = bytearray(page_count)
+        pages_digest = hashlib.sha256()
+        changed_pages = string_count = 0
+        # A chunk whose first page changed may end a string that starts in the chunk before it.
+        stale_chunks = []
+
+        for chunk_number, chunk_start in enumerate(range(0, size, CHUNK_SIZE)):
+            chunk_end = min(chunk_start + CHUNK_SIZE, size)
+            chunk = ram_data[chunk_start:chunk_end]
+            first_page = chunk_start // PAGE_SIZE
+            changed = []
+            rows = []
+            for page, (offset, data, page_hash) in enumerate(_page_hashes(chunk)):
+                pages_digest.update(page_hash)
+                zero_flags[first_page + page] = data == ZERO_PAGE[:len(data)]
+                if old_hashes.get(first_page + page) != page_hash:
+                    changed.append(page)
+                    rows.append((first_page + page, page_hash, zero_flags[first_page + page]))
+            if not changed:
+                continue
+            entropies = page_entropies(chunk, [page for page in changed if not zero_flags[first_page + page]])
+            db.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                [(page, page_hash, zero, entropies.get(page - first_page, 0.0)) for page, page_hash, zero in rows],
+            )
+            string_count += _index_strings(db, ram_data, size, zero_flags, chunk_start, chunk_end)
+            changed_pages += len(changed)
+            if changed[0] == 0 and chunk_start:
+                stale_chunks.append(chunk_start - CHUNK_SIZE)
+            if chunk_number % COMMIT_CHUNKS == 0:
+                db.commit()
+
+        for chunk_start in stale_chunks:
+            _index_strings(db, ram_data, size, zero_flags, chunk_start, chunk_start + CHUNK_SIZE)
+        db.execute("DELETE FROM pages WHERE page >= ?", (page_count,))
+        db.execute("DELETE FROM strings WHERE start >= ?", (size,))
+        db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+            ("version", str(INDEX_VERSION)),
+            ("size", str(size)),
+            ("page_size", str(PAGE_SIZE)),
+            ("digest", pages_digest.hexdigest()),
+        ])
+        db.commit()
+    if not changed_pages and meta.get("size") == str(size):
+        return f"Page index of {dump_path} is up to date."
+    return (
+        f"Page index of {dump_path} updated: {changed_pages} of {page_count} pages re-indexed, "
+        f"{string_count} strings found."
+    )
+
+
+def _has_tables(db):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name = 'meta'").fetchone() is not None
+
+
+class PageIndex:
+    """
+    Read access to a dump's page index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self.meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self.size = int(self.meta["size"])
+        flags = bytearray(-(-self.size // PAGE_SIZE))
+        for (page,) in self._db.execute("SELECT page FROM pages WHERE zero = 1"):
+            flags[page] = 1
+        self.zero_flags = bytes(flags)
+
+    def pages(self, start=0, end=None):
+        """
+        (page, hash, zero, entropy) rows for the pages from byte offset start to end.
+        """
+        end = self.size if end is None else end
+        return self._db.execute(
+            "SELECT page, hash, zero, entropy FROM pages WHERE page >= ? AND page < ? ORDER BY page",
+            (start // PAGE_SIZE, -(-end // PAGE_SIZE)),
+        ).fetchall()
+
+    def strings(self, start=0, end=None, encoding=None):
+        """
+        (start, end, encoding) of the indexed strings starting between byte offsets start and end.
+        """
+        end = self.size if end is None else end
+        query = "SELECT start, end, encoding FROM strings WHERE start >= ? AND start < ?"
+        parameters = [start, end]
+        if encoding is not None:
+            query += " AND encoding = ?"
+            parameters.append(encoding)
+        return self._db.execute(query + " ORDER BY start", parameters).fetchall()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_index(dump_path, digest):
+    """
+    The dump's page index, or None when there is none or it does not describe
+    the contents with this content_digest().
+    """
+    path = index_path(dump_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        index = PageIndex(path)
+    except (sqlite3.Error, KeyError):
+        return None
+    if index.meta.get("version") != str(INDEX_VERSION) or index.meta.get("digest") != digest:
+        index.close()
+        return None
+    return index
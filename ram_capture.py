@@ -1,6 +1,20 @@
 import os
+import json
+import hashlib
+import shutil
+import shlex
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
+
+import adb_session
+import collector
+import dump_container
+import integrity
+import metrics
+import setting
 
 def capture_ram(output_dir):
     """Capture RAM on rooted devices (deprecated, use capture_root_ram instead)."""
@@ -8,93 +22,415 @@ def capture_ram(output_dir):
 
 def run_adb_command(command, description):
     """
-    Helper function to run ADB commands and log results.
+    Helper function to run ADB commands and log results. `adb shell` commands
+    run over a pooled session; anything else runs as its own adb process.
     """
     try:
-        result = subprocess.run(command, capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            return f"{description} completed successfully.\n{result.stdout.strip()}"
+        invocation = adb_session.parse_shell_invocation(command)
+        if invocation:
+            return_code, stdout, stderr = adb_session.run_shell(invocation[1], invocation[0])
+            stdout, stderr = stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        else:
+            args = shlex.split(command) if isinstance(command, str) else command
+            result = subprocess.run(args, capture_output=True, text=True)
+            return_code, stdout, stderr = result.returncode, result.stdout, result.stderr
+        if return_code == 0:
+            return f"{description} completed successfully.\n{stdout.strip()}"
         else:
-            return f"{description} failed.\n{result.stderr.strip()}"
+            return f"{description} failed.\n{stderr.strip()}"
     except Exception as e:
         return f"Error executing {description}: {str(e)}"
 
 
 
-def capture_root_ram(output_dir):
+# Streaming capture reads the device's dd output in STREAM_CHUNK_SIZE pieces and
+# writes it through a WRITE_BUFFER_SIZE buffered file, reporting progress every
+# PROGRESS_INTERVAL seconds.
+STREAM_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+PROGRESS_INTERVAL = 1.0
+
+
+def _ram_dump_path(output_dir, extension=".img"):
+    """
+    Path for a new RAM dump; a timestamp is added if ram_dump.img already exists.
+    """
+    ram_dump_path = os.path.join(output_dir, f"ram_dump{extension}")  # Default to .img
+    if os.path.exists(ram_dump_path):
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        ram_dump_path = os.path.join(output_dir, f"ram_dump_{timestamp}{extension}")
+    return ram_dump_path
+
+
+def stream_adb_output(command, output_path, progress=None, record=True, container=False):
+    """
+    Run an adb command and stream its raw stdout into output_path, hashing it on
+    the way. With record=True the digests are added to the case's integrity manifest,
+    marked as partial if the command failed.
+    With container=True the output is written as a compressed dump container.
+    progress, if given, is called with (bytes_written, bytes_per_second) as data arrives;
+    an exception it raises kills the adb process and propagates.
+    Returns (bytes_written, elapsed_seconds, return_code, stderr, digests).
+    """
+    started = last_report = time.monotonic()
+    bytes_written = 0
+    with metrics.stage("adb_pull", adb_session.command_label(command)) as current, \
+            subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0) as process:
+        stderr = adb_session.drain(process.stderr)
+        with integrity.HashingWriter(output_path, buffering=WRITE_BUFFER_SIZE) as output, \
+                (dump_container.ContainerWriter(output) if container else nullcontext(output)) as sink:
+            try:
+                while True:
+                    chunk = process.stdout.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sink.write(chunk)
+                    bytes_written += len(chunk)
+                    now = time.monotonic()
+                    if progress and now - last_report >= PROGRESS_INTERVAL:
+                        progress(bytes_written, bytes_written / (now - started))
+                        last_report = now
+            except BaseException:
+                process.kill()
+                raise
+        stderr = stderr().decode(errors="ignore")
+        return_code = process.wait()
+        current.add_bytes(bytes_written)
+    if record:
+        integrity.record_artifact(output, partial=return_code != 0)
+    elapsed = time.monotonic() - started
+    if progress:
+        progress(bytes_written, bytes_written / elapsed if elapsed else 0.0)
+    return bytes_written, elapsed, return_code, stderr, output.digests()
+
+
+# Ranged capture reads physical memory in numbered ranges of at most RANGE_SIZE
+# bytes, each with its own `dd skip=/count=` over its own adb stream,
+# RANGE_STREAMS at a time. Finished ranges are recorded in a journal next to the
+# parts, so an interrupted capture resumes with the ranges that are still missing.
+#
+# When /proc/iomem is readable the ranges are planned from its "System RAM"
+# entries only, skipping holes and MMIO regions. The image then holds those
+# segments back to back, and its ranges table maps every range to its physical
+# address.
+DD_BLOCK_SIZE = 1024 * 1024
+RANGE_SIZE = 64 * 1024 * 1024
+RANGE_STREAMS = 4
+RANGE_RETRIES = 2
+
+
+def parse_iomem(iomem_text):
+    """
+    Return (start, end) physical address pairs, end exclusive, for the
+    top-level "System RAM" entries of /proc/iomem.
+    """
+    segments = []
+    for line in iomem_text.splitlines():
+        # Nested entries (kernel code, reserved areas) are indented.
+        if line[:1].isspace() or " : " not in line:
+            continue
+        addresses, name = line.split(" : ", 1)
+        if name.strip() != "System RAM":
+            continue
+        start, end = (int(address, 16) for address in addresses.split("-"))
+        if end > start:
+            segments.append((start, end + 1))
+    return segments
+
+
+def read_iomem_segments(serial=None):
+    """
+    Read the device's System RAM segments. Returns [] when /proc/iomem cannot be
+    read or its addresses are hidden, as they are without root.
+    """
+    return_code, stdout, _ = adb_session.run_su("cat /proc/iomem", serial)
+    if return_code != 0:
+        return []
+    return parse_iomem(stdout.decode(errors="replace"))
+
+
+def plan_ranges(segments, range_size=RANGE_SIZE):
+    """
+    Split System RAM segments into [physical_address, size] ranges of at most range_size bytes.
+    """
+    plan = []
+    for start, end in segments:
+        for offset in range(start, end, range_size):
+            plan.append([offset, min(range_size, end - offset)])
+    return plan
+
+
+def _range_bounds(journal, index):
+    if journal["plan"]:
+        return journal["plan"][index]
+    return index * journal["range_size"], journal["range_size"]
+
+
+def _dd_block_size(offset, size):
+    """
+    Largest power-of-two block size up to DD_BLOCK_SIZE that divides both offset and size.
+    """
+    block = DD_BLOCK_SIZE
+    while block > 1 and (offset % block or size % block):
+        block //= 2
+    return block
+
+
+def _load_journal(journal_path, range_size, plan):
+    try:
+        with open(journal_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"range_size": range_size, "plan": plan, "end": len(plan) - 1 if plan else None, "ranges": {}}
+
+
+def _save_journal(journal_path, journal):
+    with open(journal_path + ".tmp", "w") as f:
+        json.dump(journal, f, indent=4)
+    os.replace(journal_path + ".tmp", journal_path)
+
+
+def _pad_part(part_path, size):
+    """
+    Zero-fill a part file up to size bytes. Returns the SHA-256 of the padded part.
+    """
+    with open(part_path, "ab") as part:
+        part.truncate(size)
+    sha256 = hashlib.sha256()
+    with open(part_path, "rb") as part:
+        for chunk in iter(lambda: part.read(STREAM_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _capture_range(index, offset, size, parts_dir, progress, serial=None, planned=False):
+    """
+    Stream one range of /dev/mem into its part file. Returns its journal entry,
+    {"size": bytes, "sha256": digest}, or raises RuntimeError if adb fails on
+    every attempt. dd exits 0 even when a read fails, so a planned range (one
+    from /proc/iomem) that comes back short is retried too; if it is still
+    short it is padded with zeros to its planned size, and "read" records the
+    bytes actually received.
+    """
+    block = _dd_block_size(offset, size)
+    command = [
+        *adb_session.adb_args(serial), "exec-out", "su", "-c",
+        f"dd if=/dev/mem bs={block} skip={offset // block} count={size // block} 2>/dev/null",
+    ]
+    part_path = os.path.join(parts_dir, f"range_{index:05d}.bin")
+    for _ in range(RANGE_RETRIES + 1):
+        bytes_written, _, return_code, stderr, digests = stream_adb_output(command, part_path, progress, record=False)
+        if return_code == 0 and (not planned or bytes_written >= size):
+            return {"size": bytes_written, "sha256": digests["sha256"]}
+    if return_code == 0:
+        return {"size": size, "sha256": _pad_part(part_path, size), "read": bytes_written}
+    raise RuntimeError(f"range {index}: {stderr.strip() or 'adb failed'}")
+
+
+def _assemble_ranges(journal, parts_dir, ram_dump_path, container=False):
+    """
+    Concatenate the captured ranges into one image (or a compressed container
+    of it) and write its ranges table: each range's physical address, offset in
+    the image, size and SHA-256.
+    """
+    table = []
+    with integrity.HashingWriter(ram_dump_path, buffering=WRITE_BUFFER_SIZE) as output, \
+            (dump_container.ContainerWriter(output) if container else nullcontext(output)) as image:
+        for index in range(journal["end"] + 1):
+            entry = journal["ranges"][str(index)]
+            file_offset = image.size
+            with open(os.path.join(parts_dir, f"range_{index:05d}.bin"), "rb") as part:
+                shutil.copyfileobj(part, image, STREAM_CHUNK_SIZE)
+            physical_address = _range_bounds(journal, index)[0]
+            table.append({"index": index, "offset": physical_address, "file_offset": file_offset, **entry})
+    # Ranges padded after a short read leave the image incomplete.
+    integrity.record_artifact(output, partial=any("read" in entry for entry in table))
+    integrity.write_artifact(ram_dump_path + ".ranges.json", json.dumps(table, indent=4))
+    return image.size
+
+
+def capture_root_ram_ranges(output_dir, range_size=RANGE_SIZE, streams=RANGE_STREAMS, progress=None, use_iomem=True, serial=None,
+                            container=False):
+    """
+    Capture physical memory in numbered ranges over parallel adb streams, then
+    assemble them into one image. Ranges come from the System RAM entries of
+    /proc/iomem when available; otherwise /dev/mem is read from offset 0 and the
+    first range that comes back short marks the end of memory.
+    Re-running after an interruption resumes the capture.
+    """
+    parts_dir = os.path.join(output_dir, "ram_dump.parts")
+    journal_path = os.path.join(parts_dir, "journal.json")
+    plan = None
+    if use_iomem and not os.path.exists(journal_path):
+        plan = plan_ranges(read_iomem_segments(serial), range_size) or None
+    os.makedirs(parts_dir, exist_ok=True)
+    journal = _load_journal(journal_path, range_size, plan)
+    range_size = journal["range_size"]
+
+    started = time.monotonic()
+    lock = threading.Lock()
+    in_flight = {}
+
+    def range_progress(index):
+        def report(bytes_written, _):
+            with lock:
+                in_flight[index] = bytes_written
+                done = sum(in_flight.values())
+            if progress:
+                progress(done, done / max(time.monotonic() - started, 1e-9))
+        return report
+
+    def next_indexes():
+        index = 0
+        while journal["end"] is None or index <= journal["end"]:
+            if str(index) not in journal["ranges"]:
+                yield index
+            index += 1
+
+    failures = []
+    pending = {}
+    indexes = next_indexes()
+    with ThreadPoolExecutor(max_workers=streams) as executor:
+        while True:
+            while len(pending) < streams and not failures:
+                index = next(indexes, None)
+                if index is None or (journal["end"] is not None and index > journal["end"]):
+                    break
+                offset, size = _range_bounds(journal, index)
+                future = executor.submit(
+                    metrics.bind(_capture_range), index, offset, size, parts_dir, range_progress(index), serial,
+                    bool(journal["plan"]),
+                )
+                pending[future] = index
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failures.append((index, str(e)))
+                    continue
+                with lock:
+                    if not journal["plan"] and entry["size"] < range_size and (journal["end"] is None or index < journal["end"]):
+                        journal["end"] = index
+                    if journal["end"] is None or index <= journal["end"]:
+                        journal["ranges"][str(index)] = entry
+                    _save_journal(journal_path, journal)
+
+    # A range past the end of memory, found by a shorter one finishing later, is not needed.
+    failures = [message for index, message in failures if journal["end"] is None or index <= journal["end"]]
+    if failures:
+        return "Rooted RAM capture interrupted; run it again to resume.\n" + "\n".join(failures)
+    if not any(journal["ranges"][str(index)]["size"] for index in range(journal["end"] + 1)):
+        shutil.rmtree(parts_dir)
+        return "Error capturing rooted RAM: no data received"
+
+    ram_dump_path = _ram_dump_path(output_dir, dump_container.EXTENSION if container else ".img")
+    with metrics.stage("assemble_ranges") as current:
+        image_size = _assemble_ranges(journal, parts_dir, ram_dump_path, container)
+        current.add_bytes(image_size)
+    shutil.rmtree(parts_dir)
+    elapsed = time.monotonic() - started
+    rate = image_size / elapsed / (1024 * 1024) if elapsed else 0.0
+    short = [entry for entry in journal["ranges"].values() if "read" in entry]
+    return (
+        f"Rooted RAM capture completed. RAM dump saved at {ram_dump_path}\n"
+        f"{journal['end'] + 1} ranges, {image_size} bytes in {elapsed:.1f} s ({rate:.1f} MB/s)"
+        + (f"\n{len(short)} ranges came back short; {sum(entry['size'] - entry['read'] for entry in short)} "
+           f"unread bytes zero-filled, the dump is partial" if short else "")
+    )
+
+
+def capture_root_ram(output_dir, stream=True, progress=None, range_size=RANGE_SIZE, streams=RANGE_STREAMS, serial=None,
+                     container=None):
     """
     Capture a full memory dump from a rooted Android device.
+    By default dd's output is streamed over `adb exec-out` straight into the host,
+    in resumable ranges over `streams` parallel adb streams, so nothing is staged
+    on the device's storage. With range_size=None one dd streams the whole dump.
+    With stream=False the dump is written to /sdcard first and then pulled.
+    serial selects the device when several are connected. With container=True
+    (default: the "dump_container" setting) the dump is saved as a compressed
+    dump container instead of a raw image.
     """
+    if container is None:
+        settings = setting.load_settings()
+        container = bool(settings.get("dump_container", False)) if isinstance(settings, dict) else False
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    try:
-        # Path for memory dump file
-        ram_dump_path = os.path.join(output_dir, "ram_dump.img")  # Default to .img
+    with metrics.recording("capture_root_ram", output_dir):
+        try:
+            if stream and range_size:
+                return capture_root_ram_ranges(output_dir, range_size, streams, progress, serial=serial, container=container)
 
-        # Command to use `su` for root permissions and capture memory
-        command = ["adb", "shell", "su", "-c", f"dd if=/dev/mem of=/sdcard/ram_dump.img bs=4096"]
-        result = subprocess.run(command, capture_output=True, text=True)
+            # Path for memory dump file
+            ram_dump_path = _ram_dump_path(output_dir, dump_container.EXTENSION if container else ".img")
 
-        if result.returncode == 0:
-            # Pull the RAM dump file from the device
-            subprocess.run(["adb", "pull", "/sdcard/ram_dump.img", ram_dump_path], check=True)
+            if stream:
+                # dd's statistics go to /dev/null; exec-out would otherwise mix them into the image.
+                command = [*adb_session.adb_args(serial), "exec-out", "su", "-c", "dd if=/dev/mem bs=1048576 2>/dev/null"]
+                bytes_written, elapsed, return_code, stderr, _ = stream_adb_output(command, ram_dump_path, progress, container=container)
+                if return_code != 0 or bytes_written == 0:
+                    return f"Error capturing rooted RAM: {stderr.strip() or 'no data received'}"
+                rate = bytes_written / elapsed / (1024 * 1024) if elapsed else 0.0
+                return (
+                    f"Rooted RAM capture completed. RAM dump saved at {ram_dump_path}\n"
+                    f"{bytes_written} bytes in {elapsed:.1f} s ({rate:.1f} MB/s)"
+                )
 
-            # If the file already exists, modify the name by adding a timestamp
-            if os.path.exists(ram_dump_path):
-                timestamp = time.strftime("%Y%m%d_%H%M%S")
-                ram_dump_path = os.path.join(output_dir, f"ram_dump_{timestamp}.img")
+            # Command to use `su` for root permissions and capture memory
+            command = [*adb_session.adb_args(serial), "shell", "su", "-c", f"dd if=/dev/mem of=/sdcard/ram_dump.img bs=4096"]
+            result = subprocess.run(command, capture_output=True, text=True)
 
-            return f"Rooted RAM capture completed. RAM dump saved at {ram_dump_path}"
-        else:
-            return f"Error capturing rooted RAM: {result.stderr.strip()}"
+            if result.returncode == 0:
+                # Copy the RAM dump file from the device, hashing it as it arrives
+                _, _, return_code, stderr, _ = stream_adb_output([*adb_session.adb_args(serial), "exec-out", "cat", "/sdcard/ram_dump.img"], ram_dump_path, container=container)
+                if return_code != 0:
+                    return f"Error pulling rooted RAM dump: {stderr.strip()}"
+                return f"Rooted RAM capture completed. RAM dump saved at {ram_dump_path}"
+            else:
+                return f"Error capturing rooted RAM: {result.stderr.strip()}"
 
-    except Exception as e:
-        return f"Error capturing rooted memory: {str(e)}"
+        except Exception as e:
+            return f"Error capturing rooted memory: {str(e)}"
 
 
 
-def non_root_ram_capture(output_dir):
+def non_root_ram_capture(output_dir, serial=None):
     """
     Capture accessible memory-related data from a non-rooted Android device.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    results = []
-    
-    try:
-        # Command outputs to capture
-        commands = {
-            "Device State": ["adb", "get-state"],
-            "Serial Number": ["adb", "get-serialno"],
-            "IMEI": ["adb", "shell", "dumpsys", "iphonesybinfo"],
-            "Battery Status": ["adb", "shell", "dumpsys", "battery"],
-            "TCP Connectivity": ["adb", "shell", "netstat"],
-            "Process Status": ["adb", "shell", "ps"],
-            "Screen Resolution": ["adb", "shell", "wm", "size"],
-            "Current Activity": [
-                "adb", "shell", "dumpsys", "window", "windows", 
-                "|", "grep", "-E", "'mCurrentFocus|mFocusedApp'"
-            ],
-        }
-
-        for key, command in commands.items():
-            try:
-                process = subprocess.run(command, capture_output=True, text=True)
-                if process.returncode == 0:
-                    result = process.stdout.strip()
-                    results.append(f"{key}:\n{result}\n")
-                    # Save output to a file
-                    with open(os.path.join(output_dir, f"{key.replace(' ', '_').lower()}.txt"), "w") as f:
-                        f.write(result)
-                else:
-                    results.append(f"{key}: Command failed with error {process.stderr.strip()}\n")
-            except Exception as e:
-                results.append(f"{key}: Error executing command - {str(e)}\n")
-
-        return "Non-rooted RAM capture completed. Files saved in {output_dir}.\n" + "\n".join(results)
+    adb = adb_session.adb_args(serial)
+
+    with metrics.recording("non_root_ram_capture", output_dir):
+        try:
+            # Command outputs to capture
+            commands = {
+                "Device State": [*adb, "get-state"],
+                "Serial Number": [*adb, "get-serialno"],
+                "IMEI": [*adb, "shell", "dumpsys", "iphonesybinfo"],
+                "Battery Status": [*adb, "shell", "dumpsys", "battery"],
+                "TCP Connectivity": [*adb, "shell", "netstat"],
+                "Process Status": [*adb, "shell", "ps"],
+                "Screen Resolution": [*adb, "shell", "wm", "size"],
+                "Current Activity": [
+                    *adb, "shell", "dumpsys", "window", "windows", 
+                    "|", "grep", "-E", "'mCurrentFocus|mFocusedApp'"
+                ],
+            }
+
+            # Independent commands run concurrently; each output is streamed to its file
+            file_paths = {key: os.path.join(output_dir, f"{key.replace(' ', '_').lower()}.txt") for key in commands}
+            results = collector.run_commands(commands, file_paths)
+
+            return f"Non-rooted RAM capture completed. Files saved in {output_dir}.\n" + "\n".join(results)
     
-    except Exception as e:
-        return f"Error capturing non-rooted RAM data: {str(e)}"
+        except Exception as e:
+            return f"Error capturing non-rooted RAM data: {str(e)}"
 
@@ -0,0 +1,262 @@
+import os
+import json
+import sqlite3
+import tempfile
+from datetime import datetime
+
+# Findings store (SQLite)
+#
+# Analyzers emit typed findings (analyzer, kind, offset, value) into a
+# FindingStore while the scan runs. Findings are deduplicated on (analyzer,
+# kind, value) in a pending batch and written with one upsert per BATCH_SIZE
+# distinct values, which adds to the stored occurrence count and widens the
+# first/last offsets, so memory holds at most one batch whatever the number
+# of matches. Text reports and JSONL exports are rendered from the store.
+STORE_PREFIX = "findings_"
+STORE_SUFFIX = ".db"
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    analyzer TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_offset INTEGER NOT NULL,
+    last_offset INTEGER NOT NULL,
+    UNIQUE (analyzer, kind, value)
+);
+CREATE INDEX IF NOT EXISTS findings_first_offset ON findings (analyzer, first_offset);
+"""
+
+# Paging through all findings in offset order needs its own index; it is built
+# on demand by readers, as keeping it up to date would slow down the scan.
+OFFSET_INDEX = "CREATE INDEX IF NOT EXISTS findings_offset ON findings (first_offset)"
+
+UPSERT = """
+INSERT INTO findings (analyzer, kind, value, count, first_offset, last_offset) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (analyzer, kind, value) DO UPDATE SET
+    count = count + excluded.count,
+    first_offset = min(first_offset, excluded.first_offset),
+    last_offset = max(last_offset, excluded.last_offset)
+"""
+
+COLUMNS = ("analyzer", "kind", "value", "count", "first_offset", "last_offset")
+
+
+def _filter(analyzer=None, kind=None, text=None):
+    """
+    WHERE clause and parameters for the analyzer, kind and value substring filters.
+    """
+    conditions, parameters = [], []
+    for column, value in (("analyzer", analyzer), ("kind", kind)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    if text:
+        conditions.append("instr(value, ?) > 0")
+        parameters.append(text)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+
+class FindingStore:
+    """
+    Streaming sink for findings, and read access to them once flushed.
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._pending = {}
+
+    def add(self, analyzer, kind, offset, value):
+        key = (analyzer, kind, value)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = [1, offset, offset]
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        else:
+            pending[0] += 1
+            pending[1] = min(pending[1], offset)
+            pending[2] = max(pending[2], offset)
+
+    def add_rows(self, rows):
+        """
+        Add already deduplicated rows in COLUMNS order, e.g. from the result cache.
+        """
+        self.flush()
+        self._db.executemany(UPSERT, rows)
+        self._db.commit()
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._db.executemany(UPSERT, [(*key, *counts) for key, counts in self._pending.items()])
+        self._db.commit()
+        self._pending = {}
+
+    def set_meta(self, **values):
+        self.flush()
+        self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+            (key, json.dumps(value)) for key, value in values.items()
+        ])
+        self._db.commit()
+
+    def meta(self):
+        return {key: json.loads(value) for key, value in self._db.execute("SELECT key, value FROM meta")}
+
+    def rows(self, analyzer=None, kind=None, text=None, offset=0, limit=-1):
+        """
+        Findings in COLUMNS order, sorted by first offset, optionally filtered
+        by analyzer, kind and a substring of the value, one page at a time.
+        """
+        self.flush()
+        where, parameters = _filter(analyzer, kind, text)
+        return self._db.execute(
+            "SELECT analyzer, kind, value, count, first_offset, last_offset FROM findings" + where
+            + " ORDER BY first_offset, id LIMIT ? OFFSET ?",
+            (*parameters, limit, offset),
+        ).fetchall()
+
+    def count(self, analyzer=None, kind=None, text=None):
+        """
+        Number of distinct findings matching the same filters as rows().
+        """
+        self.flush()
+        where, parameters = _filter(analyzer, kind, text)
+        return self._db.execute("SELECT count(*) FROM findings" + where, parameters).fetchone()[0]
+
+    def analyzers(self):
+        """
+        Names of the analyzers with findings, sorted.
+        """
+        self.flush()
+        return [analyzer for analyzer, in self._db.execute("SELECT DISTINCT analyzer FROM findings ORDER BY analyzer")]
+
+    def top(self, analyzer, limit):
+        """
+        An analyzer's limit most frequent findings, in COLUMNS order.
+        """
+        self.flush()
+        return self._db.execute(
+            "SELECT analyzer, kind, value, count, first_offset, last_offset FROM findings WHERE analyzer = ? "
+            "ORDER BY count DESC, first_offset LIMIT ?",
+            (analyzer, limit),
+        ).fetchall()
+
+    def iter_rows(self, analyzer=None):
+        """
+        Iterate over findings (all, or one analyzer's) in first-offset order
+        without loading them all.
+        """
+        self.flush()
+        query = "SELECT analyzer, kind, value, count, first_offset, last_offset FROM findings"
+        if analyzer is None:
+            return self._db.execute(query + " ORDER BY first_offset, id")
+        return self._db.execute(query + " WHERE analyzer = ? ORDER BY first_offset, id", (analyzer,))
+
+    def counts(self):
+        """
+        {analyzer: (distinct findings, occurrences)}.
+        """
+        self.flush()
+        return {
+            analyzer: (distinct, occurrences)
+            for analyzer, distinct, occurrences in self._db.execute(
+                "SELECT analyzer, count(*), sum(count) FROM findings GROUP BY analyzer"
+            )
+        }
+
+    def kind_summary(self, analyzer):
+        """
+        {kind: (occurrences, first offset, last offset)} for one analyzer, in
+        order of first appearance.
+        """
+        self.flush()
+        return {
+            kind: (occurrences, first_offset, last_offset)
+            for kind, occurrences, first_offset, last_offset in self._db.execute(
+                "SELECT kind, sum(count), min(first_offset), max(last_offset) FROM findings WHERE analyzer = ? "
+                "GROUP BY kind ORDER BY min(first_offset)",
+                (analyzer,),
+            )
+        }
+
+    def delete(self, analyzer, kind=None):
+        """
+        Remove an analyzer's findings, or those of one kind.
+        """
+        self.flush()
+        if kind is None:
+            self._db.execute("DELETE FROM findings WHERE analyzer = ?", (analyzer,))
+        else:
+            self._db.execute("DELETE FROM findings WHERE analyzer = ? AND kind = ?", (analyzer, kind))
+        self._db.commit()
+
+    def export_jsonl(self, path):
+        """
+        Write every finding as one JSON object per line.
+        """
+        with open(path, "w") as f:
+            for row in self.iter_rows():
+                f.write(json.dumps(dict(zip(COLUMNS, row))) + "\n")
+
+    def index_offsets(self):
+        """
+        Build the index that lets rows() page through unfiltered findings
+        without sorting them all for every page.
+        """
+        self.flush()
+        self._db.execute(OFFSET_INDEX)
+        self._db.commit()
+
+    def interrupt(self):
+        """
+        Abort a query running on another thread; it raises sqlite3.OperationalError.
+        """
+        self._db.interrupt()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def new_store_path(output_dir):
+    """
+    Path of a new, empty findings store in output_dir: findings_<timestamp>_<random>.db.
+    The file is created here, exclusively, so analyses started in the same
+    second never share a store or overwrite one another's.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    fd, path = tempfile.mkstemp(prefix=f"{STORE_PREFIX}{timestamp}_", suffix=STORE_SUFFIX, dir=output_dir)
+    os.close(fd)
+    return path
+
+
+def store_name(path):
+    """
+    The <timestamp>_<random> part of a findings store's file name, shared by
+    the report and exports rendered from it.
+    """
+    return os.path.basename(path)[len(STORE_PREFIX):-len(STORE_SUFFIX)]
+
+
+def open_store(path):
+    """
+    Open an existing findings store for reading.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"no findings store at {path}")
+    return FindingStore(path)
+
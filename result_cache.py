@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import threading
+
+import setting
+
+# Content-addressed cache of analysis results
+#
+# One file per (dump digest, analyzer, analyzer version), named after the
+# SHA-256 of that key, in CACHE_DIR. An entry is a JSON header line followed by
+# one JSON line per finding row, so rows are written and read back one at a
+# time rather than held in memory all at once. A file's modification time is
+# its last use: reading an entry touches it, and once the cache grows past
+# CACHE_SIZE bytes the least recently used entries are deleted. A changed
+# analyzer gets a new version and so a new key; its old entries simply age out,
+# as do entries of an older ENTRY_FORMAT.
+CACHE_DIR = "analysis_cache"
+CACHE_SIZE = 512 * 1024 * 1024
+ENTRY_SUFFIX = ".json"
+ENTRY_FORMAT = 2
+
+_evict_lock = threading.Lock()
+
+
+def cache_settings():
+    """
+    Cache directory, size limit in bytes and whether the cache is used, from
+    the "cache_dir", "cache_size_mb" and "result_cache" settings.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    directory = settings.get("cache_dir", CACHE_DIR)
+    max_bytes = int(settings.get("cache_size_mb", CACHE_SIZE // (1024 * 1024))) * 1024 * 1024
+    return directory, max_bytes, bool(settings.get("result_cache", True))
+
+
+def cache_key(digest, analyzer, version):
+    return hashlib.sha256(f"{ENTRY_FORMAT}\0{digest}\0{analyzer}\0{version}".encode()).hexdigest()
+
+
+def _read_rows(f):
+    with f:
+        for line in f:
+            yield json.loads(line)
+
+
+class ResultCache:
+    """
+    get/put access to cached results of one analyzer on one dump.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        default_directory, default_max_bytes, _ = cache_settings()
+        self.directory = directory or default_directory
+        self.max_bytes = max_bytes or default_max_bytes
+
+    def _path(self, digest, analyzer, version):
+        return os.path.join(self.directory, cache_key(digest, analyzer, version) + ENTRY_SUFFIX)
+
+    def get(self, digest, analyzer, version):
+        """
+        The cached rows, as an iterator reading them from the entry one by one,
+        or None on a miss.
+        """
+        path = self._path(digest, analyzer, version)
+        try:
+            f = open(path, "r")
+        except OSError:
+            return None
+        try:
+            json.loads(f.readline())
+            os.utime(path)
+        except (OSError, ValueError):
+            f.close()
+            return None
+        return _read_rows(f)
+
+    def put(self, digest, analyzer, version, rows):
+        """
+        Store an iterable of JSON-serializable rows, writing each as it comes,
+        then evict down to the size limit.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(digest, analyzer, version)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "w") as f:
+                f.write(json.dumps({"digest": digest, "analyzer": analyzer, "version": version}) + "\n")
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_bytes.
+        """
+        with _evict_lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                os.remove(entry.path)
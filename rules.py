@@ -0,0 +1,641 @@
+import os
+import re
+import json
+import heapq
+import hashlib
+
+import setting
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Signature rule packs
+#
+# A rule pack is a JSON or YAML file of rules:
+#
+#   {"name": "threat-intel", "rules": [
+#       {"id": "Stalkerware X",
+#        "meta": {"severity": "high", "description": "...", "tags": ["spyware"]},
+#        "strings": {"$cfg": "stalk_config.xml",
+#                    "$c2": {"text": "c2.example.net", "nocase": true, "wide": true},
+#                    "$magic": {"hex": "de ad ?? ef [2-4] 01"},
+#                    "$beacon": {"regex": "beacon\\?id=[0-9a-f]{16}"}},
+#        "condition": "$cfg and ($c2 or 2 of them)"}]}
+#
+# Strings are text (optionally case-insensitive and/or UTF-16LE), hex byte
+# patterns (?? matches any byte, [n-m] skips n to m bytes) or byte regexes. A
+# condition combines string ids with and/or/not and parentheses, "any", "all"
+# or "N of them" (default "any"); it is evaluated over the whole dump once the
+# scan is done.
+#
+# Compiling a rule set folds every literal (plain text, and hex patterns
+# without wildcards) into one prefix trie per case mode, written out as a
+# regex whose alternatives branch only where the literals differ, so a scan
+# position costs about the same with thousands of literals as with a few.
+# Regex and wildcard hex strings that begin with at least MIN_REGEX_PREFIX
+# literal bytes have those prefixes added to the case-sensitive trie, and are
+# only matched in full where a prefix occurs; the rest share one alternation,
+# which finds where the first of them matches. The trie is searched again from
+# the byte after each hit rather than after the whole match, so a literal that
+# starts inside another ("ygote" in "zygote64", a domain in a URL) is still
+# found, and each string, like a finditer of its own, is reported again only
+# once its previous match has ended. The compiled tables and trie patterns are
+# saved as JSON in the cache directory under a digest of the rule sources, so
+# later runs only hand the finished patterns to re.compile; the cache holds no
+# code, as the directory may be shared.
+RULES_DIR = "rules"
+PACK_EXTENSIONS = (".json", ".yaml", ".yml")
+COMPILED_VERSION = 2
+COMPILED_PREFIX = "rules-"
+COMPILED_SUFFIX = ".json"
+# Longer literals are matched as regexes, which keeps the trie shallow.
+MAX_TRIE_LITERAL = 256
+MIN_REGEX_PREFIX = 3
+
+BUILTIN_SOURCE = "<builtin>"
+ANY_BYTE = rb"[\x00-\xff]"
+GLOBAL_FLAGS = re.compile(rb"\(\?([a-zA-Z]+)\)")
+INLINE_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+
+CONDITION_TOKEN = re.compile(r"\s*(\$?\w+|\(|\))")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def rule_settings():
+    """
+    Rule pack paths (files or directories) and the compiled rule cache
+    directory, from the "rule_packs" and "cache_dir" settings.
+    """
+    import result_cache
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    paths = settings.get("rule_packs", [RULES_DIR])
+    return [paths] if isinstance(paths, str) else list(paths), result_cache.cache_settings()[0]
+
+
+def pack_files(paths):
+    """
+    Rule pack files under the given files and directories, in a stable order.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names if name.endswith(PACK_EXTENSIONS))
+        elif os.path.isfile(path):
+            files.append(path)
+    return sorted(files)
+
+
+def _read_pack(path, source):
+    if path.endswith(".json") or path == BUILTIN_SOURCE:
+        pack = json.loads(source)
+    elif yaml is None:
+        raise RuleError(f"{path} is a YAML rule pack; install PyYAML to load it")
+    else:
+        pack = yaml.safe_load(source)
+    if not isinstance(pack, dict) or not isinstance(pack.get("rules"), list):
+        raise RuleError(f"{path} is not a rule pack: expected a mapping with a list of rules")
+    return pack
+
+
+def builtin_pack(signatures):
+    """
+    A rule pack holding the built-in signatures, one regex rule each.
+    """
+    return {"name": "builtin", "rules": [
+        {"id": name, "strings": {"$signature": {"regex": pattern.decode("latin-1")}}}
+        for name, pattern in signatures.items()
+    ]}
+
+
+def _hex_pattern(text):
+    """
+    (literal bytes, None) for a plain hex string, else (None, regex bytes).
+    """
+    literal = bytearray()
+    parts = []
+    wildcard = False
+    for token in re.findall(r"\?\?|\[\d+(?:-\d+)?\]|[0-9a-fA-F]{2}|\S", text):
+        if token == "??":
+            parts.append(ANY_BYTE)
+            wildcard = True
+        elif token.startswith("["):
+            low, _, high = token[1:-1].partition("-")
+            parts.append(ANY_BYTE + b"{%d,%d}" % (int(low), int(high or low)))
+            wildcard = True
+        elif len(token) == 2:
+            byte = bytes.fromhex(token)
+            literal += byte
+            parts.append(re.escape(byte))
+        else:
+            raise RuleError(f"bad hex pattern {text!r}: unexpected {token!r}")
+    if not parts:
+        raise RuleError("empty hex pattern")
+    return (None, b"".join(parts)) if wildcard else (bytes(literal), None)
+
+
+def _string_variants(spec):
+    """
+    (literal, nocase, regex, flags) variants a string spec is matched as.
+    """
+    if isinstance(spec, str):
+        spec = {"text": spec}
+    if not isinstance(spec, dict):
+        raise RuleError(f"bad string {spec!r}")
+    nocase = bool(spec.get("nocase"))
+    if "text" in spec:
+        encodings = []
+        if spec.get("ascii", True):
+            encodings.append("utf-8")
+        if spec.get("wide"):
+            encodings.append("utf-16-le")
+        variants = []
+        for encoding in encodings:
+            literal = spec["text"].encode(encoding)
+            if not literal:
+                raise RuleError("empty text string")
+            if len(literal) > MAX_TRIE_LITERAL:
+                variants.append((None, nocase, re.escape(literal), re.IGNORECASE if nocase else 0))
+            else:
+                variants.append((literal.lower() if nocase else literal, nocase, None, 0))
+        return variants
+    if "hex" in spec:
+        literal, regex = _hex_pattern(spec["hex"])
+        if literal is not None and len(literal) <= MAX_TRIE_LITERAL:
+            return [(literal, False, None, 0)]
+        return [(None, False, regex if regex is not None else re.escape(literal), 0)]
+    if "regex" in spec:
+        flags = re.IGNORECASE if nocase else 0
+        try:
+            # Regexes match bytes: each character stands for the byte of the same value.
+            pattern = spec["regex"].encode("latin-1")
+            # Leading inline flags become scoped ones in the combined scanner.
+            leading = GLOBAL_FLAGS.match(pattern)
+            if leading:
+                for letter in leading.group(1).decode():
+                    flags |= INLINE_FLAGS[letter]
+                pattern = pattern[leading.end():]
+            compiled = re.compile(pattern, flags)
+        except (UnicodeEncodeError, KeyError, re.error) as e:
+            raise RuleError(f"bad regex {spec['regex']!r}: {e}")
+        if compiled.match(b""):
+            raise RuleError(f"regex {spec['regex']!r} matches the empty string")
+        return [(None, nocase, pattern, flags)]
+    raise RuleError(f"string {spec!r} has no text, hex or regex")
+
+
+def _trie_pattern(literals):
+    """
+    A regex matching any of the literals, written as a prefix trie. Where one
+    literal is a prefix of another, the longer one is preferred.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for byte in literal:
+            node = node.setdefault(byte, {})
+        node[None] = True
+
+    def build(node):
+        branches = [re.escape(bytes([byte])) + build(child) for byte, child in sorted(
+            (item for item in node.items() if item[0] is not None), key=lambda item: item[0]
+        )]
+        if not branches:
+            return b""
+        if len(branches) > 1:
+            body = b"(?:" + b"|".join(branches) + b")"
+        elif None in node and len(branches[0]) > 1:
+            body = b"(?:" + branches[0] + b")"
+        else:
+            body = branches[0]
+        return body + b"?" if None in node else body
+
+    return build(trie) if trie else None
+
+
+def _leading_literals(items):
+    prefix = bytearray()
+    for op, argument in items:
+        if op is sre_parse.LITERAL:
+            prefix.append(argument)
+            continue
+        if op is sre_parse.BRANCH:
+            branches = [_leading_literals(branch) for branch in argument[1]]
+            if all(branches):
+                return [bytes(prefix) + branch_prefix for branch in branches for branch_prefix in branch]
+        break
+    return [bytes(prefix)] if prefix else None
+
+
+def regex_prefixes(pattern, flags):
+    """
+    Literal byte strings one of which every match of a regex starts with, or
+    None when there are none of at least MIN_REGEX_PREFIX bytes.
+    """
+    if flags & re.IGNORECASE:
+        return None
+    prefixes = _leading_literals(sre_parse.parse(pattern, flags))
+    if not prefixes or min(len(prefix) for prefix in prefixes) < MIN_REGEX_PREFIX:
+        return None
+    return [prefix[:MAX_TRIE_LITERAL] for prefix in prefixes]
+
+
+def compile_rules(packs):
+    """
+    Compile rule packs (dicts) into the tables a RuleSet is built from.
+    """
+    rules = []
+    literals = ({}, {})
+    regexes = []
+    seen = set()
+    for pack in packs:
+        for position, rule in enumerate(pack["rules"]):
+            rule_id = str(rule.get("id") or rule.get("name") or f"{pack.get('name', 'rules')}:{position}")
+            if rule_id in seen:
+                raise RuleError(f"duplicate rule id {rule_id!r}")
+            seen.add(rule_id)
+            strings = rule.get("strings") or {}
+            if not strings:
+                raise RuleError(f"rule {rule_id!r} has no strings")
+            string_ids = [sid.lstrip("$") for sid in strings]
+            condition = str(rule.get("condition", "any"))
+            compile_condition(condition, string_ids)
+            index = len(rules)
+            for sid, spec in strings.items():
+                for literal, nocase, regex, flags in _string_variants(spec):
+                    if literal is not None:
+                        literals[nocase].setdefault(literal, []).append((index, sid.lstrip("$")))
+                    else:
+                        regexes.append((regex, flags, index, sid.lstrip("$"), regex_prefixes(regex, flags)))
+            meta = dict(rule.get("meta") or {})
+            meta.setdefault("pack", pack.get("name", ""))
+            rules.append({"id": rule_id, "meta": meta, "strings": string_ids, "condition": condition})
+    return {
+        "version": COMPILED_VERSION,
+        "rules": rules,
+        "literals": literals[False],
+        "nocase_literals": literals[True],
+        # Case-sensitive literals and regex prefixes are found in one pass.
+        "literal_pattern": _trie_pattern(set(literals[False]).union(
+            prefix for _, _, _, _, prefixes in regexes if prefixes for prefix in prefixes
+        )),
+        "nocase_pattern": _trie_pattern(literals[True]),
+        "regexes": regexes,
+    }
+
+
+def compile_condition(text, string_ids):
+    """
+    Compile a rule condition into a function of the set of string ids that
+    matched. Raises RuleError for a malformed condition or an unknown id.
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = CONDITION_TOKEN.match(text, position)
+        if not match:
+            raise RuleError(f"bad condition {text!r} at {text[position:]!r}")
+        tokens.append(match.group(1))
+        position = match.end()
+    tokens.append(None)
+    known = set(string_ids)
+    total = len(string_ids)
+    index = 0
+
+    def peek():
+        return tokens[index]
+
+    def take(expected=None):
+        nonlocal index
+        token = tokens[index]
+        if expected is not None and token != expected:
+            raise RuleError(f"bad condition {text!r}: expected {expected!r}, got {token!r}")
+        index += 1
+        return token
+
+    def expression():
+        terms = [conjunction()]
+        while peek() == "or":
+            take()
+            terms.append(conjunction())
+        return terms[0] if len(terms) == 1 else (lambda hits: any(term(hits) for term in terms))
+
+    def conjunction():
+        factors = [factor()]
+        while peek() == "and":
+            take()
+            factors.append(factor())
+        return factors[0] if len(factors) == 1 else (lambda hits: all(factor(hits) for factor in factors))
+
+    def factor():
+        token = take()
+        if token == "not":
+            inner = factor()
+            return lambda hits: not inner(hits)
+        if token == "(":
+            inner = expression()
+            take(")")
+            return inner
+        if token in ("any", "all") or (token is not None and token.isdigit()):
+            needed = {"any": 1, "all": total}.get(token) or int(token)
+            if peek() == "of":
+                take()
+                take("them")
+            return lambda hits: len(hits) >= needed
+        if token is not None and token.lstrip("$") in known:
+            sid = token.lstrip("$")
+            return lambda hits: sid in hits
+        raise RuleError(f"bad condition {text!r}: unexpected {token!r}")
+
+    function = expression()
+    if peek() is not None:
+        raise RuleError(f"bad condition {text!r}: unexpected {peek()!r}")
+    return function
+
+
+def _strip_groups(pattern):
+    return re.sub(rb"\(\?P<\w+>", b"(?:", pattern)
+
+
+def _scanner_branch(pattern, flags):
+    """
+    One alternative of the combined regex scanner. Unflagged patterns are joined
+    bare: wrapping every alternative in a group would stop the regex engine from
+    skipping ahead to the bytes an alternative can start with.
+    """
+    pattern = _strip_groups(pattern)
+    if not flags:
+        return pattern
+    letters = "".join(letter for letter, flag in INLINE_FLAGS.items() if flags & flag)
+    return b"(?%s:%s)" % (letters.encode(), pattern)
+
+
+def _display(data):
+    text = data.decode("latin-1")
+    return text if text.isprintable() else data.hex(" ")
+
+
+def _first(hit):
+    return hit[0]
+
+
+def _overlapping(scanner, data, position, limit):
+    """
+    (offset, matched data) for every position in data[position:limit] where
+    the scanner matches, including positions inside an earlier match. A plain
+    finditer resumes after each match, which would lose a string starting
+    inside another, e.g. "ygote" in "zygote64".
+    """
+    while True:
+        hit = scanner.search(data, position, limit)
+        if hit is None:
+            return
+        yield hit.start(), hit.group()
+        position = hit.start() + 1
+
+
+class RuleSet:
+    """
+    A compiled rule set. scan() yields (offset, rule id, value) hits, where
+    value is the matched data, prefixed with the string id for rules with more
+    than one string.
+    """
+
+    def __init__(self, compiled, digest):
+        self.digest = digest
+        self.rules = compiled["rules"]
+        self.ids = [rule["id"] for rule in self.rules]
+        self._index = {rule_id: index for index, rule_id in enumerate(self.ids)}
+        self.metadata = {rule["id"]: rule["meta"] for rule in self.rules}
+        self._conditions = [compile_condition(rule["condition"], rule["strings"]) for rule in self.rules]
+        self._literals = compiled["literals"]
+        self._nocase_literals = compiled["nocase_literals"]
+        self._literal_scanner = compiled["literal_pattern"] and re.compile(compiled["literal_pattern"])
+        self._nocase_scanner = compiled["nocase_pattern"] and re.compile(compiled["nocase_pattern"])
+        self._prefixed = {}
+        self._regexes = []
+        unprefixed = []
+        for pattern, flags, index, sid, prefixes in compiled["regexes"]:
+            entry = (re.compile(pattern, flags), index, sid)
+            if prefixes:
+                for prefix in prefixes:
+                    self._prefixed.setdefault(prefix, []).append(entry)
+            else:
+                self._regexes.append(entry)
+                unprefixed.append(_scanner_branch(pattern, flags))
+        self._regex_scanner = re.compile(b"|".join(unprefixed)) if unprefixed else None
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _value(self, index, sid, data):
+        if len(self.rules[index]["strings"]) == 1:
+            return _display(data)
+        return f"${sid}: {_display(data)}"
+
+    def _scan_literals(self, scanner, table, prefixed, haystack, base, ram_data, scan_from, limit, start, end):
+        """
+        Trie hits over haystack, which holds ram_data from offset base on (or,
+        for case-insensitive literals, a lowercased copy of it).
+        """
+        ends = {}
+        for offset, key in _overlapping(scanner, haystack, scan_from - base, limit - base):
+            offset += base
+            if offset >= end:
+                break
+            if offset < start:
+                continue
+            # The trie prefers the longest key; shorter ones ending inside it match too.
+            for length in range(1, len(key) + 1):
+                prefix = key[:length]
+                if prefix in table and ends.get(prefix, 0) <= offset:
+                    ends[prefix] = offset + length
+                    for index, sid in table[prefix]:
+                        yield offset, self.ids[index], self._value(index, sid, ram_data[offset:offset + length])
+                for entry in prefixed.get(prefix, ()):
+                    pattern, index, sid = entry
+                    match = ends.get(entry, 0) <= offset and pattern.match(ram_data, offset, limit)
+                    if match:
+                        ends[entry] = max(match.end(), offset + 1)
+                        yield offset, self.ids[index], self._value(index, sid, match.group())
+
+    def _regex_hits(self, pattern, index, sid, ram_data, scan_from, limit, start, end):
+        for match in pattern.finditer(ram_data, scan_from, limit):
+            offset = match.start()
+            if offset >= end:
+                break
+            if offset >= start:
+                yield offset, self.ids[index], self._value(index, sid, match.group())
+
+    def _scan_regexes(self, ram_data, scan_from, limit, start, end):
+        """
+        Hits of the regexes without a literal prefix. The shared alternation
+        only finds where the first of them matches; each regex then runs on its
+        own from there, so that none is lost inside another's match.
+        """
+        first = self._regex_scanner.search(ram_data, scan_from, limit)
+        if first is None or first.start() >= end:
+            return iter(())
+        return heapq.merge(*(
+            self._regex_hits(pattern, index, sid, ram_data, first.start(), limit, start, end)
+            for pattern, index, sid in self._regexes
+        ), key=_first)
+
+    def scan(self, ram_data, scan_from, limit, start, end):
+        """
+        Hits starting in [start, end), matching over ram_data[scan_from:limit],
+        in offset order.
+        """
+        streams = []
+        if self._literal_scanner:
+            streams.append(self._scan_literals(
+                self._literal_scanner, self._literals, self._prefixed,
+                ram_data, 0, ram_data, scan_from, limit, start, end,
+            ))
+        if self._nocase_scanner:
+            # Matching lowercase literals against a lowercased copy is several
+            # times faster than a case-insensitive regex.
+            lowered = ram_data[scan_from:limit].lower()
+            streams.append(self._scan_literals(
+                self._nocase_scanner, self._nocase_literals, {},
+                lowered, scan_from, ram_data, scan_from, limit, start, end,
+            ))
+        if self._regex_scanner:
+            streams.append(self._scan_regexes(ram_data, scan_from, limit, start, end))
+        return heapq.merge(*streams, key=_first)
+
+    def matched_rules(self, hit_strings):
+        """
+        Rule ids whose condition holds, given {rule id: set of string ids that matched}.
+        """
+        matched = set()
+        for index, rule_id in enumerate(self.ids):
+            hits = hit_strings.get(rule_id)
+            if hits and self._conditions[index](hits):
+                matched.add(rule_id)
+        return matched
+
+    def hit_strings(self, rule_id, value):
+        """
+        The string id a hit value came from.
+        """
+        strings = self.rules[self._index[rule_id]]["strings"]
+        if len(strings) == 1:
+            return strings[0]
+        return value[1:].partition(": ")[0]
+
+
+def _literal_table(table, decode):
+    return {decode(literal): entries for literal, entries in table.items()}
+
+
+def save_compiled(compiled, path):
+    """
+    Write compiled tables as JSON, with byte strings hex-encoded.
+    """
+    data = dict(
+        compiled,
+        literals=_literal_table(compiled["literals"], bytes.hex),
+        nocase_literals=_literal_table(compiled["nocase_literals"], bytes.hex),
+        literal_pattern=compiled["literal_pattern"] and compiled["literal_pattern"].hex(),
+        nocase_pattern=compiled["nocase_pattern"] and compiled["nocase_pattern"].hex(),
+        regexes=[
+            (pattern.hex(), flags, index, sid, prefixes and [prefix.hex() for prefix in prefixes])
+            for pattern, flags, index, sid, prefixes in compiled["regexes"]
+        ],
+    )
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary_path, path)
+
+
+def read_compiled(path):
+    """
+    Compiled tables saved by save_compiled(), or None if the file is missing,
+    unreadable or of another COMPILED_VERSION.
+    """
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != COMPILED_VERSION:
+            return None
+        return dict(
+            data,
+            literals=_literal_table(data["literals"], bytes.fromhex),
+            nocase_literals=_literal_table(data["nocase_literals"], bytes.fromhex),
+            literal_pattern=data["literal_pattern"] and bytes.fromhex(data["literal_pattern"]),
+            nocase_pattern=data["nocase_pattern"] and bytes.fromhex(data["nocase_pattern"]),
+            regexes=[
+                (bytes.fromhex(pattern), flags, index, sid, prefixes and [bytes.fromhex(prefix) for prefix in prefixes])
+                for pattern, flags, index, sid, prefixes in data["regexes"]
+            ],
+        )
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+_loaded = {}
+_loaded_by_stat = {}
+
+
+def _sources(signatures, paths):
+    sources = [(BUILTIN_SOURCE, json.dumps(builtin_pack(signatures or {})).encode())]
+    for path in pack_files(paths):
+        with open(path, "rb") as f:
+            sources.append((path, f.read()))
+    return sources
+
+
+def load_rules(signatures=None, paths=None, cache_dir=None):
+    """
+    The rule set made of the built-in signatures and the configured rule packs.
+    Compiled tables are read from the on-disk cache when the rule sources are
+    unchanged, and the finished RuleSet is kept for the life of the process.
+    """
+    default_paths, default_cache_dir = rule_settings()
+    paths = default_paths if paths is None else paths
+    cache_dir = cache_dir or default_cache_dir
+    # Unchanged pack files are not even read again.
+    stat_key = (repr(signatures), cache_dir, tuple(
+        (path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in pack_files(paths)
+    ))
+    if stat_key in _loaded_by_stat:
+        return _loaded_by_stat[stat_key]
+    sources = _sources(signatures, paths)
+    sha256 = hashlib.sha256(str(COMPILED_VERSION).encode())
+    for path, source in sources:
+        sha256.update(path.encode() + b"\0" + hashlib.sha256(source).digest())
+    digest = sha256.hexdigest()
+    if digest in _loaded:
+        _loaded_by_stat[stat_key] = _loaded[digest]
+        return _loaded[digest]
+
+    cache_path = os.path.join(cache_dir, f"{COMPILED_PREFIX}{digest[:32]}{COMPILED_SUFFIX}")
+    compiled = read_compiled(cache_path)
+    if compiled is None:
+        packs = []
+        for path, source in sources:
+            try:
+                packs.append(_read_pack(path, source))
+            except (ValueError, TypeError) as e:
+                raise RuleError(f"cannot load rule pack {path}: {e}") from e
+        compiled = compile_rules(packs)
+        os.makedirs(cache_dir, exist_ok=True)
+        save_compiled(compiled, cache_path)
+    rule_set = RuleSet(compiled, digest)
+    _loaded[digest] = _loaded_by_stat[stat_key] = rule_set
+    return rule_set
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import device_connection
+import logs
+import setting
+from Memory_Acquisition import acquire_memory
+from app_data import extract_app_data
+from data_acquisition import acquire_data
+from jobs import result_failed
+from ram_capture import capture_root_ram, non_root_ram_capture
+
+# Every connected device works through its own queue of jobs while the devices
+# run side by side. At most HOST_CONCURRENCY jobs run on the host at once, and at
+# most HUB_CONCURRENCY on one USB hub, whose devices share its bandwidth.
+HOST_CONCURRENCY = 8
+HUB_CONCURRENCY = 4
+PROGRESS_NAME = "progress.json"
+
+# Job name -> function(device_dir, *args, serial=...) returning a result string.
+JOBS = {
+    "non_root_ram": non_root_ram_capture,
+    "root_ram": capture_root_ram,
+    "data": acquire_data,
+    "app_data": extract_app_data,
+    "process_memory": lambda output_dir, targets, serial=None: acquire_memory(targets, output_dir, serial=serial),
+}
+
+
+def concurrency_settings():
+    """
+    Host-wide and per-hub job limits, from the saved settings.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    host = int(settings.get("device_concurrency", HOST_CONCURRENCY))
+    hub = int(settings.get("hub_concurrency", HUB_CONCURRENCY))
+    return max(1, host), max(1, hub)
+
+
+def device_dir_name(serial):
+    # Network serials look like 192.168.1.20:5555; keep directory names portable.
+    return re.sub(r"[^A-Za-z0-9._-]", "_", serial)
+
+
+class AcquisitionScheduler:
+    """
+    Runs queued acquisition jobs on several devices at once. Each device gets
+    <output_dir>/<serial>/ for its artifacts and a progress.json recording the
+    state of each of its jobs.
+    """
+
+    def __init__(self, output_dir, host_concurrency=None, hub_concurrency=None, hubs=None, progress=None):
+        default_host, default_hub = concurrency_settings()
+        self.output_dir = output_dir
+        self.hub_concurrency = hub_concurrency or default_hub
+        self.hubs = hubs if hubs is not None else device_connection.get_device_hubs()
+        self.progress = progress
+        self.queues = {}
+        self._host_slots = threading.Semaphore(host_concurrency or default_host)
+        self._hub_slots = {}
+        self._lock = threading.Lock()
+
+    def add_job(self, serial, job, *args):
+        """
+        Queue a job (a name from JOBS) for a device; jobs run in the order queued.
+        """
+        if job not in JOBS:
+            raise ValueError(f"Unknown acquisition job: {job}")
+        self.queues.setdefault(serial, []).append((job, args))
+
+    def add_all(self, job, *args, serials=None):
+        """
+        Queue the same job for every connected device, or for the given serials.
+        """
+        for serial in serials if serials is not None else self.hubs:
+            self.add_job(serial, job, *args)
+
+    def _hub_semaphore(self, serial):
+        hub = self.hubs.get(serial, "host")
+        with self._lock:
+            if hub not in self._hub_slots:
+                self._hub_slots[hub] = threading.Semaphore(self.hub_concurrency)
+            return self._hub_slots[hub]
+
+    def _report(self, serial, device_dir, states, index, **entry):
+        states[index].update(entry)
+        with open(os.path.join(device_dir, PROGRESS_NAME + ".tmp"), "w") as f:
+            json.dump({"serial": serial, "jobs": states}, f, indent=4)
+        os.replace(os.path.join(device_dir, PROGRESS_NAME + ".tmp"), os.path.join(device_dir, PROGRESS_NAME))
+        if self.progress:
+            self.progress(serial, states[index]["job"], states[index]["state"])
+
+    def _run_device(self, serial):
+        device_dir = os.path.join(self.output_dir, device_dir_name(serial))
+        os.makedirs(device_dir, exist_ok=True)
+        states = [{"job": job, "state": "queued"} for job, _ in self.queues[serial]]
+        hub_slots = self._hub_semaphore(serial)
+        results = []
+        for index, (job, args) in enumerate(self.queues[serial]):
+            job_id = f"{job}-{index + 1}"
+            # Hub before host, always in this order, so no two devices wait on each other.
+            with logs.context(device=serial, job_id=job_id), hub_slots, self._host_slots:
+                started = time.monotonic()
+                self._report(serial, device_dir, states, index, state="running",
+                             started=time.strftime("%Y-%m-%d %H:%M:%S"))
+                try:
+                    result = JOBS[job](device_dir, *args, serial=serial)
+                    # Job functions report errors and interrupted runs in their result.
+                    state = "failed" if result_failed(result) else "done"
+                except Exception as e:
+                    result = f"Error running {job}: {str(e)}"
+                    state = "failed"
+                elapsed = time.monotonic() - started
+            self._report(serial, device_dir, states, index, state=state, elapsed=round(elapsed, 1),
+                         summary=result.splitlines()[0] if result else "")
+            logs.log_action(f"[{serial}] {job} {state} in {elapsed:.1f} s", device=serial, job_id=job_id, state=state,
+                            elapsed=round(elapsed, 1))
+            results.append((result, state))
+        return results
+
+    def run(self):
+        """
+        Run every device's queue concurrently. Returns {serial: [(result, state), ...]},
+        where state is "done" or "failed".
+        """
+        serials = list(self.queues)
+        if not serials:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(serials)) as executor:
+            return dict(zip(serials, executor.map(self._run_device, serials)))
+
+
+def acquire_all(output_dir, job, *args, progress=None):
+    """
+    Run one acquisition job on every connected device at once and return a
+    combined report.
+    """
+    try:
+        scheduler = AcquisitionScheduler(output_dir, progress=progress)
+        if not scheduler.hubs:
+            return "No devices connected."
+        scheduler.add_all(job, *args)
+        started = time.monotonic()
+        results = scheduler.run()
+        elapsed = time.monotonic() - started
+        states = [state for device_results in results.values() for _, state in device_results]
+        failed = states.count("failed")
+        if failed:
+            lines = [f"Acquisition failed for {failed} of {len(states)} jobs on {len(results)} devices "
+                     f"in {elapsed:.1f} s."]
+        else:
+            lines = [f"Acquired {len(results)} devices in {elapsed:.1f} s."]
+        for serial, device_results in results.items():
+            lines.append(f"=== {serial} ===")
+            lines.extend(result for result, _ in device_results)
+        return "\n".join(lines)
+    except Exception as e:
+        return f"Error scheduling acquisition: {str(e)}"
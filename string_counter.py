@@ -0,0 +1,214 @@
+import heapq
+import hashlib
+from array import array
+
+import page_index
+import setting
+
+# Bounded-memory frequency counting
+#
+# A FrequencyCounter keeps an exact (count, first offset, last offset) entry for
+# each of the first EXACT_CAPACITY distinct values it sees. Values first seen
+# after that table is full are counted in a count-min sketch of SKETCH_DEPTH
+# rows of SKETCH_WIDTH counters, with conservative updates, and the
+# HEAVY_HITTERS of them with the highest estimates are kept by name, along with
+# the offsets they were seen at since entering that summary. Memory is fixed by
+# those three sizes (values are cut to MAX_VALUE_LENGTH bytes), however large
+# the dump and however many distinct values it holds.
+#
+# Estimated counts are upper bounds: a sketch counter also holds the counts of
+# every value hashed to the same cell.
+EXACT_CAPACITY = 65536
+HEAVY_HITTERS = 1024
+SKETCH_WIDTH = 1 << 16
+SKETCH_DEPTH = 4
+MAX_VALUE_LENGTH = 256
+
+# Strings are those of the page index: printable ASCII or UTF-16LE runs of at
+# least page_index.STRING_MIN_LENGTH characters, read STRING_CHUNK bytes at a time.
+STRING_CHUNK = 16 * 1024 * 1024
+ENCODING_NAMES = {page_index.ASCII: "ascii", page_index.UTF16: "utf16"}
+ESTIMATE_SUFFIX = "_estimate"
+
+
+def counter_settings():
+    """
+    Exact capacity, heavy-hitter capacity and sketch width, from the
+    "string_exact_capacity", "string_heavy_hitters" and "string_sketch_width"
+    settings when present.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    return (
+        int(settings.get("string_exact_capacity", EXACT_CAPACITY)),
+        int(settings.get("string_heavy_hitters", HEAVY_HITTERS)),
+        int(settings.get("string_sketch_width", SKETCH_WIDTH)),
+    )
+
+
+class FrequencyCounter:
+    """
+    Occurrence counts and first/last offsets of values (bytes or str) in
+    bounded memory: exact up to a capacity, then estimated.
+    """
+
+    def __init__(self, capacity=None, heavy_hitters=None, width=None, depth=SKETCH_DEPTH):
+        default_capacity, default_heavy_hitters, default_width = counter_settings()
+        self.capacity = default_capacity if capacity is None else capacity
+        self.heavy_hitters = default_heavy_hitters if heavy_hitters is None else heavy_hitters
+        self.width = width or default_width
+        self.depth = depth
+        self.total = 0
+        self.overflow = 0
+        self._exact = {}
+        # value: [estimate, first offset, last offset], and a lazy min-heap of (estimate, value) over it.
+        self._heavy = {}
+        self._floor = []
+        self._sketch = None
+
+    def __len__(self):
+        return len(self._exact) + len(self._heavy)
+
+    def add(self, value, offset):
+        self.total += 1
+        entry = self._exact.get(value)
+        if entry is not None:
+            entry[0] += 1
+            if offset < entry[1]:
+                entry[1] = offset
+            elif offset > entry[2]:
+                entry[2] = offset
+        elif len(self._exact) < self.capacity:
+            self._exact[value] = [1, offset, offset]
+        else:
+            self._add_estimated(value, offset)
+
+    def _cells(self, value):
+        if isinstance(value, str):
+            value = value.encode()
+        digest = hashlib.blake2b(value, digest_size=4 * self.depth).digest()
+        return [
+            row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def estimate(self, value):
+        """
+        The count of a value: exact when it is in the exact table, else the
+        sketch's upper bound (0 before anything overflowed).
+        """
+        entry = self._exact.get(value)
+        if entry is not None:
+            return entry[0]
+        if self._sketch is None:
+            return 0
+        return min(self._sketch[cell] for cell in self._cells(value))
+
+    def _add_estimated(self, value, offset):
+        self.overflow += 1
+        if self._sketch is None:
+            self._sketch = array("Q", bytes(8 * self.width * self.depth))
+        sketch = self._sketch
+        cells = self._cells(value)
+        # Conservative update: only the cells holding the minimum grow.
+        estimate = min(sketch[cell] for cell in cells) + 1
+        for cell in cells:
+            if sketch[cell] < estimate:
+                sketch[cell] = estimate
+
+        entry = self._heavy.get(value)
+        if entry is not None:
+            entry[0] = estimate
+            entry[1] = min(entry[1], offset)
+            entry[2] = max(entry[2], offset)
+            heapq.heappush(self._floor, (estimate, value))
+        elif len(self._heavy) < self.heavy_hitters:
+            self._heavy[value] = [estimate, offset, offset]
+            heapq.heappush(self._floor, (estimate, value))
+        else:
+            weakest_estimate, weakest = self._weakest()
+            if estimate > weakest_estimate:
+                del self._heavy[weakest]
+                heapq.heappop(self._floor)
+                self._heavy[value] = [estimate, offset, offset]
+                heapq.heappush(self._floor, (estimate, value))
+        if len(self._floor) > 4 * max(self.heavy_hitters, 1):
+            self._floor = [(entry[0], heavy_value) for heavy_value, entry in self._heavy.items()]
+            heapq.heapify(self._floor)
+
+    def _weakest(self):
+        # Heap entries whose estimate has since grown, or whose value was evicted, are stale.
+        while True:
+            estimate, value = self._floor[0]
+            entry = self._heavy.get(value)
+            if entry is not None and entry[0] == estimate:
+                return estimate, value
+            heapq.heappop(self._floor)
+
+    def items(self):
+        """
+        (value, count, first offset, last offset, estimated) for every tracked
+        value: the exact table first, then the heavy hitters.
+        """
+        for value, (count, first_offset, last_offset) in self._exact.items():
+            yield value, count, first_offset, last_offset, False
+        for value, (estimate, first_offset, last_offset) in self._heavy.items():
+            yield value, estimate, first_offset, last_offset, True
+
+
+def iter_strings(ram_data, start=0, end=None, zero_flags=None):
+    """
+    Yield (offset, encoding, value) for the ASCII and UTF-16LE strings starting
+    between start and end in an open dump, where value is the raw string cut to
+    MAX_VALUE_LENGTH bytes. With the zero page flags of a page index, zero pages
+    are skipped.
+    """
+    end = len(ram_data) if end is None else min(end, len(ram_data))
+    spans = [(start, end)] if zero_flags is None else page_index.nonzero_spans(zero_flags, start, end)
+    for span_start, span_end in spans:
+        for chunk_start in range(span_start, span_end, STRING_CHUNK):
+            chunk_end = min(chunk_start + STRING_CHUNK, span_end)
+            # A string running on past the chunk is read whole up to the overlap; one
+            # reaching back into the previous chunk was already found there.
+            scan_from = max(span_start, chunk_start - page_index.STRING_OVERLAP)
+            limit = min(span_end, chunk_end + page_index.STRING_OVERLAP)
+            data = ram_data[scan_from:limit]
+            classes = data.translate(page_index.STRING_CLASSES)
+            for encoding, pattern in page_index.STRING_PATTERNS:
+                for match in pattern.finditer(classes, chunk_start - scan_from):
+                    offset = scan_from + match.start()
+                    if offset >= chunk_end:
+                        break
+                    yield offset, encoding, data[match.start():min(match.end(), match.start() + MAX_VALUE_LENGTH)]
+
+
+def count_strings(ram_data, zero_flags=None, counter=None):
+    """
+    Count the strings of an open dump into a FrequencyCounter, keyed on their
+    raw bytes, so an ASCII string and its UTF-16LE form are counted apart.
+    """
+    counter = counter or FrequencyCounter()
+    add = counter.add
+    for offset, _, value in iter_strings(ram_data, zero_flags=zero_flags):
+        add(value, offset)
+    return counter
+
+
+def decode_string(value):
+    """
+    (encoding name, text) of a raw string found by iter_strings.
+    """
+    if len(value) > 1 and value[1] == 0:
+        return ENCODING_NAMES[page_index.UTF16], value[:len(value) & ~1].decode("utf-16-le")
+    return ENCODING_NAMES[page_index.ASCII], value.decode("ascii")
+
+
+def finding_rows(counter, analyzer="strings"):
+    """
+    Findings store rows (report_store.COLUMNS order) for a string counter. The
+    kind is the encoding, with ESTIMATE_SUFFIX when the count is an estimate.
+    """
+    for value, count, first_offset, last_offset, estimated in counter.items():
+        encoding, text = decode_string(value)
+        yield analyzer, encoding + ESTIMATE_SUFFIX if estimated else encoding, text, count, first_offset, last_offset
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+import adb_session
+import benchmark
+
+
+@pytest.fixture
+def fake_adb(tmp_path, monkeypatch):
+    """
+    The benchmark's fake adb, with no latency or bandwidth limit, as adb_session's adb.
+    """
+    dump_path = tmp_path / "dump.img"
+    dump_path.write_bytes(bytes(4096))
+    with benchmark.fake_device(str(dump_path), latency_ms=0, bandwidth_mb=0) as (adb, environment):
+        for name, value in environment.items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("FAKE_ADB_TIME_SCALE", "1")
+        monkeypatch.setattr(adb_session, "ADB_EXECUTABLE", adb)
+        yield adb
+        adb_session.close_all()
+
+
+def run_with_deadline(function, seconds=30):
+    """
+    Run function on a thread; fail instead of hanging if it does not return in time.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = function()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), "call did not return"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def test_consecutive_commands_are_framed_apart(fake_adb):
+    pool = adb_session.SessionPool(size=1)
+    try:
+        assert pool.run("getprop ro.product.model") == (0, b"Fake Device\n", b"")
+        return_code, stdout, stderr = pool.run("ls /nowhere")
+        assert return_code == 1 and stdout == b"" and b"No such file" in stderr
+        assert pool.run("wm size") == (0, b"Physical size: 1080x2400\n", b"")
+        assert len(pool._sessions) == 1
+    finally:
+        pool.close()
+
+
+def test_sink_receives_streamed_output(fake_adb):
+    chunks = []
+    return_code, stdout, _ = adb_session.run_shell("ps", sink=chunks.append)
+    assert return_code == 0 and stdout == b""
+    output = b"".join(chunks)
+    assert output.startswith(b"USER PID") and output.count(b"\n") == 401
+
+
+def test_concurrent_commands_share_the_pool(fake_adb):
+    pool = adb_session.SessionPool(size=2)
+    commands = ["getprop ro.product.model", "wm size", "pidof zygote", "dumpsys battery"] * 4
+    try:
+        expected = [pool.run(command) for command in commands[:4]] * 4
+        results = [None] * len(commands)
+
+        def run(index):
+            results[index] = pool.run(commands[index])
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(commands))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        assert results == expected
+        assert len(pool._sessions) <= 2
+    finally:
+        pool.close()
+
+
+def test_timed_out_session_is_replaced(fake_adb):
+    pool = adb_session.SessionPool(size=1)
+    try:
+        with pytest.raises(TimeoutError):
+            pool.run("screenrecord --time-limit 30 /sdcard/screen_record.mp4", timeout=0.5)
+        assert pool.run("wm size", timeout=10)[0] == 0
+    finally:
+        pool.close()
+
+
+def test_failed_session_start_releases_its_slot(fake_adb, monkeypatch):
+    pool = adb_session.SessionPool(size=2)
+    monkeypatch.setattr(adb_session, "ADB_EXECUTABLE", "/nonexistent/adb")
+    for _ in range(3):
+        with pytest.raises(OSError):
+            run_with_deadline(lambda: pool.run("wm size"))
+    monkeypatch.setattr(adb_session, "ADB_EXECUTABLE", fake_adb)
+    try:
+        assert run_with_deadline(lambda: pool.run("wm size"))[0] == 0
+    finally:
+        pool.close()
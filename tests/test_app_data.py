@@ -0,0 +1,30 @@
+import io
+import os
+import sys
+import tarfile
+
+import app_data
+import integrity
+
+
+def test_cut_short_file_is_recorded_as_partial(tmp_path, monkeypatch):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, size in (("com.example/databases/small.db", 1000), ("com.example/files/large.bin", 200000)):
+            member = tarfile.TarInfo(name)
+            member.size = size
+            tar.addfile(member, io.BytesIO(os.urandom(size)))
+    archive_path = tmp_path / "archive.tar"
+    # The stream ends in the middle of large.bin.
+    archive_path.write_bytes(archive.getvalue()[:100000])
+    monkeypatch.setattr(app_data, "tar_command", lambda package, serial=None: [
+        sys.executable, "-c", f"import sys; sys.stdout.buffer.write(open({str(archive_path)!r}, 'rb').read())",
+    ])
+
+    output_dir = tmp_path / "case"
+    line, files, _ = app_data.extract_package("com.example", str(output_dir))
+    assert "archive cut short" in line and files == 2
+    artifacts = integrity.load_manifest(str(output_dir))["artifacts"]
+    assert artifacts["app_data/com.example/files/large.bin"]["partial"]
+    assert "partial" not in artifacts["app_data/com.example/databases/small.db"]
+    assert "large.bin: OK (partial)" in integrity.verify_manifest(str(output_dir))
@@ -0,0 +1,30 @@
+import io
+import sys
+
+import collector
+
+
+def test_results_quote_only_an_excerpt_of_large_output(tmp_path):
+    commands = {
+        "Short": [sys.executable, "-c", "print('  Physical size: 1080x2400  ')"],
+        "Long": [sys.executable, "-c", "print('line\\n' * 100000)"],
+    }
+    file_paths = {key: str(tmp_path / f"{key}.txt") for key in commands}
+    short, long = collector.run_commands(commands, file_paths)
+    assert short == "Short:\nPhysical size: 1080x2400\n"
+    size = len("line\n" * 100000) - 1
+    assert len(long) < collector.RESULT_EXCERPT + 200
+    assert long.endswith(f"... ({size - collector.RESULT_EXCERPT} more bytes in {file_paths['Long']})\n")
+    with open(file_paths["Long"], "rb") as f:
+        assert len(f.read()) == size
+
+
+def test_held_back_whitespace_is_bounded():
+    output = io.BytesIO()
+    stripped = collector._StrippedWriter(output)
+    stripped.write(b"  start")
+    for _ in range(100):
+        stripped.write(b" " * 65536)
+    assert len(stripped.pending) <= collector.MAX_HELD_WHITESPACE
+    stripped.write(b"end\n\n")
+    assert output.getvalue() == b"start" + b" " * 6553600 + b"end"
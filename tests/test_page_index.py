@@ -0,0 +1,39 @@
+import os
+import shutil
+
+import dump_analysis
+import page_index
+
+
+def write_dump(path, text):
+    data = bytearray(64 * page_index.PAGE_SIZE)
+    data[5 * page_index.PAGE_SIZE:5 * page_index.PAGE_SIZE + len(text)] = text
+    path.write_bytes(bytes(data))
+
+
+def test_rewrite_with_same_mtime_is_reindexed(tmp_path):
+    dump_path = tmp_path / "dump.img"
+    write_dump(dump_path, b"original contents")
+    dump_analysis.build_page_index(str(dump_path))
+    mtime_ns = os.stat(dump_path).st_mtime_ns
+    write_dump(dump_path, b"rewritten contents")
+    os.utime(dump_path, ns=(mtime_ns, mtime_ns))
+
+    digest = dump_analysis.content_digest(str(dump_path))
+    assert page_index.load_index(str(dump_path), digest) is None
+    assert dump_analysis.search_strings(str(dump_path), "original") == []
+    assert len(dump_analysis.search_strings(str(dump_path), "rewritten")) == 1
+
+
+def test_copied_dump_keeps_its_index(tmp_path):
+    dump_path = tmp_path / "dump.img"
+    write_dump(dump_path, b"original contents")
+    dump_analysis.build_page_index(str(dump_path))
+    copy_path = tmp_path / "copy.img"
+    shutil.copy(dump_path, copy_path)
+    shutil.copy(page_index.index_path(str(dump_path)), page_index.index_path(str(copy_path)))
+    os.utime(copy_path)
+
+    assert dump_analysis.build_page_index(str(copy_path), dump_analysis.content_digest(str(copy_path))).endswith(
+        "is up to date."
+    )
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+import adb_session
+import benchmark
+import dump_container
+import integrity
+import jobs
+import ram_capture
+from test_adb_session import run_with_deadline
+
+MEMORY_SIZE = 4 * 1024 * 1024
+
+
+@pytest.fixture
+def fake_adb(tmp_path, monkeypatch):
+    """
+    The benchmark's fake adb serving a small dump as /dev/mem.
+    """
+    dump_path = tmp_path / "memory.img"
+    dump_path.write_bytes(os.urandom(MEMORY_SIZE))
+    with benchmark.fake_device(str(dump_path), latency_ms=0, bandwidth_mb=0) as (adb, environment):
+        for name, value in environment.items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setattr(adb_session, "ADB_EXECUTABLE", adb)
+        yield dump_path
+        adb_session.close_all()
+
+
+def test_short_planned_range_is_padded_and_partial(fake_adb, tmp_path, monkeypatch):
+    # /proc/iomem claims a megabyte more than /dev/mem returns.
+    monkeypatch.setattr(ram_capture, "read_iomem_segments", lambda serial=None: [(0, MEMORY_SIZE + 1024 * 1024)])
+    output_dir = tmp_path / "case"
+    result = ram_capture.capture_root_ram_ranges(str(output_dir), range_size=1024 * 1024, streams=2)
+    assert "the dump is partial" in result
+
+    image = (output_dir / "ram_dump.img").read_bytes()
+    assert image == fake_adb.read_bytes() + bytes(1024 * 1024)
+    table = json.loads((output_dir / "ram_dump.img.ranges.json").read_text())
+    assert [entry["file_offset"] for entry in table] == [index * 1024 * 1024 for index in range(5)]
+    assert table[-1]["read"] == 0 and all("read" not in entry for entry in table[:-1])
+    assert integrity.load_manifest(str(output_dir))["artifacts"]["ram_dump.img"]["partial"]
+
+
+def test_cancelled_container_capture_is_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(ram_capture, "PROGRESS_INTERVAL", 0)
+    threads = threading.active_count()
+    command = [sys.executable, "-c", "import sys; sys.stdout.buffer.write(b'data' * (8 * 1024 * 1024))"]
+
+    def cancel(bytes_written, _):
+        raise jobs.JobCancelled("capture cancelled")
+
+    output_path = str(tmp_path / "ram_dump.cimg")
+    with pytest.raises(jobs.JobCancelled):
+        ram_capture.stream_adb_output(command, output_path, cancel, record=False, container=True)
+    assert threading.active_count() == threads
+    with dump_container.ContainerReader(output_path) as reader:
+        assert 0 < len(reader) and reader[:8] == b"datadata"
+
+
+def test_stderr_is_read_while_stdout_streams(tmp_path):
+    # Far more stderr than a pipe buffer holds, written before stdout is closed.
+    script = "import sys; sys.stderr.write('warning\\n' * 200000); sys.stderr.flush(); sys.stdout.buffer.write(b'data')"
+    result = run_with_deadline(lambda: ram_capture.stream_adb_output(
+        [sys.executable, "-c", script], str(tmp_path / "ram_dump.img"), record=False,
+    ))
+    bytes_written, _, return_code, stderr, _ = result
+    assert (bytes_written, return_code) == (4, 0) and stderr.count("warning") == 200000
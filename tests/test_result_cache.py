@@ -0,0 +1,29 @@
+import benchmark
+import dump_analysis
+import report_store
+import result_cache
+
+
+def test_rows_are_streamed_through_an_entry(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "cache"), 1024 * 1024)
+    rows = (["strings", "ascii", f"value {number}", 1, number, number] for number in range(1000))
+    cache.put("pages:0", "strings", "1-0", rows)
+    assert next(rows, None) is None
+    assert list(cache.get("pages:0", "strings", "1-0")) == [
+        ["strings", "ascii", f"value {number}", 1, number, number] for number in range(1000)
+    ]
+    assert cache.get("pages:0", "strings", "2-0") is None
+
+
+def test_cached_analysis_matches_a_fresh_one(tmp_path, monkeypatch):
+    # The compiled rule cache goes to the cache directory too.
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    dump_path = str(tmp_path / "dump.img")
+    benchmark.make_dump(dump_path, 2)
+    cache = result_cache.ResultCache(max_bytes=64 * 1024 * 1024)
+    results = []
+    for expected_cached in (0, len(dump_analysis.ANALYZER_VERSIONS)):
+        with report_store.FindingStore(report_store.new_store_path(str(tmp_path))) as store:
+            assert dump_analysis.cached_analysis(dump_path, store, cache=cache) == expected_cached
+            results.append(sorted(store.rows()))
+    assert results[0] and results[0] == results[1]
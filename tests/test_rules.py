@@ -0,0 +1,57 @@
+import json
+import re
+
+import rules
+
+PACK = {"name": "test", "rules": [
+    {"id": "zygote", "strings": {"$name": "zygote64"}},
+    {"id": "ygote", "strings": {"$name": "ygote"}},
+    {"id": "c2 url", "strings": {"$url": "http://c2.example.net/beacon"}},
+    {"id": "c2 domain", "strings": {"$domain": {"text": "C2.EXAMPLE.NET", "nocase": True}}},
+    {"id": "both", "strings": {"$a": "zygote", "$b": "example.net/beacon"}, "condition": "all"},
+    {"id": "digits", "strings": {"$run": {"regex": "[0-9]{4}"}}},
+    {"id": "digit pairs", "strings": {"$run": {"regex": "(?:[0-9]{2})+7"}}},
+]}
+DATA = b"\x00zygote64\x00GET http://c2.example.net/beacon\x00aaaa 12345678\x00"
+
+
+def load(tmp_path):
+    pack_path = tmp_path / "pack.json"
+    pack_path.write_text(json.dumps(PACK))
+    return rules.load_rules({}, [str(pack_path)], str(tmp_path / "cache"))
+
+
+def own_hits(rule_set):
+    """
+    Hits found by running every string on its own, the way each would be found
+    without the shared trie and alternation.
+    """
+    hits = []
+    for rule in PACK["rules"]:
+        for sid, spec in rule["strings"].items():
+            for literal, nocase, regex, flags in rules._string_variants(spec):
+                pattern = re.compile(re.escape(literal) if literal is not None else regex, flags)
+                haystack = DATA.lower() if nocase else DATA
+                for match in pattern.finditer(haystack):
+                    value = rule_set._value(rule_set._index[rule["id"]], sid[1:], DATA[match.start():match.end()])
+                    hits.append((match.start(), rule["id"], value))
+    return sorted(hits)
+
+
+def test_strings_inside_other_matches_are_found(tmp_path):
+    rule_set = load(tmp_path)
+    hits = list(rule_set.scan(DATA, 0, len(DATA), 0, len(DATA)))
+    assert [hit[0] for hit in hits] == sorted(hit[0] for hit in hits)
+    assert sorted(hits) == own_hits(rule_set)
+    assert {"ygote", "c2 domain", "both"} <= {rule_id for _, rule_id, _ in hits}
+
+
+def test_compiled_cache_is_json(tmp_path):
+    expected = list(load(tmp_path).scan(DATA, 0, len(DATA), 0, len(DATA)))
+    [cache_path] = (tmp_path / "cache").iterdir()
+    assert cache_path.suffix == ".json"
+    rules._loaded.clear()
+    rules._loaded_by_stat.clear()
+    compiled = rules.read_compiled(str(cache_path))
+    assert compiled is not None
+    assert list(rules.RuleSet(compiled, "").scan(DATA, 0, len(DATA), 0, len(DATA))) == expected
@@ -0,0 +1,49 @@
+import benchmark
+import dump_analysis
+
+
+def per_function_counts(ram_data):
+    """
+    Matches per analyzer found by each analyzer's own pattern, the way the
+    per-function scanners sweep the dump.
+    """
+    counts = dict.fromkeys(dump_analysis.ANALYZER_NAMES[:-1], 0)
+    for _, analyzer, pattern, _ in dump_analysis.TOKEN_ANALYZERS:
+        counts[analyzer] += sum(1 for _ in dump_analysis._finditer(pattern, ram_data))
+    return counts
+
+
+def scan_counts(ram_data, window_size=None):
+    counts = dict.fromkeys(dump_analysis.ANALYZER_NAMES[:-1], 0)
+    windows = dump_analysis.iter_windows(len(ram_data), window_size) if window_size else [None]
+    for window in windows:
+        for _, kind, _ in dump_analysis.scan(ram_data, window, analyzers=dump_analysis.ANALYZER_NAMES[:-1]):
+            counts[dump_analysis.TOKEN_OWNERS[kind][0]] += 1
+    return counts
+
+
+def test_scan_matches_per_function_scanners(tmp_path):
+    dump_path = tmp_path / "dump.img"
+    benchmark.make_dump(str(dump_path), 4)
+    ram_data = dump_path.read_bytes()
+    expected = per_function_counts(ram_data)
+    assert all(expected.values())
+    assert scan_counts(ram_data) == expected
+    assert scan_counts(ram_data, 256 * 1024) == expected
+
+
+def test_overlapping_tokens_are_reported_to_every_owner():
+    ram_data = (
+        b"\x00" * 16 + b"/data/data/com.example/files/10.0.0.5:41234 93.184.216.34:443 ESTABLISHED "
+        b"3f786850e387550fdab836ed7e6dc881de23001b" + b"\x00" * 16
+    )
+    kinds = [kind for _, kind, _ in dump_analysis.scan(ram_data, analyzers=dump_analysis.ANALYZER_NAMES[:-1])]
+    assert kinds.count("connection") == 1
+    assert kinds.count("hex_key") == 1
+    assert kinds.count("base64_key") >= 1
+    assert "deleted_file" in kinds
+
+
+def test_deleted_file_paths_stop_at_whitespace():
+    matches = dump_analysis.DELETED_FILE_PATTERN.findall(b"see /data/local tmp and more text/words /sdcard/a.txt")
+    assert matches == [b"/data/local", b"/sdcard/a.txt"]
@@ -0,0 +1,29 @@
+import json
+
+import cli
+import device_connection
+import scheduler
+
+
+def test_interrupted_job_fails_the_acquisition(tmp_path, monkeypatch, capsys):
+    results = {
+        "emulator-5554": "Rooted RAM capture completed. RAM dump saved at ram_dump.img",
+        "emulator-5556": "Rooted RAM capture interrupted; run it again to resume.\nrange 3: adb failed",
+    }
+    # The activity log is written to the working directory.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(device_connection, "get_device_hubs", lambda: dict.fromkeys(results, "hub"))
+    monkeypatch.setitem(scheduler.JOBS, "root_ram", lambda output_dir, serial=None: results[serial])
+
+    assert cli.main(["capture", "--rooted", "--all-devices", "-o", str(tmp_path)]) == 1
+    assert "Acquisition failed for 1 of 2 jobs" in capsys.readouterr().out
+    progress = json.loads((tmp_path / "emulator-5556" / scheduler.PROGRESS_NAME).read_text())
+    assert progress["jobs"][0]["state"] == "failed"
+
+
+def test_interrupted_capture_exits_non_zero(tmp_path, monkeypatch):
+    import ram_capture
+    monkeypatch.setattr(ram_capture, "capture_root_ram", lambda *args, **kwargs: (
+        "Rooted RAM capture interrupted; run it again to resume.\nrange 0: adb failed"
+    ))
+    assert cli.main(["capture", "--rooted", "-q", "-o", str(tmp_path)]) == 1
@@ -0,0 +1,458 @@
+import bisect
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import (
+    Qt, QAbstractListModel, QAbstractTableModel, QModelIndex, QTimer, pyqtSignal,
+)
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox, QListView, QTableView, QHeaderView,
+    QAbstractItemView,
+)
+
+import report_store
+import setting
+
+# Virtualized log and findings views
+#
+# Qt item views only ask their model for the rows on screen, so painting costs
+# the same for a hundred rows as for a million. LogModel holds the activity log
+# as one row per line, at most MAX_LOG_ROWS of them (the oldest are dropped):
+# append() only queues a message, and the queued lines are inserted in one
+# batch per UPDATE_INTERVAL_MS. Its filter tests FILTER_CHUNK lines per pass
+# of the event loop, adding matches as they are found. FindingsModel pages findings out of a findings
+# store PAGE_SIZE rows at a time as the view scrolls towards the end, up to
+# MAX_FINDING_ROWS; narrowing the filters is the way past that cap. Its
+# queries run on a worker thread with their own connection, so a slow text
+# search never stalls the GUI thread, and a filter change interrupts the
+# query in progress. Text filters apply FILTER_DELAY_MS after the last
+# keystroke. Long values are cut to MAX_CELL_LENGTH characters for display.
+MAX_LOG_ROWS = 100000
+MAX_FINDING_ROWS = 200000
+PAGE_SIZE = 1000
+UPDATE_INTERVAL_MS = 50
+FILTER_DELAY_MS = 250
+MAX_CELL_LENGTH = 1000
+FILTER_CHUNK = 20000
+
+FINDING_HEADERS = ("Offset", "Analyzer", "Kind", "Value", "Count", "Last offset")
+
+
+def viewer_settings():
+    """
+    Row caps of the log and findings views, from the "log_view_rows" and
+    "findings_view_rows" settings.
+    """
+    settings = setting.load_settings()
+    if not isinstance(settings, dict):
+        settings = {}
+    return (
+        int(settings.get("log_view_rows", MAX_LOG_ROWS)),
+        int(settings.get("findings_view_rows", MAX_FINDING_ROWS)),
+    )
+
+
+def _cell(text):
+    return text if len(text) <= MAX_CELL_LENGTH else text[:MAX_CELL_LENGTH] + "…"
+
+
+class LogModel(QAbstractListModel):
+    """
+    Activity log lines, appended in batches and capped at max_rows, optionally
+    filtered by a case-insensitive substring.
+    """
+
+    def __init__(self, max_rows=MAX_LOG_ROWS, parent=None):
+        super().__init__(parent)
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._lines = []
+        self._pending = []
+        # Lines are numbered from the first line ever added; _first is the number of _lines[0].
+        self._first = 0
+        self._needle = None
+        self._matches = []
+        self._scanned = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._update)
+
+    def append(self, message):
+        self._pending.extend(str(message).splitlines() or [""])
+        if not self._timer.isActive():
+            self._timer.start(UPDATE_INTERVAL_MS)
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self._needle = text.lower() or None
+        self._matches = []
+        self._scanned = self._first
+        self.endResetModel()
+        self._timer.start(0)
+
+    def _update(self):
+        if self._pending:
+            self._insert_pending()
+        end = self._first + len(self._lines)
+        if self._needle is not None and self._scanned < end:
+            self._scan(min(end, self._scanned + FILTER_CHUNK))
+            if self._scanned < end:
+                # Let the event loop run before testing the next chunk.
+                self._timer.start(0)
+
+    def _insert_pending(self):
+        pending, self._pending = self._pending, []
+        if len(pending) > self.max_rows:
+            self.dropped += len(pending) - self.max_rows
+            pending = pending[-self.max_rows:]
+        overflow = min(len(self._lines) + len(pending) - self.max_rows, len(self._lines))
+        if overflow > 0:
+            self._drop(overflow)
+        if self._needle is None:
+            self.beginInsertRows(QModelIndex(), len(self._lines), len(self._lines) + len(pending) - 1)
+            self._lines.extend(pending)
+            self.endInsertRows()
+        else:
+            self._lines.extend(pending)
+
+    def _drop(self, count):
+        first = self._first + count
+        if self._needle is None:
+            removed = count
+        else:
+            removed = bisect.bisect_left(self._matches, first)
+            self._scanned = max(self._scanned, first)
+        if removed:
+            self.beginRemoveRows(QModelIndex(), 0, removed - 1)
+        del self._lines[:count]
+        if self._needle is not None:
+            del self._matches[:removed]
+        self._first = first
+        if removed:
+            self.endRemoveRows()
+        self.dropped += count
+
+    def _scan(self, end):
+        needle, first = self._needle, self._first
+        matches = [
+            number for number in range(self._scanned, end) if needle in self._lines[number - first].lower()
+        ]
+        self._scanned = end
+        if matches:
+            self.beginInsertRows(QModelIndex(), len(self._matches), len(self._matches) + len(matches) - 1)
+            self._matches.extend(matches)
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._lines) if self._needle is None else len(self._matches)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row = index.row() if self._needle is None else self._matches[index.row()] - self._first
+        return _cell(self._lines[row])
+
+
+class LogViewer(QWidget):
+    """
+    Activity log with a filter box. The view follows new lines while it is
+    scrolled to the bottom.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        max_rows, _ = viewer_settings()
+        self.model = LogModel(max_rows, self)
+
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter log lines")
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DELAY_MS)
+        self._filter_timer.timeout.connect(lambda: self.model.set_filter(self.filter_edit.text()))
+        self.filter_edit.textChanged.connect(self._filter_timer.start)
+
+        self.view = QListView()
+        self.view.setModel(self.model)
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self._follow = True
+        self.model.rowsAboutToBeInserted.connect(self._remember_follow)
+        self.model.rowsInserted.connect(self._scroll_if_following)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.filter_edit)
+        layout.addWidget(self.view)
+        self.setLayout(layout)
+
+    def append(self, message):
+        self.model.append(message)
+
+    def _remember_follow(self):
+        scroll_bar = self.view.verticalScrollBar()
+        self._follow = scroll_bar.value() >= scroll_bar.maximum()
+
+    def _scroll_if_following(self):
+        if self._follow:
+            self.view.scrollToBottom()
+
+
+class FindingsModel(QAbstractTableModel):
+    """
+    Findings of one store, fetched a page at a time on a worker thread.
+    status_changed(shown, total) reports progress; total is None until counted.
+    """
+
+    status_changed = pyqtSignal(int, object)
+    analyzers_loaded = pyqtSignal(list)
+    _page_loaded = pyqtSignal(int, int, list)
+    _count_loaded = pyqtSignal(int, int)
+
+    def __init__(self, max_rows=MAX_FINDING_ROWS, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.max_rows = max_rows
+        self.page_size = page_size
+        self.path = None
+        self.filters = (None, None, None)
+        self.total = None
+        self._rows = []
+        self._generation = 0
+        self._loading = False
+        self._exhausted = True
+        # One worker thread owns the store's connection; queries queue up behind each other.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="findings")
+        self._store = None
+        self._store_path = None
+        self._page_loaded.connect(self._add_page)
+        self._count_loaded.connect(self._set_total)
+
+    def set_store(self, path):
+        self.path = path
+        self.filters = (None, None, None)
+        self._executor.submit(self._load_analyzers, path)
+        self._reload()
+
+    def set_filters(self, analyzer=None, kind=None, text=None):
+        filters = (analyzer or None, kind or None, text or None)
+        if filters != self.filters:
+            self.filters = filters
+            self._reload()
+
+    def _reload(self):
+        self._generation += 1
+        if self._store is not None:
+            # Stop a slow query for the old filters; the worker drops its result.
+            self._store.interrupt()
+        self.beginResetModel()
+        self._rows = []
+        self.total = None
+        self._loading = False
+        self._exhausted = self.path is None
+        self.endResetModel()
+        self.status_changed.emit(0, None)
+        if self.path is not None:
+            self._fetch()
+            self._executor.submit(self._count, self._generation, self.path, self.filters)
+
+    def _fetch(self):
+        self._loading = True
+        limit = min(self.page_size, self.max_rows - len(self._rows))
+        self._executor.submit(self._query, self._generation, self.path, self.filters, len(self._rows), limit)
+
+    def _open(self, path):
+        # Runs on the worker thread.
+        if self._store_path != path:
+            if self._store is not None:
+                self._store.close()
+            self._store, self._store_path = None, None
+            self._store = report_store.open_store(path)
+            self._store.index_offsets()
+            self._store_path = path
+        return self._store
+
+    def _call(self, current, path, method, *args, **kwargs):
+        """
+        Run a store method on the worker thread while current() holds.
+        Returns None if the request went stale or failed.
+        """
+        while current():
+            try:
+                return getattr(self._open(path), method)(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                # An interrupt meant for the previous query can land on this one; run it again.
+                if "interrupted" not in str(e):
+                    return None
+            except (OSError, sqlite3.Error):
+                return None
+        return None
+
+    def _load_analyzers(self, path):
+        analyzers = self._call(lambda: path == self.path, path, "analyzers")
+        if analyzers is not None:
+            self.analyzers_loaded.emit(analyzers)
+
+    def _query(self, generation, path, filters, offset, limit):
+        rows = self._call(lambda: generation == self._generation, path, "rows", *filters, offset=offset, limit=limit)
+        if generation == self._generation:
+            self._page_loaded.emit(generation, offset, rows or [])
+
+    def _count(self, generation, path, filters):
+        total = self._call(lambda: generation == self._generation, path, "count", *filters)
+        if total is not None:
+            self._count_loaded.emit(generation, total)
+
+    def _add_page(self, generation, offset, rows):
+        if generation != self._generation or offset != len(self._rows):
+            return
+        self._loading = False
+        if len(rows) < self.page_size or len(self._rows) + len(rows) >= self.max_rows:
+            self._exhausted = True
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        self.status_changed.emit(len(self._rows), self.total)
+
+    def _set_total(self, generation, total):
+        if generation == self._generation:
+            self.total = total
+            self.status_changed.emit(len(self._rows), total)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._loading and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._fetch()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(FINDING_HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        analyzer, kind, value, count, first_offset, last_offset = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.ToolTipRole:
+            return _cell(value) if column == 3 else None
+        if column == 0:
+            return f"{first_offset:#x}"
+        if column == 5:
+            return f"{last_offset:#x}"
+        return (None, analyzer, kind, _cell(value), count)[column]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return FINDING_HEADERS[section]
+        return None
+
+    def close(self):
+        self._generation += 1
+        if self._store is not None:
+            self._store.interrupt()
+        self._executor.submit(self._close_store)
+        self._executor.shutdown(wait=True)
+
+    def _close_store(self):
+        if self._store is not None:
+            self._store.close()
+            self._store, self._store_path = None, None
+
+
+class ResultsViewer(QWidget):
+    """
+    Findings table with analyzer, kind and text filters.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        _, max_rows = viewer_settings()
+        self.model = FindingsModel(max_rows, parent=self)
+
+        self.analyzer_box = QComboBox()
+        self.analyzer_box.addItem("All analyzers", None)
+        self.kind_edit = QLineEdit()
+        self.kind_edit.setPlaceholderText("Kind")
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search values")
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DELAY_MS)
+        self._filter_timer.timeout.connect(self.apply_filters)
+        self.analyzer_box.currentIndexChanged.connect(self.apply_filters)
+        self.kind_edit.textChanged.connect(self._filter_timer.start)
+        self.search_edit.textChanged.connect(self._filter_timer.start)
+
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setWordWrap(False)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # Fixed row heights and column widths: sizing to contents would visit every row.
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 6)
+        self.view.verticalHeader().hide()
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.view.horizontalHeader().setStretchLastSection(True)
+        self.status_label = QLabel("No findings loaded.")
+
+        self.model.status_changed.connect(self._show_status)
+        self.model.analyzers_loaded.connect(self._set_analyzers)
+
+        filters = QHBoxLayout()
+        filters.addWidget(self.analyzer_box)
+        filters.addWidget(self.kind_edit)
+        filters.addWidget(self.search_edit)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(filters)
+        layout.addWidget(self.view)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+    def load_store(self, path):
+        self._filter_timer.stop()
+        for widget in (self.analyzer_box, self.kind_edit, self.search_edit):
+            widget.blockSignals(True)
+        self.analyzer_box.setCurrentIndex(0)
+        self.kind_edit.clear()
+        self.search_edit.clear()
+        for widget in (self.analyzer_box, self.kind_edit, self.search_edit):
+            widget.blockSignals(False)
+        self.model.set_store(path)
+
+    def apply_filters(self):
+        self._filter_timer.stop()
+        self.model.set_filters(
+            self.analyzer_box.currentData(), self.kind_edit.text().strip(), self.search_edit.text(),
+        )
+
+    def _set_analyzers(self, analyzers):
+        self.analyzer_box.blockSignals(True)
+        selected = self.analyzer_box.currentData()
+        self.analyzer_box.clear()
+        self.analyzer_box.addItem("All analyzers", None)
+        for analyzer in analyzers:
+            self.analyzer_box.addItem(analyzer, analyzer)
+        self.analyzer_box.setCurrentIndex(max(0, self.analyzer_box.findData(selected)))
+        self.analyzer_box.blockSignals(False)
+
+    def _show_status(self, shown, total):
+        if total is None:
+            text = f"Showing {shown} findings, counting..."
+        else:
+            text = f"Showing {shown} of {total} findings"
+            if shown < total and shown >= self.model.max_rows:
+                text += f" (first {self.model.max_rows}; narrow the filters to see the rest)"
+        self.status_label.setText(text)
+
+    def close_store(self):
+        self.model.close()